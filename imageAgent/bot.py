@@ -24,7 +24,13 @@ if not os.environ.get('GEMINI_API_KEY'):
 
 # !! PASTE YOUR NGROK URL HERE !!
 # This URL should match the one in your urls.py (e.g., /api/product/receive/)
-DJANGO_BACKEND_URL = "https://multiview-transomed-ines.ngrok-free.dev/api/product/receive/"
+DJANGO_BACKEND_URL = os.environ.get(
+    'DJANGO_BACKEND_URL', "https://multiview-transomed-ines.ngrok-free.dev/api/product/receive/"
+)
+# The site this bot scans for (a warehouse code); its scans go to that site's review queue.
+DJANGO_WAREHOUSE = os.environ.get('DJANGO_WAREHOUSE')
+# Optional: point Gemini at `manage.py run_llm_stubs` (e.g. http://127.0.0.1:11436) for load testing.
+GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE')
 
 # Enable logging
 logging.basicConfig(
@@ -78,7 +84,10 @@ async def process_image_with_langchain(image_bytes: bytes) -> ProductAction:
         return None  # Or raise an error
 
     
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=api_key)
+    llm_kwargs = {}
+    if GEMINI_API_BASE:
+        llm_kwargs = {"client_options": {"api_endpoint": GEMINI_API_BASE}, "transport": "rest"}
+    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=api_key, **llm_kwargs)
     
     # 2. Bind the Pydantic schema to the model
     # This forces the model to output JSON matching your ProductAction class
@@ -122,7 +131,8 @@ async def send_to_django(data: dict):
     """Sends the JSON data to the Django backend."""
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.post(DJANGO_BACKEND_URL, json=data, timeout=10.0)
+            headers = {'X-Warehouse': DJANGO_WAREHOUSE} if DJANGO_WAREHOUSE else None
+            response = await client.post(DJANGO_BACKEND_URL, json=data, headers=headers, timeout=10.0)
             
             # --- FIX: Check for any 2xx success code (200, 201, 202, etc.) ---
             if 200 <= response.status_code < 300:
@@ -0,0 +1,481 @@
+# inventory_api/bulk_io.py
+"""
+Bulk import and export of stock lots as CSV or NDJSON, streamed so that
+memory stays bounded by the chunk size, not the file size.
+
+Import reads the file line by line (optionally zstd- or gzip-compressed),
+validates CHUNK_ROWS rows at a time with vectorized checks, and files each
+chunk's valid rows in one transaction: SKUs looked up and created in bulk,
+rows for an existing lot (same SKU and expiry date) applied to it with
+apply_movements()' guarded increment, new lots inserted in bulk, and the
+ledger entries for both appended in one insert. A row is received stock,
+as from POST /api/products/ ("add"), or a stock count that sets the lot's
+quantity ("set"). Invalid rows do not stop the import; they come back in
+the report with their line numbers. An import goes into one warehouse (the
+current one unless given): names are matched against that site's SKUs only.
+
+Export walks the lots with .iterator() (a server-side cursor on
+PostgreSQL) and encodes them CHUNK_ROWS at a time. Price and expiry date
+are cast in SQL, which skips Django's per-row Decimal and date parsing.
+An exported file imports back; import ignores the columns it does not read.
+"""
+import codecs
+import csv
+import gzip
+import io
+from collections import Counter, defaultdict, namedtuple
+from decimal import Decimal
+from functools import partial
+from itertools import islice
+
+import numpy as np
+import orjson
+import pandas as pd
+import zstandard
+from django.conf import settings
+from django.db import DatabaseError, connection, reset_queries, transaction
+from django.db.models import FloatField, TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from .models import Product, Sku, StockMovement
+from .rollups import record_flows, touch, tracking
+from .stock import InsufficientStock, refresh_sku_totals
+from .streaming import NDJSON_CONTENT_TYPE
+from .warehouses import current_warehouse_id
+
+FORMATS = ("csv", "ndjson")
+MODES = ("add", "set")
+COMPRESSIONS = ("zstd", "gzip")
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": NDJSON_CONTENT_TYPE}
+IMPORT_FIELDS = ("product_name", "price", "quantity", "expiry_date")
+# pandas.api.types.infer_dtype() kinds of a column holding only text and numbers.
+SCALAR_KINDS = ("string", "empty", "integer", "floating", "mixed-integer-float")
+EXPORT_FIELDS = ("id", "sku_id", "product_name", "price", "quantity", "expiry_date", "discount_percent", "version")
+READ_BLOCK = 1 << 16
+# A StockMovement row as inserted; record_flows() reads kind and quantity.
+LedgerRow = namedtuple("LedgerRow", "sku_id lot_id product_name kind quantity source note created_at")
+# Largest price a Product/Sku price field holds (max_digits=10, decimal_places=2).
+MAX_PRICE = 10 ** 8
+MAX_QUANTITY = 2 ** 31 - 1
+# Raised while reading a corrupt gzip or zstd file.
+READ_ERRORS = (OSError, EOFError, zstandard.ZstdError)
+# Bytes that are not UTF-8, kept through decoding by surrogateescape.
+UNDECODABLE = "[\udc80-\udcff]"
+
+
+def _config():
+    config = dict(getattr(settings, "BULK_IO", {}))
+    config.setdefault("CHUNK_ROWS", 2000)
+    config.setdefault("MAX_REPORTED_ERRORS", 1000)
+    config.setdefault("ZSTD_LEVEL", 3)
+    return config
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Lets DRF content negotiation accept `Accept: text/csv` (and ?format=csv).
+    The export streams past renderers; this only renders errors.
+    """
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data.items() if isinstance(data, dict) else [("data", data)]
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+
+# --- Import ---
+
+def decompressed(stream, compression=None):
+    """Wraps a binary stream that is zstd- or gzip-compressed (None: as is)."""
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if compression is not None:
+        raise ValueError(f"Unsupported compression '{compression}'; expected one of {', '.join(COMPRESSIONS)}.")
+    return stream
+
+
+def _text_lines(stream):
+    """
+    UTF-8 lines (with their line ends) from a binary stream, read a block at
+    a time. Invalid bytes are kept as surrogates, so only their row is rejected.
+    """
+    pending = ""
+    for text in codecs.iterdecode(iter(partial(stream.read, READ_BLOCK), b""), "utf-8-sig", "surrogateescape"):
+        *lines, pending = (pending + text).split("\n")
+        for line in lines:
+            yield line + "\n"
+    if pending:
+        yield pending
+
+
+def read_csv(stream):
+    """(line, record, problem) per data row of a CSV file with a header row."""
+    reader = csv.DictReader(_text_lines(stream))
+    try:
+        for record in reader:
+            problem = "Too many fields." if None in record else None
+            yield reader.line_num, record, problem
+    except csv.Error as e:
+        yield reader.line_num, None, f"Malformed CSV: {e}"
+
+
+def read_ndjson(stream):
+    """
+    (line, record, problem) per non-blank line of an NDJSON file (one JSON
+    object per line).
+    """
+    for number, line in enumerate(_text_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Expected a JSON object."
+            continue
+        yield number, record, None
+
+
+def _validate(records):
+    """
+    Checks a chunk of records column by column. Returns a DataFrame of the
+    valid rows (line, name, key, price, quantity, expiry) and
+    {line: {field: message}} for the rest.
+    """
+    lines = np.array([line for line, _ in records])
+    frame = pd.DataFrame.from_records([record for _, record in records], columns=list(IMPORT_FIELDS))
+    problems = defaultdict(dict)
+
+    def flag(mask, field, message):
+        for line in lines[np.asarray(mask, dtype=bool)]:
+            problems[int(line)].setdefault(field, message)
+
+    def blank(column):
+        return column.isna() | (column.astype(str).str.strip() == "")
+
+    # CSV fields are always text, but NDJSON can carry any JSON value. Like the API's serializer
+    # fields, take text (and numbers for price and quantity) and reject objects, lists and booleans.
+    def not_a(column, numbers=False):
+        if pd.api.types.infer_dtype(column, skipna=True) in (SCALAR_KINDS if numbers else ("string", "empty")):
+            return np.zeros(len(column), dtype=bool)
+        types = (str, int, float) if numbers else str
+        return column.map(lambda value: not isinstance(value, types) or isinstance(value, bool)) & column.notna()
+
+    flag(not_a(frame["product_name"]), "product_name", "Not a valid string.")
+    flag(not_a(frame["price"], numbers=True), "price", "A valid number is required.")
+    flag(not_a(frame["quantity"], numbers=True), "quantity", "A valid integer is required.")
+    flag(not_a(frame["expiry_date"]), "expiry_date",
+         "Date has wrong format. Use one of these formats instead: YYYY-MM-DD.")
+
+    names = frame["product_name"].where(~blank(frame["product_name"]), "").astype(str).str.split().str.join(" ")
+    flag(names == "", "product_name", "This field is required.")
+    flag(names.str.contains(UNDECODABLE), "product_name", "Not valid UTF-8 text.")
+    flag(names.str.len() > 255, "product_name", "Ensure this field has no more than 255 characters.")
+
+    # A missing price keeps the SKU's price (required for a new SKU, checked when saving).
+    no_price = blank(frame["price"])
+    price = pd.to_numeric(frame["price"].where(~no_price), errors="coerce")
+    flag(~no_price & ~((price >= 0) & (price < MAX_PRICE)), "price", "A valid price is required.")
+
+    # Like the model field, quantity defaults to 1.
+    quantity = pd.to_numeric(frame["quantity"].where(~blank(frame["quantity"]), 1), errors="coerce")
+    flag(~((quantity >= 0) & (quantity <= MAX_QUANTITY) & (quantity % 1 == 0)), "quantity",
+         "A valid non-negative integer is required.")
+
+    expiry = pd.to_datetime(frame["expiry_date"].astype(str).str.strip(), format="%Y-%m-%d", errors="coerce")
+    flag(expiry.isna(), "expiry_date", "Date has wrong format. Use one of these formats instead: YYYY-MM-DD.")
+
+    valid = ~np.isin(lines, list(problems))
+    rows = pd.DataFrame({
+        "line": lines[valid],
+        "name": names[valid].to_numpy(),
+        "key": names[valid].str.casefold().to_numpy(),
+        "price": price[valid].round(2).to_numpy(),
+        "quantity": quantity[valid].fillna(0).to_numpy(np.int64),
+        "expiry": expiry[valid].dt.date.to_numpy(),
+    })
+    return rows, problems
+
+
+def _money(value):
+    return Decimal(f"{value:.2f}")
+
+
+def _insert(model, columns, rows):
+    """
+    Inserts `rows` (tuples in `columns` order) with multi-row INSERT ...
+    RETURNING statements and returns the new ids in order. Plain SQL:
+    bulk_create() spends most of a large import building and preparing
+    model instances, not writing them.
+    """
+    table = model._meta.db_table
+    size = (connection.features.max_query_params or 65535) // len(columns)
+    placeholder = f"({', '.join(['%s'] * len(columns))})"
+    ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), size):
+            batch = rows[start:start + size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([placeholder] * len(batch))} RETURNING id",
+                [value for row in batch for value in row],
+            )
+            ids.extend(row[0] for row in cursor.fetchall())
+    return ids
+
+
+def _existing_lots(keys):
+    """
+    {(sku_id, ISO expiry date): (id, product_name, quantity)} for the lots
+    matching these (sku_id, expiry_date) pairs. A join against the pairs
+    uses product_sku_fefo_idx; filtering on both columns with IN would read
+    every lot of the chunk's SKUs. The oldest lot for a date wins, as in
+    receive_lot().
+    """
+    table = Product._meta.db_table
+    size = (connection.features.max_query_params or 65535) // 2
+    lots = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(keys), size):
+            batch = keys[start:start + size]
+            cursor.execute(
+                f"WITH wanted (sku_id, expiry_date) AS (VALUES {', '.join(['(%s, %s)'] * len(batch))})"
+                f" SELECT lot.sku_id, CAST(lot.expiry_date AS TEXT), lot.id, lot.product_name, lot.quantity"
+                f" FROM wanted JOIN {table} lot ON lot.sku_id = wanted.sku_id AND lot.expiry_date = wanted.expiry_date"
+                f" ORDER BY lot.id DESC",
+                [value for key in batch for value in key],
+            )
+            lots.update({(sku_id, expiry): lot for sku_id, expiry, *lot in cursor.fetchall()})
+    return lots
+
+
+def _upsert(rows, mode, source, warehouse_id):
+    """
+    Files one chunk of valid rows in one transaction into the warehouse
+    `warehouse_id` (see the module docstring). Returns (counts,
+    {line: {field: message}}) for rows that only fail here (a new SKU
+    without a price).
+    """
+    counts = Counter()
+    problems = {}
+    with transaction.atomic(), tracking():
+        # name_key: [id, name, price]
+        skus = {key: [pk, name, price] for key, pk, name, price in
+                Sku.objects.filter(warehouse_id=warehouse_id, name_key__in=rows["key"].unique().tolist())
+                .values_list("name_key", "id", "name", "price")}
+        touch([sku[0] for sku in skus.values()])
+
+        # A new SKU takes the name and price of its first row.
+        first = rows.drop_duplicates("key")
+        new = first[~first["key"].isin(list(skus))]
+        unpriced = new["key"][new["price"].isna()]
+        if len(unpriced):
+            for line in rows["line"][rows["key"].isin(unpriced)]:
+                problems[int(line)] = {"price": "A price is required for a new product."}
+            rows = rows[~rows["key"].isin(unpriced)]
+            new = new[new["price"].notna()]
+        created = [(name, key, _money(price), 0, 0, warehouse_id)
+                   for name, key, price in zip(new["name"], new["key"], new["price"])]
+        sku_ids = _insert(Sku, ("name", "name_key", "price", "total_quantity", "lot_count", "warehouse_id"), created)
+        for (name, key, price, *_), pk in zip(created, sku_ids):
+            skus[key] = [pk, name, price]
+        touch([skus[key][0] for _, key, *_ in created])
+        counts["created_skus"] += len(created)
+
+        # A row with another price reprices its SKU, as saving a lot does; the last row wins.
+        repriced = defaultdict(list)
+        priced = rows[rows["price"].notna()].drop_duplicates("key", keep="last")
+        for key, price in zip(priced["key"], priced["price"]):
+            sku, price = skus[key], _money(price)
+            if sku[2] != price:
+                sku[2] = price
+                repriced[price].append(sku[0])
+        for price, sku_ids in repriced.items():
+            Sku.objects.filter(pk__in=sku_ids).update(price=price)
+            Product.objects.filter(sku_id__in=sku_ids).update(price=price)
+
+        rows = rows.assign(sku_id=[skus[key][0] for key in rows["key"]])
+        if mode == "add":
+            lots = rows.groupby(["sku_id", "expiry"], as_index=False, sort=False)["quantity"].sum()
+        else:
+            lots = rows.drop_duplicates(["sku_id", "expiry"], keep="last")[["sku_id", "expiry", "quantity"]]
+        existing = _existing_lots(list(zip(lots["sku_id"].tolist(), lots["expiry"])))
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        updates, entries, new_lots, emptied = [], [], [], []
+        sku_by_id = {sku[0]: sku for sku in skus.values()}
+        for sku_id, expiry, quantity in zip(lots["sku_id"].tolist(), lots["expiry"], lots["quantity"].tolist()):
+            lot = existing.get((sku_id, expiry.isoformat()))
+            if lot is None:
+                if quantity:
+                    _, name, price = sku_by_id[sku_id]
+                    new_lots.append((sku_id, name, price, quantity, expiry, 0, 0, warehouse_id))
+                continue
+            pk, name, current = lot
+            if mode == "add":
+                delta, kind = quantity, StockMovement.Kind.RECEIPT
+            else:
+                delta, kind = quantity - current, StockMovement.Kind.ADJUSTMENT
+                if not quantity:
+                    emptied.append(pk)
+            if delta:
+                updates.append((delta, pk, delta))
+                entries.append(LedgerRow(sku_id, pk, name, kind, delta, source, "import", now))
+
+        if updates:
+            # apply_movements() in one statement per chunk: the same guarded increment, run with executemany.
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {Product._meta.db_table} SET quantity = quantity + %s, version = version + 1"
+                    f" WHERE id = %s AND quantity + %s >= 0",
+                    updates,
+                )
+                if cursor.rowcount != len(updates):
+                    raise InsufficientStock("Lots in this chunk changed or were removed during the import.")
+            counts["updated_lots"] += len(updates)
+        if new_lots:
+            lot_ids = _insert(Product, ("sku_id", "product_name", "price", "quantity", "expiry_date", "version",
+                                        "discount_percent", "warehouse_id"), new_lots)
+            entries += [LedgerRow(sku_id, lot_id, name, StockMovement.Kind.RECEIPT, quantity, source, "import", now)
+                        for (sku_id, name, _, quantity, *_), lot_id in zip(new_lots, lot_ids)]
+            counts["created_lots"] += len(new_lots)
+        if entries:
+            _insert(StockMovement, LedgerRow._fields, entries)
+            record_flows(entries)
+            refresh_sku_totals({entry.sku_id for entry in entries})
+        if emptied:
+            # As a stock count that empties a lot through adjust_sku() would.
+            Product.objects.filter(pk__in=emptied, quantity=0).delete()
+        counts["imported"] += len(rows)
+    return counts, problems
+
+
+def import_records(records, mode="add", source="import", warehouse=None):
+    """
+    Imports (line, record, problem) triples from read_csv()/read_ndjson()
+    chunk by chunk into `warehouse` (default: the current one). Returns the
+    report: row counts, what was created or updated, and the first
+    MAX_REPORTED_ERRORS invalid rows.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}'; expected one of {', '.join(MODES)}.")
+    config = _config()
+    warehouse_id = warehouse.pk if warehouse is not None else current_warehouse_id()
+    counts = Counter()
+    errors = []
+
+    def report(problems):
+        counts["failed"] += len(problems)
+        for line in sorted(problems):
+            if len(errors) < config["MAX_REPORTED_ERRORS"]:
+                errors.append({"line": line, "errors": problems[line]})
+
+    records = iter(records)
+    while chunk := list(islice(records, config["CHUNK_ROWS"])):
+        counts["rows"] += len(chunk)
+        problems = {line: {"row": problem} for line, _, problem in chunk if problem}
+        rows, invalid = _validate([(line, record) for line, record, problem in chunk if not problem])
+        problems.update(invalid)
+        if not rows.empty:
+            try:
+                saved, unsaved = _upsert(rows, mode, source, warehouse_id)
+                counts.update(saved)
+                problems.update(unsaved)
+            except (DatabaseError, InsufficientStock) as e:
+                # The chunk's transaction was rolled back; none of its rows were saved.
+                problems.update({int(line): {"row": f"Not saved: {e}"} for line in rows["line"]})
+        report(problems)
+        # With DEBUG on, the query log would otherwise keep thousands of chunk-sized INSERTs.
+        reset_queries()
+
+    return {
+        "rows": counts["rows"],
+        "imported": counts["imported"],
+        "failed": counts["failed"],
+        "created_skus": counts["created_skus"],
+        "created_lots": counts["created_lots"],
+        "updated_lots": counts["updated_lots"],
+        "errors": errors,
+        "errors_truncated": counts["failed"] > len(errors),
+    }
+
+
+def import_stream(stream, file_format="csv", mode="add", compression=None, source="import", warehouse=None):
+    """Imports a CSV or NDJSON binary stream (see import_records())."""
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format '{file_format}'; expected one of {', '.join(FORMATS)}.")
+    reader = read_csv if file_format == "csv" else read_ndjson
+    return import_records(reader(decompressed(stream, compression)), mode, source, warehouse)
+
+
+# --- Export ---
+
+def _lot_rows(queryset=None):
+    """Lots in EXPORT_FIELDS order (price as a float, expiry as ISO text), by id."""
+    lots = (queryset if queryset is not None else Product.objects.all()).order_by("id").annotate(
+        price_value=Cast("price", FloatField()), expiry_text=Cast("expiry_date", TextField()))
+    return lots.values_list("id", "sku_id", "product_name", "price_value", "quantity", "expiry_text",
+                            "discount_percent", "version").iterator(chunk_size=_config()["CHUNK_ROWS"])
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _encode_csv(rows, size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for chunk in _chunks(rows, size):
+        writer.writerows((pk, sku_id, name, f"{price:.2f}", quantity, expiry, discount, version)
+                         for pk, sku_id, name, price, quantity, expiry, discount, version in chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _encode_ndjson(rows, size):
+    for chunk in _chunks(rows, size):
+        yield b"".join(
+            orjson.dumps(dict(zip(EXPORT_FIELDS, (pk, sku_id, name, f"{price:.2f}", quantity, expiry, discount,
+                                                  version)))) + b"\n"
+            for pk, sku_id, name, price, quantity, expiry, discount, version in chunk
+        )
+
+
+def _zstd(chunks, level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(file_format="csv", compression=None, queryset=None):
+    """
+    The lots (all of them, or `queryset`) as a stream of encoded byte
+    chunks, zstd-compressed when compression="zstd". Prices are strings
+    with two decimals, as the API returns them.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format '{file_format}'; expected one of {', '.join(FORMATS)}.")
+    if compression not in (None, "zstd"):
+        raise ValueError(f"Unsupported compression '{compression}' for export; use zstd.")
+    config = _config()
+    encode = _encode_csv if file_format == "csv" else _encode_ndjson
+    chunks = encode(_lot_rows(queryset), config["CHUNK_ROWS"])
+    return _zstd(chunks, config["ZSTD_LEVEL"]) if compression == "zstd" else chunks
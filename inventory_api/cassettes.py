@@ -0,0 +1,206 @@
+# inventory_api/cassettes.py
+"""
+Record and replay of model calls ("cassettes"), so a suite of queries runs
+again, with the same answers, without a model server: evaluate_model in CI,
+a demo without a GPU.
+
+A cassette is a JSONL file. Its first line holds metadata ({"cassette": 1,
+"model": ..., "date": ...}); every other line is one model call: its key
+(sha256 over the model, system prefix and prompt, as in coalesce.py), the
+output text and the call's time and token counts. In "record" mode every
+call goes to the model and is written to a new cassette. In "replay" mode
+calls are answered from the file; a call that was never recorded raises
+CassetteMiss instead of reaching the network. Replayed calls report their
+recorded time and token counts, so latency and tokens-per-second figures
+carry over.
+
+mcp.py sends every generation through generate() / stream() here. Without
+a cassette they only time the call and collect its stats (collect_calls()).
+A cassette is switched on for a block with use_cassette(), or for the whole
+process with settings.LLM_CASSETTE (MODE and PATH).
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .coalesce import coalesce_key
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+MODES = (RECORD, REPLAY)
+FORMAT_VERSION = 1
+# Replayed streams are cut into pieces this long, so streaming clients still see progress.
+REPLAY_PIECE_CHARS = 16
+
+
+class CassetteMiss(Exception):
+    """A replayed call that the cassette has no recording for."""
+
+
+class Cassette:
+    """One cassette file, opened for recording or replay."""
+
+    def __init__(self, path, mode=REPLAY, meta=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}'; expected one of {', '.join(MODES)}.")
+        self.path = path
+        self.mode = mode
+        self.meta = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+        if mode == REPLAY:
+            self._load()
+        else:
+            # A recording starts a new file; the header goes first.
+            self.meta = {"cassette": FORMAT_VERSION, **(meta or {})}
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(self.meta) + "\n")
+
+    def __repr__(self):
+        return f"<Cassette {self.mode} {self.path} ({len(self._calls)} calls)>"
+
+    def __len__(self):
+        return len(self._calls)
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "cassette" in entry:
+                    self.meta = entry
+                elif "key" in entry:
+                    self._calls[entry["key"]] = entry
+                else:
+                    raise ValueError(f"{self.path}, line {line_no}: not a cassette entry.")
+
+    def lookup(self, key):
+        try:
+            return self._calls[key]
+        except KeyError:
+            raise CassetteMiss(
+                f"No recorded model call matches this prompt in {self.path}. "
+                "Record the cassette again if the prompt, inventory or model changed."
+            ) from None
+
+    def record(self, key, text, stats):
+        entry = {"key": key, "text": text, "stats": stats}
+        with self._lock:
+            self._calls[key] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+_active = None
+_settings_cassette = None
+_settings_lock = threading.Lock()
+_collected = contextvars.ContextVar("llm_call_stats", default=None)
+
+
+def active_cassette():
+    """The cassette of the innermost use_cassette() block, else settings.LLM_CASSETTE's, else None."""
+    global _settings_cassette
+    if _active is not None:
+        return _active
+    config = getattr(settings, "LLM_CASSETTE", {})
+    if config.get("MODE", "off") not in MODES or not config.get("PATH"):
+        return None
+    if _settings_cassette is None:
+        with _settings_lock:
+            if _settings_cassette is None:
+                _settings_cassette = Cassette(config["PATH"], config["MODE"])
+    return _settings_cassette
+
+
+@contextmanager
+def use_cassette(cassette):
+    """
+    Sends every model call of the process through `cassette` for the block
+    (threads included: job workers and coalesced calls run elsewhere).
+    """
+    global _active
+    previous, _active = _active, cassette
+    try:
+        yield cassette
+    finally:
+        _active = previous
+
+
+@contextmanager
+def collect_calls():
+    """Yields a list that receives the stats of every model call made in the block."""
+    calls = []
+    token = _collected.set(calls)
+    try:
+        yield calls
+    finally:
+        _collected.reset(token)
+
+
+def _collect(stats):
+    calls = _collected.get()
+    if calls is not None:
+        calls.append(stats)
+
+
+def generate(model, system, prompt, call):
+    """
+    The model output for (model, system, prompt): from the cassette when
+    replaying, otherwise from call(stats), a backend generate() that fills
+    in `stats`; recorded when recording.
+    """
+    cassette = active_cassette()
+    key = coalesce_key(model, system, prompt)
+    if cassette is not None and cassette.mode == REPLAY:
+        entry = cassette.lookup(key)
+        _collect({**entry["stats"], "replayed": True})
+        return entry["text"]
+
+    stats = {}
+    started = time.perf_counter()
+    text = call(stats)
+    stats["seconds"] = time.perf_counter() - started
+    stats["output_bytes"] = len(text.encode("utf-8"))
+    if cassette is not None:
+        cassette.record(key, text, stats)
+    _collect(stats)
+    return text
+
+
+def stream(model, system, prompt, open_stream):
+    """
+    Streaming form of generate(): yields the output in pieces.
+    open_stream(stats) returns the backend's piece iterator.
+    """
+    cassette = active_cassette()
+    key = coalesce_key(model, system, prompt)
+    if cassette is not None and cassette.mode == REPLAY:
+        entry = cassette.lookup(key)
+        _collect({**entry["stats"], "replayed": True})
+        text = entry["text"]
+        for start in range(0, len(text), REPLAY_PIECE_CHARS):
+            yield text[start:start + REPLAY_PIECE_CHARS]
+        return
+
+    stats = {}
+    pieces = []
+    started = time.perf_counter()
+    for piece in open_stream(stats):
+        pieces.append(piece)
+        yield piece
+    text = "".join(pieces)
+    stats["seconds"] = time.perf_counter() - started
+    stats["output_bytes"] = len(text.encode("utf-8"))
+    if cassette is not None:
+        cassette.record(key, text, stats)
+    _collect(stats)
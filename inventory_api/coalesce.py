@@ -0,0 +1,179 @@
+# inventory_api/coalesce.py
+"""
+Singleflight for LLM calls: concurrent identical prompts share one model call.
+
+Within a process, duplicates wait for the first caller (the leader) and get a
+copy of its result. Across worker processes the leader also holds an fcntl
+lock on <DIR>/<key>.lock while the model runs and leaves the result in
+<key>.json; a worker that finds the lock taken waits for it and uses that
+result instead of calling the model. Only results written while a worker was
+waiting are used, so this suppresses duplicates without becoming a cache.
+
+Configure with settings.LLM_COALESCE. The file lock needs fcntl (POSIX); on
+other platforms only duplicates within one process are coalesced.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+
+from .metrics import LLM_COALESCED_REQUESTS
+from .resilience import DeadlineExceeded, remaining
+
+logger = logging.getLogger(__name__)
+
+LOCK_POLL_SECONDS = 0.02
+PRUNE_INTERVAL = 300
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def coalesce_key(*parts) -> str:
+    """sha256 over the parts that determine the model output."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def singleflight(key: str, fn):
+    """
+    Returns fn(), or the result of an identical call already in flight.
+    fn must return a JSON-serialisable value. Exceptions raised by the
+    leader's call are re-raised in the callers that waited on it.
+    """
+    config = getattr(settings, "LLM_COALESCE", {})
+    if not config.get("ENABLED", True):
+        return fn()
+
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        LLM_COALESCED_REQUESTS.labels(scope="process").inc()
+        if not call.done.wait(remaining()):
+            raise DeadlineExceeded("The request deadline passed while waiting for an identical model call.")
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    try:
+        result = _across_workers(key, fn, config)
+        # Callers may modify the dict they get back; followers get their own copy.
+        call.result = copy.deepcopy(result)
+        return result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+def _across_workers(key, fn, config):
+    directory = config.get("DIR")
+    if fcntl is None or not directory:
+        return fn()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        lock_file = open(os.path.join(directory, f"{key}.lock"), "a+")
+    except OSError as e:
+        logger.warning("Cross-worker LLM coalescing disabled: %s", e)
+        return fn()
+
+    result_path = os.path.join(directory, f"{key}.json")
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another worker is running this prompt; wait for it and share its answer.
+            waiting_since = time.time()
+            if not _wait_for_lock(lock_file, remaining(config.get("WAIT_TIMEOUT", 180))):
+                remaining()  # raises DeadlineExceeded if that is why the wait ended
+                return fn()
+            shared = _read_result(result_path, waiting_since)
+            if shared is not None:
+                LLM_COALESCED_REQUESTS.labels(scope="worker").inc()
+                return shared
+
+        try:
+            os.utime(lock_file.name)
+            result = fn()
+            _write_result(result_path, result)
+            return result
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            _maybe_prune(directory, config)
+
+
+def _wait_for_lock(lock_file, timeout) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            time.sleep(LOCK_POLL_SECONDS)
+    return False
+
+
+def _read_result(path, not_before):
+    try:
+        if os.path.getmtime(path) < not_before:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_result(path, result):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("Could not share LLM result with other workers: %s", e)
+
+
+def _maybe_prune(directory, config):
+    """Removes lock/result files that have not been used for a while."""
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    cutoff = now - max(PRUNE_INTERVAL, 2 * config.get("WAIT_TIMEOUT", 180))
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+    except OSError:
+        pass
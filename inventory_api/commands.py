@@ -0,0 +1,145 @@
+# inventory_api/commands.py
+"""
+Deterministic parser for the simple commands the dashboard sees most often.
+
+Used as the degraded path of /api/query/ while the language model is
+unavailable (circuit breaker open or request deadline spent). It returns the
+same JSON shapes the model is asked for in prompts.py, or None when the
+command is not understood; it never guesses missing quantities, prices or
+products.
+"""
+import re
+
+from dateutil import parser as date_parser
+
+CURRENCY = r"(?:₹|rs\.?|inr|\$)?\s*"
+UNIT_WORDS = r"(?:units?|pcs|pieces?|packs?|boxes?|bottles?|loaves?|kg|items?)?"
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+FIELD_ALIASES = {"price": "price", "cost": "price", "quantity": "quantity", "qty": "quantity", "stock": "quantity"}
+
+BULK_DELETE_RE = re.compile(r"^(?:please\s+)?(?:delete|remove|clear)\s+(?:all\s+)?(?:the\s+)?expired\b", re.I)
+DELETE_RE = re.compile(
+    r"^(?:please\s+)?(?:delete|remove)\s+(?:the\s+)?(?P<name>.+?)"
+    r"(?:\s+from\s+(?:the\s+)?(?:system|inventory|stock))?$", re.I)
+UPDATE_RE = re.compile(
+    r"^(?:please\s+)?(?:change|set|update|make)\s+(?:the\s+)?(?P<field>price|cost|quantity|qty|stock)\s+(?:of|for)\s+"
+    r"(?:the\s+)?(?P<name>.+?)\s+(?:to|=|as)\s+" + CURRENCY + r"(?P<value>\d+(?:\.\d+)?)\s*(?:rs|rupees)?$", re.I)
+UPDATE_ALT_RE = re.compile(
+    r"^(?:please\s+)?(?:change|set|update)\s+(?:the\s+)?(?P<name>.+?)(?:'s)?\s+(?P<field>price|cost|quantity|qty|stock)\s+"
+    r"(?:to|=|as)\s+" + CURRENCY + r"(?P<value>\d+(?:\.\d+)?)\s*(?:rs|rupees)?$", re.I)
+ADD_RE = re.compile(
+    r"^(?:please\s+)?add\s+(?:a\s+new\s+product:?\s+)?(?P<quantity>\d+)\s+" + UNIT_WORDS + r"\s*(?:of\s+)?(?P<name>.+?)\s+"
+    r"(?:(?:at|for|@|costing|price(?:d)?(?:\s+at)?)\s+)?" + CURRENCY + r"(?P<price>\d+(?:\.\d+)?)\s*(?:rs|rupees)?"
+    r"\s*(?:each|per\s+\w+)?[\s,]*(?:(?:and\s+)?expir\w*\s+(?P<expiry>.+))?$", re.I)
+RELATIVE_RE = re.compile(r"^(?:is\s+)?in\s+(\d+)\s+(day|week|month|year)s?$", re.I)
+SOLD_RE = re.compile(
+    r"^(?:we\s+(?:just\s+|have\s+)?)?sold\s+(?P<quantity>\d+)\s+" + UNIT_WORDS + r"\s*(?:of\s+)?(?:the\s+)?(?P<name>.+?)$",
+    re.I)
+HOW_MANY_RE = re.compile(r"^how\s+many\s+(?:units\s+of\s+)?(?P<name>.+?)\s+(?:are|do\s+we|is)\b", re.I)
+
+
+def _clean(text: str) -> str:
+    """Collapses whitespace and drops trailing punctuation; keeps the case for product names."""
+    return re.sub(r"\s+", " ", text.strip().rstrip(".!?"))
+
+
+def _key(text: str) -> str:
+    return _clean(text).lower()
+
+
+def _number(text: str):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def resolve_product(name: str, inventory: list):
+    """
+    The inventory row whose product_name matches `name`: exactly (ignoring
+    case), otherwise as the only row containing it or contained in it.
+    """
+    name = _key(name)
+    exact = [row for row in inventory if _key(row["product_name"]) == name]
+    if len(exact) == 1:
+        return exact[0]
+    partial = [
+        row for row in inventory
+        if name in _key(row["product_name"]) or _key(row["product_name"]) in name
+    ]
+    return partial[0] if len(partial) == 1 else None
+
+
+def _expiry(text: str):
+    """{"relative_expiry": ...} or {"expiry_date": ...} from 'in 2 weeks' / 'on Oct 5, 2025'."""
+    text = _clean(text)
+    match = RELATIVE_RE.match(text)
+    if match:
+        return {"relative_expiry": {"days": int(match.group(1)) * UNIT_DAYS[match.group(2).lower()]}}
+    text = re.sub(r"^(?:on|by|date\s+is|is)\s+", "", text)
+    try:
+        return {"expiry_date": date_parser.parse(text, default=None).date().isoformat()}
+    except (ValueError, OverflowError, TypeError):
+        return None
+
+
+def parse_command(query: str, inventory: list):
+    """
+    Returns an action dict in the model's output format, or None. `inventory`
+    is the list of product dicts (id, product_name, quantity, ...) the query
+    prompt is built from.
+    """
+    text = _clean(query)
+
+    if BULK_DELETE_RE.match(text):
+        return {"action": "BULK_DELETE_EXPIRED"}
+
+    match = ADD_RE.match(text)
+    if match:
+        action = {
+            "action": "ADD",
+            "item_name": match.group("name").strip(),
+            "quantity": int(match.group("quantity")),
+            "price": _number(match.group("price")),
+        }
+        if not match.group("expiry"):
+            return None
+        expiry = _expiry(match.group("expiry"))
+        if expiry is None:
+            return None
+        action.update(expiry)
+        return action
+
+    match = UPDATE_RE.match(text) or UPDATE_ALT_RE.match(text)
+    if match:
+        product = resolve_product(match.group("name"), inventory)
+        if product is None:
+            return None
+        field = FIELD_ALIASES[match.group("field").lower()]
+        value = _number(match.group("value"))
+        return {"action": "UPDATE", "product_id": product["id"],
+                "data": {field: int(value) if field == "quantity" else value}}
+
+    match = SOLD_RE.match(text)
+    if match:
+        product = resolve_product(match.group("name"), inventory)
+        if product is None:
+            return None
+        return {"action": "UPDATE", "product_id": product["id"], "data": {"quantity_delta": -int(match.group("quantity"))}}
+
+    match = DELETE_RE.match(text)
+    if match:
+        product = resolve_product(match.group("name"), inventory)
+        if product is None:
+            return None
+        return {"action": "DELETE", "product_id": product["id"]}
+
+    match = HOW_MANY_RE.match(text)
+    if match:
+        product = resolve_product(match.group("name"), inventory)
+        if product is None or "quantity" not in product:
+            return None
+        return {
+            "action": "QUERY_RESPONSE",
+            "answer": f"There are {product['quantity']} units of {product['product_name']} left in the inventory.",
+        }
+
+    return None
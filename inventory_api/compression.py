@@ -0,0 +1,189 @@
+# inventory_api/compression.py
+"""
+Response compression negotiated per request: zstd for clients that accept
+it, gzip for the rest.
+
+ResponseCompressionMiddleware picks, among RESPONSE_COMPRESSION["ENCODINGS"],
+the encoding the request's Accept-Encoding ranks highest (q-values and "*"
+honoured; ties go to the order in ENCODINGS). Bodies under MIN_BYTES,
+responses that already have a Content-Encoding or say Cache-Control:
+no-transform, partial content and types that are compressed already
+(images, archives, the .zst files of ?compress=zstd exports) go out as
+they are. Streaming responses (SSE and NDJSON proposals, job streams,
+exports) are compressed chunk by chunk and flushed after every chunk, so
+each event still reaches the client as soon as it is produced.
+
+This is transport compression only: bulk_io's zstd files are content, and a
+client that wants one asks for it with ?compress=zstd.
+"""
+import gzip
+import zlib
+
+import zstandard
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .metrics import COMPRESSED_RESPONSE_BYTES
+from .timing import span
+
+# Content types not worth compressing again (prefixes of the media type).
+PRECOMPRESSED_TYPES = (
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif", "video/", "audio/", "font/woff",
+    "application/zstd", "application/gzip", "application/x-gzip", "application/zip", "application/pdf",
+    "application/octet-stream",
+)
+
+
+def _config():
+    config = dict(getattr(settings, "RESPONSE_COMPRESSION", {}))
+    config.setdefault("ENABLED", True)
+    config.setdefault("ENCODINGS", ("zstd", "gzip"))
+    config.setdefault("MIN_BYTES", 1024)
+    config.setdefault("ZSTD_LEVEL", 3)
+    config.setdefault("GZIP_LEVEL", 6)
+    return config
+
+
+def negotiate(accept_encoding, available):
+    """
+    The coding of `available` (in order of preference) that an
+    Accept-Encoding header value ranks highest, or None for identity.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, *params = part.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    ranked = [(weights.get(coding, weights.get("*", 0.0)), -index, coding) for index, coding in enumerate(available)]
+    weight, _, coding = max(ranked, default=(0.0, 0, None))
+    return coding if weight > 0 else None
+
+
+def compress(data, encoding, level):
+    """`data` as one zstd frame or gzip member."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    raise ValueError(f"Unknown encoding '{encoding}'.")
+
+
+class StreamCompressor:
+    """Compresses a stream piece by piece; every write() returns bytes the client can decode at once."""
+
+    def __init__(self, encoding, level):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self._sync = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        elif encoding == "gzip":
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._sync = zlib.Z_SYNC_FLUSH
+        else:
+            raise ValueError(f"Unknown encoding '{encoding}'.")
+
+    def write(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(self._sync)
+
+    def close(self):
+        return self._compressor.flush()
+
+
+def _compressible(response, min_bytes):
+    if response.has_header("Content-Encoding") or response.status_code == 206:
+        return False
+    if "no-transform" in response.get("Cache-Control", ""):
+        return False
+    content_type = response.get("Content-Type", "").lower()
+    if content_type.startswith(PRECOMPRESSED_TYPES):
+        return False
+    return response.streaming or len(response.content) >= min_bytes
+
+
+class ResponseCompressionMiddleware:
+    """Compresses response bodies with the encoding negotiated from Accept-Encoding."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = _config()
+        self.enabled = config["ENABLED"]
+        self.encodings = tuple(config["ENCODINGS"])
+        self.min_bytes = config["MIN_BYTES"]
+        self.levels = {"zstd": config["ZSTD_LEVEL"], "gzip": config["GZIP_LEVEL"]}
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.enabled or not _compressible(response, self.min_bytes):
+            return response
+        # The body depends on Accept-Encoding, also for clients that get it uncompressed.
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""), self.encodings)
+        if encoding is None:
+            return response
+
+        level = self.levels[encoding]
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._compress_async(response.streaming_content, encoding, level)
+            else:
+                response.streaming_content = self._compress_stream(response.streaming_content, encoding, level)
+            del response["Content-Length"]
+        else:
+            with span("compress"):
+                body = compress(response.content, encoding, level)
+            if len(body) >= len(response.content):
+                return response
+            COMPRESSED_RESPONSE_BYTES.labels(encoding=encoding, side="body").inc(len(response.content))
+            COMPRESSED_RESPONSE_BYTES.labels(encoding=encoding, side="wire").inc(len(body))
+            response.content = body
+            response["Content-Length"] = str(len(body))
+
+        response["Content-Encoding"] = encoding
+        # The compressed bytes differ from the uncompressed ones, so a strong ETag no longer holds.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
+
+    @staticmethod
+    def _compress_stream(chunks, encoding, level):
+        compressor = StreamCompressor(encoding, level)
+        body = wire = 0
+        try:
+            for chunk in chunks:
+                if chunk:
+                    data = compressor.write(chunk)
+                    body, wire = body + len(chunk), wire + len(data)
+                    yield data
+            data = compressor.close()
+            wire += len(data)
+            yield data
+        finally:
+            COMPRESSED_RESPONSE_BYTES.labels(encoding=encoding, side="body").inc(body)
+            COMPRESSED_RESPONSE_BYTES.labels(encoding=encoding, side="wire").inc(wire)
+
+    @staticmethod
+    async def _compress_async(chunks, encoding, level):
+        compressor = StreamCompressor(encoding, level)
+        body = wire = 0
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    data = compressor.write(chunk)
+                    body, wire = body + len(chunk), wire + len(data)
+                    yield data
+            data = compressor.close()
+            wire += len(data)
+            yield data
+        finally:
+            COMPRESSED_RESPONSE_BYTES.labels(encoding=encoding, side="body").inc(body)
+            COMPRESSED_RESPONSE_BYTES.labels(encoding=encoding, side="wire").inc(wire)
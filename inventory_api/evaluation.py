@@ -0,0 +1,196 @@
+# inventory_api/evaluation.py
+"""
+Offline evaluation of the query model (`manage.py evaluate_model`).
+
+A suite is a JSONL file, one case per line:
+
+    {"id": "price-1", "query": "change the price of amul milk to 55",
+     "expected": {"action": "UPDATE", "product_name": "Amul Milk", "data": {"price": 55}}}
+
+Each query goes through ProposeActionAPIView.propose(), the path the
+dashboard uses: prompt building, the model, normalization and the SKU
+lookup. The proposal is then compared with "expected". Only the fields
+named there count, at any depth ("data.price"). Strings compare ignoring
+case and spacing and numbers to the cent. data.relative_expiry
+{"days": N} stands for data.expiry_date N days from today, the same way
+the view turns the model's relative dates into dates.
+
+An inventory fixture is a CSV of product_name, price, quantity and
+expires_in_days, loaded relative to the suite's date so the prompts, and
+with them the cassette keys, are the same on every run.
+"""
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+import numpy as np
+
+from .bulk_io import import_records, read_csv
+from .cassettes import collect_calls
+from .metrics import estimate_tokens
+from .models import normalize_sku_name
+
+# Numbers closer than this count as equal (prices are in whole paise).
+NUMBER_TOLERANCE = 0.005
+
+
+@dataclass
+class CaseResult:
+    id: str
+    query: str
+    expected_action: str
+    action: str = None
+    status: int = None
+    fields_total: int = 0
+    fields_ok: int = 0
+    # (field, expected, got) for every field that did not match.
+    mismatches: list = field(default_factory=list)
+    # Wall time of the whole proposal, with replayed model calls at their recorded time.
+    seconds: float = 0.0
+    model_seconds: float = 0.0
+    completion_tokens: int = 0
+    # Decode time behind completion_tokens (the model time when the server reports none).
+    generation_seconds: float = 0.0
+    replayed: bool = False
+
+    @property
+    def action_ok(self):
+        return self.action == self.expected_action
+
+
+def load_cases(path):
+    """The cases of a JSONL suite; raises ValueError naming the first bad line."""
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                case = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}, line {line_no}: {e}") from None
+            if not isinstance(case, dict) or not case.get("query") \
+                    or not isinstance(case.get("expected"), dict) or not case["expected"].get("action"):
+                raise ValueError(f"{path}, line {line_no}: needs \"query\" and \"expected\" with an \"action\".")
+            case.setdefault("id", str(line_no))
+            cases.append(case)
+    return cases
+
+
+def load_inventory(path, warehouse, today):
+    """Loads an inventory fixture (expires_in_days relative to `today`) into `warehouse`."""
+    def records():
+        with open(path, "rb") as f:
+            for line, record, problem in read_csv(f):
+                if not problem:
+                    try:
+                        days = int(record.pop("expires_in_days"))
+                    except (KeyError, TypeError, ValueError):
+                        problem = "expires_in_days must be a whole number of days."
+                    else:
+                        record["expiry_date"] = (today + timedelta(days=days)).isoformat()
+                yield line, record, problem
+
+    report = import_records(records(), mode="add", source="evaluation", warehouse=warehouse)
+    if report.get("errors"):
+        raise ValueError(f"{path}: invalid rows {report['errors']}")
+    return report
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict) and (value or not prefix):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}{key}."))
+        return flat
+    return {prefix[:-1]: value}
+
+
+def _matches(expected, got):
+    if expected is None or isinstance(expected, bool):
+        return got == expected
+    if isinstance(expected, (int, float)):
+        try:
+            return abs(float(got) - expected) < NUMBER_TOLERANCE
+        except (TypeError, ValueError):
+            return False
+    if isinstance(expected, str):
+        return isinstance(got, (str, int, float)) and normalize_sku_name(str(got)) == normalize_sku_name(expected)
+    return got == expected
+
+
+def expected_fields(expected):
+    """The expected proposal as {dotted field: value}, action excluded, relative expiry resolved."""
+    fields = _flatten({key: value for key, value in expected.items() if key != "action"})
+    days = fields.pop("data.relative_expiry.days", None)
+    if days is not None:
+        # From the real today, not the suite's date: that is what the view counts from.
+        fields["data.expiry_date"] = (date.today() + timedelta(days=int(days))).isoformat()
+    return fields
+
+
+def expected_action(case):
+    action = str(case["expected"]["action"]).upper()
+    return "CREATE" if action == "ADD" else action
+
+
+def score(case, proposal, status, result):
+    """Fills in `result` from the proposal the view returned for `case`."""
+    proposal = proposal if isinstance(proposal, dict) else {}
+    result.status = status
+    result.action = str(proposal.get("action") or ("ERROR" if "error" in proposal else "NONE")).upper()
+    got = _flatten(proposal)
+    for name, value in expected_fields(case["expected"]).items():
+        result.fields_total += 1
+        if _matches(value, got.get(name)):
+            result.fields_ok += 1
+        else:
+            result.mismatches.append((name, value, got.get(name, proposal.get("error"))))
+    return result
+
+
+def run_case(view, case, warehouse, today):
+    """Runs one case through `view.propose()` and scores it."""
+    result = CaseResult(id=str(case["id"]), query=case["query"], expected_action=expected_action(case))
+    with collect_calls() as calls:
+        started = time.perf_counter()
+        response = view.propose(case["query"], warehouse, today=today)
+        elapsed = time.perf_counter() - started
+    # Replayed calls took no time here; count them at the time they took when recorded.
+    live_seconds = sum(call["seconds"] for call in calls if not call.get("replayed"))
+    result.model_seconds = sum(call["seconds"] for call in calls)
+    result.seconds = elapsed - live_seconds + result.model_seconds
+    result.replayed = any(call.get("replayed") for call in calls)
+    for call in calls:
+        tokens = call.get("completion_tokens") or estimate_tokens(call.get("output_bytes", 0))
+        result.completion_tokens += tokens
+        result.generation_seconds += call.get("eval_seconds") or call["seconds"]
+    return score(case, response.data, response.status_code, result)
+
+
+def summarize(results):
+    """Accuracy, latency and throughput over a run's results."""
+    if not results:
+        return {"cases": 0}
+    seconds = np.array([r.seconds for r in results])
+    fields_total = sum(r.fields_total for r in results)
+    generation_seconds = sum(r.generation_seconds for r in results)
+    by_action = Counter(r.expected_action for r in results)
+    correct_by_action = Counter(r.expected_action for r in results if r.action_ok)
+    return {
+        "cases": len(results),
+        "action_accuracy": sum(r.action_ok for r in results) / len(results),
+        "field_accuracy": sum(r.fields_ok for r in results) / fields_total if fields_total else None,
+        "exact_matches": sum(r.action_ok and r.fields_ok == r.fields_total for r in results),
+        "latency_p50_ms": float(np.percentile(seconds, 50)) * 1000,
+        "latency_p95_ms": float(np.percentile(seconds, 95)) * 1000,
+        "model_seconds": sum(r.model_seconds for r in results),
+        "tokens_per_second": sum(r.completion_tokens for r in results) / generation_seconds
+        if generation_seconds else None,
+        "action_accuracy_by_action": {action: correct_by_action[action] / count
+                                      for action, count in sorted(by_action.items())},
+        "replayed": all(r.replayed for r in results),
+    }
+
@@ -0,0 +1,59 @@
+# inventory_api/fastjson.py
+"""
+JSON through orjson instead of the json module: DRF's renderer and parser
+(settings.REST_FRAMEWORK), and dumps()/loads() for the prompt's inventory,
+streamed events and model output.
+
+orjson writes dates, datetimes, UUIDs and numpy values itself. Decimals are
+written as numbers, as DRF's own encoder does; anything else DRF's encoder
+knows (lazy strings, timedeltas, querysets) goes through that encoder. The
+output is compact UTF-8, and ?indent= (or the browsable API) gets two-space
+indentation, the only width orjson has.
+"""
+from decimal import Decimal
+
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+JSONDecodeError = orjson.JSONDecodeError
+_fallback = JSONEncoder()
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return _fallback.default(value)
+
+
+def dumps(value, indent=False) -> bytes:
+    return orjson.dumps(value, default=_default, option=(OPTIONS | orjson.OPT_INDENT_2) if indent else OPTIONS)
+
+
+def loads(data):
+    """orjson.loads; raises JSONDecodeError (a json.JSONDecodeError) on bad input."""
+    return orjson.loads(data)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """DRF's JSONRenderer, encoding with orjson."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type or "", renderer_context or {})
+        return dumps(data, indent=bool(indent))
+
+
+class ORJSONParser(JSONParser):
+    """DRF's JSONParser, decoding with orjson (UTF-8 bodies, as RFC 8259 requires)."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as e:
+            raise ParseError(f"JSON parse error - {e}")
@@ -0,0 +1,171 @@
+# inventory_api/forecasting.py
+"""
+Waste and stock-out forecasts for the whole catalogue or one warehouse's,
+computed in batch.
+
+Each SKU's daily consumption rate comes from the stock ledger: units that
+left through sales and downward adjustments over the last WINDOW_DAYS days,
+either as a plain mean ("mean") or weighted towards recent days with a
+half-life of HALF_LIFE_DAYS ("ewma"). Consumption is bucketed per SKU and
+day and weighted with one matrix product.
+
+Stock is then drawn down first-expiry-first-out at that rate. By lot k's
+expiry date, the SKU has sold rate * days in total, and lot k gets whatever
+of that its earlier lots did not take:
+
+    sold_k = clip(rate * days_k - sold_before_k, 0, quantity_k)
+
+The rest of the lot expires unsold. Lots are laid out as a (SKU x lot rank)
+array, so the projection is one vectorized step per lot rank (the most lots
+any SKU holds), not a loop over products. The SKU runs out after
+sold_total / rate days; sales it would have made after that, up to the
+horizon, are lost.
+
+expected_loss prices both the units that expire within the horizon and the
+lost sales at the SKU's shelf price.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Product, Sku, StockMovement
+
+MODELS = ("ewma", "mean")
+COLUMNS = [
+    "sku_id", "product_name", "quantity", "daily_rate", "days_of_cover", "depletion_date",
+    "expected_expired_units", "expected_lost_sales", "expected_loss",
+]
+
+
+def _config(**overrides):
+    config = dict(getattr(settings, "FORECAST", {}))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    config.setdefault("WINDOW_DAYS", 28)
+    config.setdefault("HALF_LIFE_DAYS", 7)
+    config.setdefault("HORIZON_DAYS", 30)
+    config.setdefault("MODEL", "ewma")
+    config.setdefault("CONSUMPTION_KINDS", (StockMovement.Kind.SALE, StockMovement.Kind.ADJUSTMENT))
+    if config["MODEL"] not in MODELS:
+        raise ValueError(f"Unknown forecast model '{config['MODEL']}'; expected one of {', '.join(MODELS)}.")
+    return config
+
+
+def consumption_rates(config, now=None, warehouse=None):
+    """
+    Units consumed per day, per SKU id (a Series; SKUs with no consumption
+    are absent), of every SKU or only those of `warehouse`. Ledger rows are read on a plain cursor, skipping Django's
+    per-row timestamp conversion (the bulk of the cost on a large ledger).
+    They are then bucketed by SKU and age in days with one bincount.
+    """
+    window = config["WINDOW_DAYS"]
+    now = now or timezone.now()
+    movements = (
+        StockMovement.objects.filter(created_at__gte=now - timedelta(days=window), created_at__lt=now,
+                                     quantity__lt=0, kind__in=config["CONSUMPTION_KINDS"])
+        .order_by()
+        .values_list("sku_id", "created_at", "quantity")
+    )
+    if warehouse is not None:
+        movements = movements.filter(sku_id__in=Sku.objects.filter(warehouse=warehouse).values("id"))
+    sql, params = movements.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ledger = pd.DataFrame.from_records(cursor.fetchall(), columns=["sku_id", "created_at", "quantity"])
+    if ledger.empty:
+        return pd.Series(dtype=np.float64)
+
+    # SQLite returns the stored UTC text, PostgreSQL aware datetimes; both parse as UTC.
+    created_at = pd.to_datetime(ledger["created_at"], utc=True, format="ISO8601")
+    age = ((pd.Timestamp(now) - created_at) // pd.Timedelta(days=1)).clip(0, window - 1).to_numpy()
+    codes, sku_ids = pd.factorize(ledger["sku_id"])
+    daily = np.bincount(codes * window + age, weights=-ledger["quantity"].to_numpy(dtype=np.float64),
+                        minlength=len(sku_ids) * window).reshape(len(sku_ids), window)
+    if config["MODEL"] == "mean":
+        weights = np.ones(window)
+    else:
+        weights = 0.5 ** (np.arange(window) / config["HALF_LIFE_DAYS"])
+    # Every day of the window counts, including days without consumption.
+    return pd.Series(daily @ weights / weights.sum(), index=sku_ids)
+
+
+def forecast(today=None, horizon_days=None, window_days=None, model=None, warehouse=None):
+    """
+    A DataFrame with one row per stocked SKU (see COLUMNS), of the whole
+    catalogue or of `warehouse` only, highest expected_loss first. days_of_cover and depletion_date are NaN/NaT for
+    SKUs with no recorded consumption.
+    """
+    config = _config(HORIZON_DAYS=horizon_days, WINDOW_DAYS=window_days, MODEL=model)
+    # A forecast as of another day reads the ledger up to the end of that day.
+    now = None if today is None else timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min))
+    today = today or timezone.localdate()
+    horizon = config["HORIZON_DAYS"]
+
+    skus = Sku.objects.filter(lot_count__gt=0)
+    lots = Product.objects.filter(quantity__gt=0)
+    if warehouse is not None:
+        skus, lots = skus.filter(warehouse=warehouse), lots.filter(warehouse=warehouse)
+    skus = pd.DataFrame.from_records(
+        skus.order_by("id")
+        .annotate(price_value=Cast("price", FloatField()))
+        .values_list("id", "name", "price_value", "total_quantity"),
+        columns=["sku_id", "product_name", "price", "quantity"],
+    )
+    lots = pd.DataFrame.from_records(
+        lots.order_by("sku_id", "expiry_date", "id")
+        .values_list("sku_id", "expiry_date", "quantity"),
+        columns=["sku_id", "expiry_date", "quantity"],
+    )
+    if skus.empty or lots.empty:
+        return pd.DataFrame(columns=COLUMNS)
+
+    rate = consumption_rates(config, now, warehouse).reindex(skus["sku_id"]).fillna(0.0).to_numpy()
+
+    # Lots as (SKU, FEFO rank) arrays; missing ranks hold zero units.
+    row = pd.Index(skus["sku_id"]).get_indexer(lots["sku_id"])
+    lots = lots[row >= 0]
+    row = row[row >= 0]
+    rank = lots.groupby("sku_id").cumcount().to_numpy()
+    quantity = np.zeros((len(skus), rank.max() + 1))
+    days = np.zeros_like(quantity)
+    quantity[row, rank] = lots["quantity"].to_numpy()
+    days[row, rank] = (pd.to_datetime(lots["expiry_date"]) - pd.Timestamp(today)).dt.days.to_numpy()
+
+    sold_total = np.zeros(len(skus))
+    expired = np.zeros(len(skus))
+    for k in range(quantity.shape[1]):
+        # Lots already past their date sell nothing (days clipped to 0).
+        sold = np.clip(rate * np.maximum(days[:, k], 0) - sold_total, 0, quantity[:, k])
+        sold_total += sold
+        expired += np.where(days[:, k] <= horizon, quantity[:, k] - sold, 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cover = np.where(rate > 0, sold_total / rate, np.nan)
+    lost_sales = np.where(rate > 0, rate * np.clip(horizon - np.nan_to_num(cover, nan=horizon), 0, None), 0)
+
+    result = skus[["sku_id", "product_name", "quantity"]].assign(
+        daily_rate=np.round(rate, 3),
+        days_of_cover=np.round(cover, 1),
+        depletion_date=pd.Timestamp(today) + pd.to_timedelta(np.round(cover), unit="D"),
+        expected_expired_units=np.round(expired, 1),
+        expected_lost_sales=np.round(lost_sales, 1),
+        expected_loss=np.round((expired + lost_sales) * skus["price"].to_numpy(), 2),
+    )
+    return result.sort_values(["expected_loss", "sku_id"], ascending=[False, True], kind="stable")[COLUMNS]
+
+
+def at_risk(today=None, horizon_days=None, window_days=None, model=None, min_loss=0.0, warehouse=None):
+    """The forecast's SKUs with an expected loss above `min_loss`, highest first."""
+    result = forecast(today, horizon_days, window_days, model, warehouse)
+    return result[result["expected_loss"] > min_loss]
+
+
+def to_records(frame):
+    """JSON-ready rows: dates become ISO strings and NaN/NaT become None."""
+    frame = frame.assign(depletion_date=frame["depletion_date"].dt.strftime("%Y-%m-%d"))
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
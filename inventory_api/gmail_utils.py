@@ -16,6 +16,8 @@ from googleapiclient.errors import HttpError
 
 from django.conf import settings
 
+from .metrics import GMAIL_SEND_SECONDS, timed
+
 logger = logging.getLogger(__name__)
 
 # SCOPES
@@ -179,7 +181,8 @@ def send_html_email(service, html_body: str, subject: str, recipient: Optional[s
     raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
 
     try:
-        resp = service.users().messages().send(userId=EMAIL_FROM, body={"raw": raw_message}).execute()
+        with timed(GMAIL_SEND_SECONDS, outcome="ok"):
+            resp = service.users().messages().send(userId=EMAIL_FROM, body={"raw": raw_message}).execute()
         logger.info("Sent email to %s; message id: %s", recipient, resp.get("id"))
         return resp
     except HttpError as e:
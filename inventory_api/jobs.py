@@ -0,0 +1,182 @@
+# inventory_api/jobs.py
+"""
+Background jobs for /api/query/?async=1.
+
+The web process only stores the query as an LLMJob row (enqueue()) and
+answers 202 with the job's id. `manage.py run_llm_workers` processes claim
+jobs from that table, build the prompt, call the model and store the
+proposal; clients poll /api/jobs/<id>/ or follow it with ?stream=sse. Web
+workers never wait on the model, and model workers scale on their own.
+
+Claiming is a conditional UPDATE on the job's status and lease, so any
+number of worker processes share the table, on SQLite as on PostgreSQL,
+without row locks: a worker that loses a race moves on to the next job.
+A claimed job carries a lease of LLM_JOBS["TIMEOUT"] plus a margin; if its
+worker dies the lease runs out and another worker takes the job again, up
+to MAX_ATTEMPTS. A job the model is too busy for (SchedulerBusy) goes back
+to the queue for Retry-After seconds instead of failing.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .metrics import LLM_JOB_QUEUE_WAIT_SECONDS, LLM_JOB_SECONDS, timed
+from .models import LLMJob
+from .resilience import deadline_at
+from .warehouses import use_warehouse
+
+logger = logging.getLogger(__name__)
+
+# Extra lease time past the attempt's deadline, for building the prompt and saving the result.
+LEASE_MARGIN = 60.0
+# Claimable jobs read per claim attempt; the first one won is taken.
+CLAIM_BATCH = 8
+PENDING = (LLMJob.Status.QUEUED, LLMJob.Status.RUNNING)
+
+
+class JobQueueFull(Exception):
+    """Too many jobs are waiting; retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _config():
+    config = dict(getattr(settings, "LLM_JOBS", {}))
+    config.setdefault("WORKERS", 4)
+    config.setdefault("POLL_INTERVAL", 0.5)
+    config.setdefault("TIMEOUT", 180.0)
+    config.setdefault("MAX_ATTEMPTS", 3)
+    config.setdefault("MAX_QUEUED", 1000)
+    config.setdefault("STREAM_SECONDS", 300.0)
+    config.setdefault("RETENTION_HOURS", 24.0)
+    return config
+
+
+def enqueue(query, warehouse):
+    """Stores a query for the workers; raises JobQueueFull when MAX_QUEUED jobs are waiting."""
+    config = _config()
+    if LLMJob.objects.filter(status=LLMJob.Status.QUEUED).count() >= config["MAX_QUEUED"]:
+        raise JobQueueFull("Too many queries are waiting for the language model. Please try again shortly.",
+                           max(1, round(config["TIMEOUT"] / 10)))
+    return LLMJob.objects.create(query=query, warehouse=warehouse)
+
+
+def claim(worker):
+    """
+    Takes the oldest claimable job for `worker`: a queued one that is due, or
+    a running one whose lease has run out. Returns None when there is none.
+    """
+    config = _config()
+    now = timezone.now()
+    candidates = (
+        LLMJob.objects
+        .filter(Q(status=LLMJob.Status.QUEUED, available_at__lte=now)
+                | Q(status=LLMJob.Status.RUNNING, lease_expires_at__lt=now))
+        .order_by("available_at")
+        .values_list("pk", "status", "lease_expires_at")[:CLAIM_BATCH]
+    )
+    for pk, status, lease_expires_at in candidates:
+        # Only succeeds if no other worker changed the job since it was read.
+        claimed = LLMJob.objects.filter(pk=pk, status=status, lease_expires_at=lease_expires_at).update(
+            status=LLMJob.Status.RUNNING,
+            worker=worker,
+            lease_expires_at=now + timedelta(seconds=config["TIMEOUT"] + LEASE_MARGIN),
+            started_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return LLMJob.objects.select_related("warehouse").get(pk=pk)
+    return None
+
+
+def run(job, worker):
+    """
+    Runs a claimed job: builds its prompt, calls the model and stores the
+    proposal. Returns the outcome: "done", "failed" or "requeued".
+    """
+    # Lazy import: views imports this module to enqueue.
+    from .views import ProposeActionAPIView
+
+    config = _config()
+    if job.attempts == 1:
+        LLM_JOB_QUEUE_WAIT_SECONDS.observe((job.started_at - job.created_at).total_seconds())
+    with timed(LLM_JOB_SECONDS, outcome="done") as attempt:
+        attempt["outcome"] = "done"
+        if job.attempts > config["MAX_ATTEMPTS"]:
+            # Its earlier workers died holding it.
+            attempt["outcome"] = "failed"
+            _finish(job, worker, LLMJob.Status.FAILED, 500,
+                    {"error": f"The query was abandoned after {config['MAX_ATTEMPTS']} attempts."})
+            return attempt["outcome"]
+        try:
+            with use_warehouse(job.warehouse), deadline_at(time.monotonic() + config["TIMEOUT"]):
+                response = ProposeActionAPIView().propose(job.query, job.warehouse)
+        except Exception as e:
+            logger.exception("LLM job %s failed:", job.pk)
+            if job.attempts < config["MAX_ATTEMPTS"]:
+                attempt["outcome"] = "requeued"
+                _requeue(job, worker, delay=2 ** job.attempts, count_attempt=True)
+            else:
+                attempt["outcome"] = "failed"
+                _finish(job, worker, LLMJob.Status.FAILED, 500, {"error": f"Error processing the query: {e}"})
+            return attempt["outcome"]
+
+        if response.status_code == 429:
+            # The model's queue is full here; wait as long as it asked, without using up an attempt.
+            attempt["outcome"] = "requeued"
+            _requeue(job, worker, delay=float(response.get("Retry-After", 1)), count_attempt=False)
+            return attempt["outcome"]
+        _finish(job, worker, LLMJob.Status.DONE, response.status_code, response.data)
+        return attempt["outcome"]
+
+
+def _finish(job, worker, status, result_status, result):
+    # Conditional on still holding the job: a worker whose lease ran out must not overwrite the new attempt.
+    saved = LLMJob.objects.filter(pk=job.pk, worker=worker, status=LLMJob.Status.RUNNING).update(
+        status=status, result_status=result_status, result=result,
+        finished_at=timezone.now(), lease_expires_at=None,
+    )
+    if not saved:
+        logger.warning("LLM job %s was taken over by another worker; dropping this result.", job.pk)
+
+
+def _requeue(job, worker, delay, count_attempt):
+    LLMJob.objects.filter(pk=job.pk, worker=worker, status=LLMJob.Status.RUNNING).update(
+        status=LLMJob.Status.QUEUED,
+        available_at=timezone.now() + timedelta(seconds=delay),
+        lease_expires_at=None,
+        attempts=F("attempts") if count_attempt else F("attempts") - 1,
+    )
+
+
+def watch(job, keepalive=15.0):
+    """
+    Yields `job` now, whenever its status changes and at least every
+    `keepalive` seconds while it waits. Stops once it has finished or after
+    STREAM_SECONDS, whichever comes first.
+    """
+    config = _config()
+    give_up_at = time.monotonic() + config["STREAM_SECONDS"]
+    sent, sent_at = None, 0.0
+    while True:
+        now = time.monotonic()
+        if job.status != sent or now - sent_at >= keepalive:
+            sent, sent_at = job.status, now
+            yield job
+        if job.status not in PENDING or now >= give_up_at:
+            return
+        time.sleep(config["POLL_INTERVAL"])
+        job.refresh_from_db(fields=["status", "result_status", "result"])
+
+
+def purge_finished(now=None):
+    """Deletes jobs that finished more than RETENTION_HOURS ago; returns how many."""
+    cutoff = (now or timezone.now()) - timedelta(hours=_config()["RETENTION_HOURS"])
+    deleted, _ = LLMJob.objects.filter(finished_at__lt=cutoff).delete()
+    return deleted
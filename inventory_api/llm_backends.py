@@ -0,0 +1,376 @@
+# inventory_api/llm_backends.py
+"""
+LLM backend layer: adapters for Ollama and OpenAI-compatible servers
+(LM Studio, vLLM, Ollama's /v1 API) and a pool that spreads calls over
+several of them.
+
+The pool sends each call to the admitted backend with the fewest calls in
+flight. A backend is ejected after LLM_POOL["MAX_FAILURES"] consecutive
+failures (or a failed health check) and re-admitted when a background health
+check succeeds or, failing that, after EJECT_SECONDS on probation.
+
+Configure the endpoints with settings.LLM_BACKENDS (see settings.py).
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+from . import fastjson
+
+logger = logging.getLogger(__name__)
+
+# Request bodies are encoded with orjson rather than by requests' json=.
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class LLMBackendError(Exception):
+    """The model server answered, but with an error status."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class NoBackendAvailable(Exception):
+    """Every configured backend is currently ejected."""
+
+
+class LLMBackend:
+    """Base class for one model server endpoint."""
+    kind = None
+    connect_timeout = 3.05
+
+    def __init__(self, url, model, name=None, timeout=180, keep_alive=None, prompt_prefix_mode="system"):
+        self.url = url.rstrip("/")
+        self.model = model
+        self.name = name or self.url
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.prompt_prefix_mode = prompt_prefix_mode
+        # Pool bookkeeping (guarded by the pool's lock)
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name}>"
+
+    def generate(self, prompt, system=None, timeout=None, stats=None) -> str:
+        """
+        Return the complete model output as text. If `stats` is a dict, the
+        token counts the server reports are added to it (prompt_tokens,
+        completion_tokens and, where known, eval_seconds: decode time).
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt, system=None, timeout=None, stats=None):
+        """Yield the model output in pieces as it is generated; `stats` as for generate()."""
+        raise NotImplementedError
+
+    def health_check(self, timeout=2.0) -> bool:
+        raise NotImplementedError
+
+    def _post(self, path, payload, timeout, stream=False):
+        # `timeout` (the caller's remaining budget) can only shorten the configured one.
+        read_timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        connect_timeout = min(self.connect_timeout, read_timeout)
+        response = requests.post(f"{self.url}{path}", data=fastjson.dumps(payload), headers=JSON_HEADERS,
+                                 timeout=(connect_timeout, read_timeout), stream=stream)
+        if response.status_code != 200:
+            text = response.text
+            response.close()
+            raise LLMBackendError(f"{self.name} returned {response.status_code}: {text}", response.status_code)
+        return response
+
+
+class OllamaBackend(LLMBackend):
+    """Ollama's native /api/generate endpoint with `format: json`."""
+    kind = "ollama"
+
+    def _payload(self, prompt, system, stream):
+        payload = {"model": self.model, "prompt": prompt, "stream": stream, "format": "json"}
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        if system:
+            if self.prompt_prefix_mode == "system":
+                payload["system"] = system
+            else:
+                payload["prompt"] = f"{system}\n{prompt}"
+        return payload
+
+    @staticmethod
+    def _fill_stats(stats, body):
+        if stats is None:
+            return
+        if "prompt_eval_count" in body:
+            stats["prompt_tokens"] = body["prompt_eval_count"]
+        if "eval_count" in body:
+            stats["completion_tokens"] = body["eval_count"]
+        if body.get("eval_duration"):
+            stats["eval_seconds"] = body["eval_duration"] / 1e9
+
+    def generate(self, prompt, system=None, timeout=None, stats=None) -> str:
+        response = self._post("/api/generate", self._payload(prompt, system, False), timeout)
+        logger.debug("Ollama response from %s: %s", self.name, response.text)
+        body = fastjson.loads(response.content)
+        self._fill_stats(stats, body)
+        return body.get("response", "{}")
+
+    def stream(self, prompt, system=None, timeout=None, stats=None):
+        with self._post("/api/generate", self._payload(prompt, system, True), timeout, stream=True) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = fastjson.loads(line)
+                if chunk.get("error"):
+                    raise LLMBackendError(f"{self.name} error: {chunk['error']}")
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    self._fill_stats(stats, chunk)
+                    return
+
+    def health_check(self, timeout=2.0) -> bool:
+        try:
+            return requests.get(f"{self.url}/api/tags", timeout=timeout).status_code == 200
+        except requests.RequestException:
+            return False
+
+
+class OpenAICompatBackend(LLMBackend):
+    """OpenAI-style /v1/chat/completions (LM Studio, vLLM, Ollama's /v1)."""
+    kind = "openai"
+
+    def _payload(self, prompt, system, stream):
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        return {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "temperature": 0,
+            "response_format": {"type": "json_object"},
+        }
+
+    @staticmethod
+    def _fill_stats(stats, body):
+        # Only token counts: the OpenAI API reports no generation timings.
+        usage = body.get("usage") or {}
+        if stats is None or not usage:
+            return
+        stats["prompt_tokens"] = usage.get("prompt_tokens")
+        stats["completion_tokens"] = usage.get("completion_tokens")
+
+    def generate(self, prompt, system=None, timeout=None, stats=None) -> str:
+        response = self._post("/v1/chat/completions", self._payload(prompt, system, False), timeout)
+        logger.debug("OpenAI-compatible response from %s: %s", self.name, response.text)
+        body = fastjson.loads(response.content)
+        self._fill_stats(stats, body)
+        return body["choices"][0]["message"]["content"] or "{}"
+
+    def stream(self, prompt, system=None, timeout=None, stats=None):
+        with self._post("/v1/chat/completions", self._payload(prompt, system, True), timeout, stream=True) as response:
+            for line in response.iter_lines():
+                if not line or not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    return
+                chunk = fastjson.loads(data)
+                # Servers that report usage on streams send it with the last chunk.
+                self._fill_stats(stats, chunk)
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+
+    def health_check(self, timeout=2.0) -> bool:
+        try:
+            return requests.get(f"{self.url}/v1/models", timeout=timeout).status_code == 200
+        except requests.RequestException:
+            return False
+
+
+BACKEND_CLASSES = {
+    OllamaBackend.kind: OllamaBackend,
+    OpenAICompatBackend.kind: OpenAICompatBackend,
+    "lmstudio": OpenAICompatBackend,
+}
+
+
+class BackendPool:
+    """Least-outstanding-requests balancing with ejection and health checks."""
+
+    def __init__(self, backends, max_failures=3, eject_seconds=30.0, health_interval=10.0, health_timeout=2.0):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend.")
+        self.backends = list(backends)
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._lock = threading.Lock()
+        self._rotation = itertools.count()
+        self._health_thread = None
+
+    def _admitted(self, now):
+        return [b for b in self.backends if b.ejected_until <= now]
+
+    def _pick(self, exclude=()):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self._admitted(now) if b not in exclude]
+            if not candidates:
+                raise NoBackendAvailable("All language model servers are currently ejected.")
+            # Rotate the starting point so ties are spread round-robin.
+            offset = next(self._rotation) % len(candidates)
+            candidates = candidates[offset:] + candidates[:offset]
+            backend = min(candidates, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend, ok):
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                backend.consecutive_failures = 0
+                return
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.max_failures and backend.ejected_until <= time.monotonic():
+                backend.ejected_until = time.monotonic() + self.eject_seconds
+                logger.warning("Ejecting LLM backend %s after %d consecutive failures.",
+                               backend.name, backend.consecutive_failures)
+
+    @contextmanager
+    def acquire(self, exclude=()):
+        """
+        Yields the backend to use, skipping those in `exclude`. Connection
+        errors and 5xx responses raised inside the block count as failures
+        for that backend.
+        """
+        self.start_health_checks()
+        backend = self._pick(exclude)
+        ok = True
+        try:
+            yield backend
+        except requests.RequestException:
+            ok = False
+            raise
+        except LLMBackendError as e:
+            ok = e.status_code is not None and e.status_code < 500
+            raise
+        finally:
+            self._release(backend, ok)
+
+    def call(self, fn):
+        """
+        Runs fn(backend) on a pooled backend. If the connection is refused
+        (nothing was generated, so retrying is safe) the call moves on to
+        another backend, trying each one at most once.
+        """
+        tried = []
+        while True:
+            try:
+                with self.acquire(exclude=tried) as backend:
+                    return fn(backend)
+            except requests.ConnectionError as e:
+                tried.append(backend)
+                if len(tried) >= len(self.backends):
+                    raise
+                logger.warning("LLM backend %s unreachable (%s); trying another.", backend.name, e)
+            except NoBackendAvailable:
+                if not tried:
+                    raise
+                raise requests.ConnectionError("Every admitted LLM backend refused the connection.")
+
+    def check_health(self):
+        """Run one round of health checks, ejecting or re-admitting backends."""
+        for backend in self.backends:
+            healthy = backend.health_check(self.health_timeout)
+            with self._lock:
+                if healthy:
+                    if backend.ejected_until:
+                        logger.info("Re-admitting LLM backend %s.", backend.name)
+                    backend.ejected_until = 0.0
+                    backend.consecutive_failures = 0
+                elif backend.ejected_until <= time.monotonic():
+                    logger.warning("Ejecting LLM backend %s after a failed health check.", backend.name)
+                    backend.ejected_until = time.monotonic() + self.eject_seconds
+
+    def start_health_checks(self):
+        if self.health_interval <= 0 or self._health_thread is not None:
+            return
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            self._health_thread = threading.Thread(target=self._health_loop, name="llm-health", daemon=True)
+            self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            try:
+                self.check_health()
+            except Exception:
+                logger.exception("LLM backend health check failed.")
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "kind": b.kind,
+                    "outstanding": b.outstanding,
+                    "consecutive_failures": b.consecutive_failures,
+                    "admitted": b.ejected_until <= now,
+                }
+                for b in self.backends
+            ]
+
+
+def build_backend(config: dict, defaults: dict) -> LLMBackend:
+    kind = config.get("KIND", "ollama").lower()
+    if kind not in BACKEND_CLASSES:
+        raise ValueError(f"Unknown LLM backend kind '{kind}'. Use one of {sorted(BACKEND_CLASSES)}.")
+    return BACKEND_CLASSES[kind](
+        url=config["URL"],
+        model=config.get("MODEL", defaults.get("MODEL", "phi3-finetuned-inventoryV2")),
+        name=config.get("NAME"),
+        timeout=config.get("TIMEOUT", defaults.get("TIMEOUT", 180)),
+        keep_alive=config.get("KEEP_ALIVE", defaults.get("KEEP_ALIVE")),
+        prompt_prefix_mode=config.get("PROMPT_PREFIX_MODE", defaults.get("PROMPT_PREFIX_MODE", "system")),
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_backend_pool() -> BackendPool:
+    """The process-wide pool built from settings.LLM_BACKENDS / OLLAMA_CONFIG."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                defaults = getattr(settings, "OLLAMA_CONFIG", {})
+                configs = getattr(settings, "LLM_BACKENDS", None) or [
+                    {"KIND": "ollama", "URL": defaults.get("URL", "http://localhost:11434")}
+                ]
+                pool_config = getattr(settings, "LLM_POOL", {})
+                _pool = BackendPool(
+                    [build_backend(c, defaults) for c in configs],
+                    max_failures=pool_config.get("MAX_FAILURES", 3),
+                    eject_seconds=pool_config.get("EJECT_SECONDS", 30.0),
+                    health_interval=pool_config.get("HEALTH_CHECK_INTERVAL", 10.0),
+                    health_timeout=pool_config.get("HEALTH_CHECK_TIMEOUT", 2.0),
+                )
+    return _pool
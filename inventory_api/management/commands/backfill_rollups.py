@@ -0,0 +1,31 @@
+# inventory_api/management/commands/backfill_rollups.py
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory_api.rollups import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily inventory rollups from the stock ledger (see inventory_api/rollups.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90, help="Days back from today to rebuild (default: 90).")
+        parser.add_argument("--since", help="Rebuild from this date (YYYY-MM-DD) instead of --days.")
+
+    def handle(self, *args, **options):
+        today = date.today()
+        try:
+            since = date.fromisoformat(options["since"]) if options["since"] else today - timedelta(days=options["days"] - 1)
+        except ValueError:
+            raise CommandError(f"Invalid --since: {options['since']}")
+        if since > today:
+            raise CommandError("--since is after today.")
+
+        started = time.perf_counter()
+        written = backfill(since, today)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} daily rollups from {since.isoformat()} to {today.isoformat()} in {elapsed_ms:.0f} ms."
+        ))
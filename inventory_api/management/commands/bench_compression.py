@@ -0,0 +1,115 @@
+# inventory_api/management/commands/bench_compression.py
+import gzip
+import json
+import statistics
+import time
+
+import zstandard
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from inventory_api.compression import StreamCompressor, compress
+from inventory_api.warehouses import warehouse_option
+
+# Small events like the ones /api/query/?stream=sse sends while the model generates.
+EVENT_COUNT = 200
+
+
+def decompress(data, encoding):
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    # Streamed frames carry no content size, so decompress incrementally.
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+class Command(BaseCommand):
+    help = ("Measures bytes on the wire and CPU cost of the response compression middleware "
+            "(inventory_api/compression.py) on the warehouse's product list, dashboard, export and event streams.")
+
+    def add_arguments(self, parser):
+        config = getattr(settings, "RESPONSE_COMPRESSION", {})
+        parser.add_argument("--warehouse", help="Warehouse whose data is sent (default: the default one).")
+        parser.add_argument("--encodings",
+                            default=f"gzip:{config.get('GZIP_LEVEL', 6)},zstd:{config.get('ZSTD_LEVEL', 3)}",
+                            help="Comma-separated encoding:level pairs to compare (default: the configured levels).")
+        parser.add_argument("--mbps", type=float, default=10.0,
+                            help="Link speed used to turn bytes into transfer time (default: 10 Mbit/s).")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case; the median is shown.")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            encodings = [(name, int(level)) for name, level in
+                         (pair.strip().split(":") for pair in options["encodings"].split(","))]
+        except ValueError:
+            raise CommandError("--encodings takes encoding:level pairs, e.g. zstd:3,gzip:6.")
+        for name, _ in encodings:
+            if name not in ("zstd", "gzip"):
+                raise CommandError(f"Unknown encoding '{name}'; use zstd or gzip.")
+
+        payloads = self._payloads(warehouse_option(options["warehouse"]))
+        results = []
+        for payload, streamed, chunks in payloads:
+            size = sum(len(chunk) for chunk in chunks)
+            results.append(self._case(payload, "identity", None, size, size, 0.0, 0.0, options["mbps"]))
+            for encoding, level in encodings:
+                if streamed:
+                    def run():
+                        compressor = StreamCompressor(encoding, level)
+                        return b"".join([compressor.write(chunk) for chunk in chunks] + [compressor.close()])
+                else:
+                    def run():
+                        return compress(chunks[0], encoding, level)
+                wire = run()
+                if decompress(wire, encoding) != b"".join(chunks):
+                    raise CommandError(f"{payload}: {encoding} output does not decompress to the original.")
+                results.append(self._case(payload, encoding, level, size, len(wire),
+                                          self._time(run, options["repeat"]),
+                                          self._time(lambda: decompress(wire, encoding), options["repeat"]),
+                                          options["mbps"]))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"Median of {options['repeat']} runs; transfer at {options['mbps']:g} Mbit/s:")
+        for result in results:
+            name = result["encoding"] + (f":{result['level']}" if result["level"] is not None else "")
+            self.stdout.write(
+                f"  {result['payload']:<22} {name:<9} {result['wire_bytes']:>10,} B  {result['ratio']:5.1f}x  "
+                f"compress {result['compress_ms']:7.1f} ms  decompress {result['decompress_ms']:6.1f} ms  "
+                f"transfer {result['transfer_ms']:8.1f} ms  total {result['total_ms']:8.1f} ms"
+            )
+
+    def _payloads(self, warehouse):
+        """(name, streamed, chunks) for each response measured, fetched without compression."""
+        client = Client(HTTP_X_WAREHOUSE=warehouse.code)
+        products = client.get("/api/products/")
+        if products.status_code != 200 or products.content == b"[]":
+            raise CommandError(f"Warehouse '{warehouse.code}' has no stock lots; seed it with "
+                               "`manage.py seed_products --count 20000` first.")
+        dashboard = client.get("/")
+        export = client.get("/api/products/export/?format=ndjson")
+        events = [f'event: progress\ndata: {{"chars":{i * 8}}}\n\n'.encode() for i in range(EVENT_COUNT)]
+        return [
+            ("GET /api/products/", False, [products.content]),
+            ("dashboard HTML", False, [dashboard.content]),
+            ("NDJSON export stream", True, list(export.streaming_content)),
+            (f"{EVENT_COUNT} SSE events", True, events),
+        ]
+
+    @staticmethod
+    def _case(payload, encoding, level, size, wire, compress_ms, decompress_ms, mbps):
+        transfer_ms = wire * 8 / (mbps * 1e6) * 1000
+        return {"payload": payload, "encoding": encoding, "level": level, "body_bytes": size, "wire_bytes": wire,
+                "ratio": size / wire if wire else 0.0, "compress_ms": compress_ms, "decompress_ms": decompress_ms,
+                "transfer_ms": transfer_ms, "total_ms": compress_ms + transfer_ms + decompress_ms}
+
+    @staticmethod
+    def _time(function, repeat):
+        samples = []
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            function()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,97 @@
+# inventory_api/management/commands/bench_json.py
+import io
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from inventory_api.fastjson import ORJSONParser, ORJSONRenderer, dumps
+from inventory_api.models import Product, Sku
+from inventory_api.serializers import ProductSerializer
+from inventory_api.stock import sku_inventory
+from inventory_api.views import ProductListCreateAPIView
+from inventory_api.warehouses import use_warehouse, warehouse_option
+
+
+def legacy_prompt_inventory(warehouse):
+    """The query prompt's inventory JSON as it was built before fastjson: converted per row, then json.dumps."""
+    skus = (
+        Sku.objects.filter(warehouse_id=warehouse.pk, lot_count__gt=0)
+        .order_by("earliest_expiry", "id")
+        .values_list("id", "name", "price", "total_quantity", "earliest_expiry")
+    )
+    rows = [
+        {"id": pk, "product_name": name, "price": float(price), "quantity": quantity,
+         "expiry_date": earliest_expiry.isoformat()}
+        for pk, name, price, quantity, earliest_expiry in skus
+    ]
+    return json.dumps(rows, separators=(',', ':'))
+
+
+class Command(BaseCommand):
+    help = ("Times JSON encoding and decoding of the API's payloads with DRF's json-module classes and with "
+            "the orjson ones in inventory_api/fastjson.py, on the warehouse's data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--warehouse", help="Warehouse whose lots and SKUs are used (default: the default one).")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case; the median is shown (default: 5).")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        warehouse = warehouse_option(options["warehouse"])
+        lots = Product.objects.filter(warehouse=warehouse).count()
+        if not lots:
+            raise CommandError(f"Warehouse '{warehouse.code}' has no stock lots; seed it with "
+                               "`manage.py seed_products --count 20000` first.")
+
+        products = ProductSerializer(Product.objects.filter(warehouse=warehouse), many=True).data
+        body = JSONRenderer().render(products)
+        factory = APIRequestFactory()
+
+        def get_products(renderer):
+            view = ProductListCreateAPIView.as_view(renderer_classes=[renderer])
+            with use_warehouse(warehouse):
+                return view(factory.get("/api/products/")).render().content
+
+        cases = [
+            ("GET /api/products/", lambda: get_products(JSONRenderer), lambda: get_products(ORJSONRenderer)),
+            ("render lots", lambda: JSONRenderer().render(products), lambda: ORJSONRenderer().render(products)),
+            ("parse lots", lambda: JSONParser().parse(io.BytesIO(body)), lambda: ORJSONParser().parse(io.BytesIO(body))),
+            ("prompt inventory", lambda: legacy_prompt_inventory(warehouse),
+             lambda: dumps(sku_inventory(warehouse)).decode()),
+        ]
+
+        results = []
+        for name, before, after in cases:
+            # Both sides must produce the same document (or, parsing, the same data).
+            same = before() == after() if name == "parse lots" else json.loads(before()) == json.loads(after())
+            if not same:
+                raise CommandError(f"{name}: the orjson output differs from the json module's.")
+            stdlib_ms, orjson_ms = self._time(before, options["repeat"]), self._time(after, options["repeat"])
+            results.append({"case": name, "stdlib_ms": stdlib_ms, "orjson_ms": orjson_ms,
+                            "speedup": stdlib_ms / orjson_ms if orjson_ms else None})
+
+        skus = Sku.objects.filter(warehouse=warehouse, lot_count__gt=0).count()
+        if options["json"]:
+            self.stdout.write(json.dumps({"lots": lots, "skus": skus, "payload_bytes": len(body),
+                                          "results": results}, indent=2))
+            return
+        self.stdout.write(f"{lots} lots ({len(body) / 1e6:.1f} MB as JSON), {skus} SKUs, "
+                          f"median of {options['repeat']} runs:")
+        for result in results:
+            self.stdout.write(f"  {result['case']:<20} json {result['stdlib_ms']:8.1f} ms   "
+                              f"orjson {result['orjson_ms']:8.1f} ms   {result['speedup']:5.1f}x")
+        self.stdout.write(self.style.SUCCESS("Outputs are identical."))
+
+    @staticmethod
+    def _time(function, repeat):
+        samples = []
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            function()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,76 @@
+# inventory_api/management/commands/bench_product_list.py
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import generics
+from rest_framework.test import APIRequestFactory
+
+from inventory_api.fastjson import ORJSONRenderer
+from inventory_api.models import Product
+from inventory_api.serializers import ProductSerializer, product_rows
+from inventory_api.views import ProductListCreateAPIView
+from inventory_api.warehouses import use_warehouse, warehouse_option
+
+
+class SerializerProductListView(ProductListCreateAPIView):
+    """/api/products/ as it was: every row through ProductSerializer."""
+
+    def list(self, request, *args, **kwargs):
+        return generics.ListCreateAPIView.list(self, request, *args, **kwargs)
+
+
+class Command(BaseCommand):
+    help = ("Times GET /api/products/ through ProductSerializer and through the .values_list() path "
+            "(serializers.product_rows) on the warehouse's lots, and checks both send the same bytes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--warehouse", help="Warehouse whose lots are listed (default: the default one).")
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the median is shown (default: 3).")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        warehouse = warehouse_option(options["warehouse"])
+        lots = Product.objects.filter(warehouse=warehouse)
+        count = lots.count()
+        if not count:
+            raise CommandError(f"Warehouse '{warehouse.code}' has no stock lots; seed it with "
+                               "`manage.py seed_products --count 100000` first.")
+        renderer = ORJSONRenderer()
+        factory = APIRequestFactory()
+
+        def get(view_class):
+            with use_warehouse(warehouse):
+                return view_class.as_view()(factory.get("/api/products/")).render().content
+
+        cases = [
+            ("serialize", lambda: renderer.render(ProductSerializer(lots.all(), many=True).data),
+             lambda: renderer.render(product_rows(lots))),
+            ("GET /api/products/", lambda: get(SerializerProductListView), lambda: get(ProductListCreateAPIView)),
+        ]
+        results = []
+        for name, before, after in cases:
+            if before() != after():
+                raise CommandError(f"{name}: the .values_list() path sends different bytes than ProductSerializer.")
+            serializer_ms, fast_ms = self._time(before, options["repeat"]), self._time(after, options["repeat"])
+            results.append({"case": name, "serializer_ms": serializer_ms, "values_list_ms": fast_ms,
+                            "speedup": serializer_ms / fast_ms if fast_ms else None})
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"lots": count, "results": results}, indent=2))
+            return
+        self.stdout.write(f"{count} lots, median of {options['repeat']} runs:")
+        for result in results:
+            self.stdout.write(f"  {result['case']:<20} ProductSerializer {result['serializer_ms']:8.1f} ms   "
+                              f".values_list() {result['values_list_ms']:8.1f} ms   {result['speedup']:5.1f}x")
+        self.stdout.write(self.style.SUCCESS("Both paths send identical bytes."))
+
+    @staticmethod
+    def _time(function, repeat):
+        samples = []
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            function()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
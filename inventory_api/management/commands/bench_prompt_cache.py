@@ -0,0 +1,144 @@
+import json
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory_api.models import Product
+from inventory_api.prompts import QUERY_SYSTEM_PROMPT, build_query_prompt
+
+QUERIES = [
+    "how many items are running low?",
+    "change the price of Avocado to 60",
+    "add 10 units of bubbly chocolate at 50rs each, expiring in 90 days",
+    "delete expired items",
+    "which products expire this week?",
+]
+
+
+def build_legacy_prompt(inventory_json: str, user_query: str, today: date) -> str:
+    """The pre-restructuring layout: date and inventory before the rules and examples."""
+    role, rules = QUERY_SYSTEM_PROMPT.split("\n\n", 1)
+    return (
+        f"{role}\n\nThe current date is {today.isoformat()}.\n\n"
+        f"The current inventory data is: {inventory_json}\n\n{rules}\n"
+        "Now, process the following user request. Follow the rules and output formats precisely.\n\n"
+        f'The user\'s query is: "{user_query}"\n'
+    )
+
+
+def synthetic_inventory(count: int, rng: random.Random) -> list:
+    today = date.today()
+    return [
+        {
+            "id": i + 1,
+            "product_name": f"Product {i + 1}",
+            "price": round(rng.uniform(5, 500), 2),
+            "quantity": rng.randint(0, 300),
+            "expiry_date": (today + timedelta(days=rng.randint(-10, 365))).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Measures Ollama time-to-first-token for the legacy and the cache-friendly query prompt layouts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="", help="Ollama base URL (default: OLLAMA_CONFIG['URL']).")
+        parser.add_argument("--iterations", type=int, default=10, help="Requests per layout (after warm-up).")
+        parser.add_argument("--synthetic", type=int, default=0,
+                            help="Use N generated products instead of the database inventory.")
+        parser.add_argument("--no-mutate", action="store_true",
+                            help="Keep the inventory fixed (by default one row changes per request, "
+                                 "as it would after an executed action).")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        config = getattr(settings, "OLLAMA_CONFIG", {})
+        base_url = (options["url"] or config.get("URL", "http://localhost:11434")).rstrip("/")
+        rng = random.Random(options["seed"])
+
+        if options["synthetic"]:
+            inventory = synthetic_inventory(options["synthetic"], rng)
+        else:
+            inventory = list(Product.objects.values('id', 'product_name', 'price', 'quantity', 'expiry_date'))
+            for item in inventory:
+                item['expiry_date'] = item['expiry_date'].isoformat()
+                item['price'] = float(item['price'])
+        if not inventory:
+            raise CommandError("The inventory is empty; seed the database or pass --synthetic N.")
+
+        self.stdout.write(f"Benchmarking {base_url} with {len(inventory)} products, "
+                          f"{options['iterations']} requests per layout...")
+        results = {}
+        for layout in ("legacy", "stable_prefix"):
+            samples = []
+            # One warm-up request loads the model and primes the cache.
+            for i in range(options["iterations"] + 1):
+                if not options["no_mutate"]:
+                    row = rng.choice(inventory)
+                    row["quantity"] = rng.randint(0, 300)
+                inventory_json = json.dumps(inventory, separators=(',', ':'))
+                query = QUERIES[i % len(QUERIES)]
+                if layout == "legacy":
+                    payload = {"prompt": build_legacy_prompt(inventory_json, query, date.today())}
+                else:
+                    system, prompt = build_query_prompt(inventory_json, query)
+                    payload = {"system": system, "prompt": prompt}
+                sample = self._measure(base_url, config, payload)
+                if i > 0:
+                    samples.append(sample)
+            results[layout] = samples
+            self._report(layout, samples)
+
+        legacy = statistics.median(s["ttft"] for s in results["legacy"])
+        stable = statistics.median(s["ttft"] for s in results["stable_prefix"])
+        if stable > 0:
+            self.stdout.write(self.style.SUCCESS(f"Median TTFT speedup: {legacy / stable:.2f}x"))
+
+    def _measure(self, base_url, config, payload):
+        body = {
+            "model": config.get("MODEL", "phi3-finetuned-inventoryV2"),
+            "stream": True,
+            "format": "json",
+            "keep_alive": config.get("KEEP_ALIVE", "30m"),
+            **payload,
+        }
+        started = time.perf_counter()
+        ttft = None
+        final = {}
+        try:
+            with requests.post(f"{base_url}/api/generate", json=body, stream=True,
+                               timeout=config.get("TIMEOUT", 180)) as response:
+                if response.status_code != 200:
+                    raise CommandError(f"Ollama returned {response.status_code}: {response.text[:200]}")
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if ttft is None and chunk.get("response"):
+                        ttft = time.perf_counter() - started
+                    if chunk.get("done"):
+                        final = chunk
+        except requests.RequestException as e:
+            raise CommandError(f"Could not reach Ollama at {base_url}: {e}")
+        total = time.perf_counter() - started
+        return {
+            "ttft": ttft if ttft is not None else total,
+            "total": total,
+            "prompt_eval_count": final.get("prompt_eval_count", 0),
+        }
+
+    def _report(self, layout, samples):
+        ttfts = sorted(s["ttft"] * 1000 for s in samples)
+        totals = [s["total"] * 1000 for s in samples]
+        evals = [s["prompt_eval_count"] for s in samples]
+        self.stdout.write(
+            f"{layout:<14} TTFT p50 {statistics.median(ttfts):8.1f} ms  mean {statistics.fmean(ttfts):8.1f} ms  "
+            f"total mean {statistics.fmean(totals):8.1f} ms  evaluated prompt tokens mean {statistics.fmean(evals):8.0f}"
+        )
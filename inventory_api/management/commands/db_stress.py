@@ -0,0 +1,201 @@
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from inventory_api.management.commands.loadtest import percentile
+from inventory_api.models import Product, Sku, StockMovement, normalize_sku_name
+from inventory_api.rollups import refresh_today
+from inventory_api.stock import Movement, apply_movements, refresh_sku_totals
+
+STRESS_PREFIX = "__db_stress__ "
+DEFAULT_MIX = "update=5,insert=3,delete=1,read=1"
+WRITE_OPS = ("update", "insert", "delete")
+
+
+class Command(BaseCommand):
+    help = ("Hammers the database with concurrent writes (quantity updates, inserts, deletes) and reports "
+            "throughput, latency and lock errors, for the current DB_PROFILE or several with --compare.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent writers.")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run.")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Operation weights (default: {DEFAULT_MIX}).")
+        parser.add_argument("--rows", type=int, default=50, help="Rows the update operations contend on.")
+        parser.add_argument("--compare", default="",
+                            help="Comma-separated DB_PROFILE values to run one after another, each in its own "
+                                 "process and (for SQLite) on a scratch copy of the database, e.g. sqlite-basic,sqlite.")
+        parser.add_argument("--json", dest="json_output", action="store_true", help="Print the result as JSON.")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options["compare"]:
+            return self._compare(options)
+        result = self._run(options)
+        if options["json_output"]:
+            self.stdout.write(json.dumps(result))
+        else:
+            self._report([result])
+
+    # --- Single profile ---
+
+    def _run(self, options):
+        mix = {}
+        for part in options["mix"].split(","):
+            name, _, weight = part.partition("=")
+            if name.strip() not in WRITE_OPS + ("read",):
+                raise CommandError(f"Unknown operation '{name}'. Use update, insert, delete or read.")
+            mix[name.strip()] = float(weight or 1)
+        ops, weights = zip(*mix.items())
+
+        self._cleanup()
+        expiry = date.today() + timedelta(days=30)
+        sku = Sku.objects.create(name=f"{STRESS_PREFIX}rows", price=10)
+        Product.objects.bulk_create(
+            Product(sku=sku, warehouse_id=sku.warehouse_id, product_name=sku.name, price=10, quantity=100,
+                    expiry_date=expiry + timedelta(days=i))
+            for i in range(options["rows"])
+        )
+        refresh_sku_totals([sku.pk])
+        refresh_today()
+        lots = list(sku.lots.only("id", "sku_id", "product_name"))
+
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        stop_at = time.monotonic() + options["duration"]
+        seed = options["seed"]
+
+        def worker(n):
+            rng = random.Random(None if seed is None else seed + n)
+            own = []
+            try:
+                while time.monotonic() < stop_at:
+                    op = rng.choices(ops, weights)[0]
+                    started = time.perf_counter()
+                    try:
+                        self._operation(op, rng, lots, own, expiry)
+                    except OperationalError as e:
+                        with lock:
+                            errors["locked" if "locked" in str(e) else "operational"] += 1
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies[op].append(elapsed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options["threads"])]
+        wall_started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_started
+
+        self._cleanup()
+
+        db = settings.DATABASES["default"]
+        writes = sum(len(latencies[op]) for op in WRITE_OPS)
+        return {
+            "profile": os.getenv("DB_PROFILE", "sqlite"),
+            "engine": db["ENGINE"].rsplit(".", 1)[-1],
+            "threads": options["threads"],
+            "seconds": round(wall, 2),
+            "writes": writes,
+            "writes_per_second": round(writes / wall, 1) if wall else 0.0,
+            "errors": dict(errors),
+            "operations": {
+                op: {
+                    "count": len(values),
+                    "p50_ms": round(percentile(sorted(values), 50) * 1000, 2),
+                    "p95_ms": round(percentile(sorted(values), 95) * 1000, 2),
+                    "p99_ms": round(percentile(sorted(values), 99) * 1000, 2),
+                }
+                for op, values in sorted(latencies.items())
+            },
+        }
+
+    def _cleanup(self):
+        Sku.objects.filter(name_key__startswith=normalize_sku_name(STRESS_PREFIX)).delete()
+        StockMovement.objects.filter(product_name__startswith=STRESS_PREFIX.strip()).delete()
+
+    def _operation(self, op, rng, lots, own, expiry):
+        if op == "update":
+            # Atomic quantity change plus ledger entry, like the adjust endpoints.
+            lot = rng.choice(lots)
+            apply_movements([Movement(lot, rng.choice((-1, 1)) * rng.randint(1, 3), StockMovement.Kind.ADJUSTMENT)],
+                            source="db_stress")
+        elif op == "insert":
+            product = Product.objects.create(
+                product_name=f"{STRESS_PREFIX}new", price=rng.randint(1, 500),
+                quantity=rng.randint(1, 200), expiry_date=expiry,
+            )
+            own.append(product.pk)
+        elif op == "delete":
+            if own:
+                Product.objects.filter(pk=own.pop()).delete()
+        else:
+            list(Product.objects.values("id", "product_name", "quantity")[:200])
+
+    # --- Several profiles ---
+
+    def _compare(self, options):
+        profiles = [p.strip() for p in options["compare"].split(",") if p.strip()]
+        source = settings.DATABASES["default"]["NAME"]
+        results = []
+        with tempfile.TemporaryDirectory() as scratch:
+            for profile in profiles:
+                env = dict(os.environ, DB_PROFILE=profile)
+                if profile.startswith("sqlite"):
+                    # A fresh copy in rollback-journal mode, so WAL set by an earlier run does not carry over.
+                    copy = os.path.join(scratch, f"{profile}.sqlite3")
+                    shutil.copyfile(source, copy)
+                    with sqlite3.connect(copy) as conn:
+                        conn.execute("PRAGMA journal_mode=DELETE")
+                    env["SQLITE_PATH"] = copy
+                command = [
+                    sys.executable, sys.argv[0], "db_stress", "--json",
+                    "--threads", str(options["threads"]), "--duration", str(options["duration"]),
+                    "--mix", options["mix"], "--rows", str(options["rows"]),
+                ]
+                if options["seed"] is not None:
+                    command += ["--seed", str(options["seed"])]
+                self.stderr.write(f"Running {profile}...")
+                completed = subprocess.run(command, env=env, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    raise CommandError(f"{profile} run failed:\n{completed.stderr[-2000:]}")
+                results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        if options["json_output"]:
+            self.stdout.write(json.dumps(results))
+        else:
+            self._report(results)
+
+    def _report(self, results):
+        header = f"{'profile':<14}{'op':<8}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for result in results:
+            for op, stats in result["operations"].items():
+                self.stdout.write(f"{result['profile']:<14}{op:<8}{stats['count']:>8}"
+                                  f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+        self.stdout.write("")
+        for result in results:
+            errors = ", ".join(f"{k}={v}" for k, v in result["errors"].items()) or "none"
+            self.stdout.write(self.style.SUCCESS(
+                f"{result['profile']}: {result['writes_per_second']} writes/s with {result['threads']} threads "
+                f"over {result['seconds']}s (errors: {errors})"
+            ))
@@ -0,0 +1,129 @@
+# inventory_api/management/commands/evaluate_model.py
+import json
+from contextlib import ExitStack
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from inventory_api.cassettes import MODES, RECORD, REPLAY, Cassette, use_cassette
+from inventory_api.evaluation import load_cases, load_inventory, run_case, summarize
+from inventory_api.views import ProposeActionAPIView
+from inventory_api.warehouses import default_warehouse, forget_warehouses, use_warehouse, warehouse_option
+
+
+class Command(BaseCommand):
+    help = ("Runs a JSONL suite of queries through the query view and reports action and field accuracy, "
+            "latency and tokens per second (see inventory_api/evaluation.py). With --cassette the model calls "
+            "are recorded, or replayed without a model server.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", help="JSONL file of {\"id\", \"query\", \"expected\"} cases.")
+        parser.add_argument("--inventory",
+                            help="CSV fixture (product_name, price, quantity, expires_in_days) to run against, "
+                                 "in a scratch database. Without it the cases run against the current inventory.")
+        parser.add_argument("--warehouse", help="Warehouse to run against without --inventory (default: the default one).")
+        parser.add_argument("--cassette", help="Cassette file to record the model calls to or replay them from.")
+        parser.add_argument("--mode", choices=MODES, default=REPLAY,
+                            help="record: call the model and write the cassette; replay: answer from it (default).")
+        parser.add_argument("--date", type=date.fromisoformat,
+                            help="Date the prompts are written for, YYYY-MM-DD (default: the cassette's when "
+                                 "replaying, else today).")
+        parser.add_argument("--show-failures", type=int, default=10,
+                            help="Failed cases to print in detail (default: 10).")
+        parser.add_argument("--min-action-accuracy", type=float,
+                            help="Fail (exit status 1) when the action accuracy is below this fraction.")
+        parser.add_argument("--json", action="store_true", help="Print the summary and every case as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            cases = load_cases(options["dataset"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read the suite: {e}")
+        if not cases:
+            raise CommandError(f"{options['dataset']} has no cases.")
+
+        cassette = None
+        today = options["date"]
+        if options["cassette"]:
+            if options["mode"] == RECORD:
+                today = today or date.today()
+                model = getattr(settings, "OLLAMA_CONFIG", {}).get("MODEL", "")
+                cassette = Cassette(options["cassette"], RECORD,
+                                    meta={"model": model, "date": today.isoformat(), "suite": options["dataset"]})
+            else:
+                try:
+                    cassette = Cassette(options["cassette"], REPLAY)
+                except (OSError, ValueError) as e:
+                    raise CommandError(f"Cannot read the cassette: {e}")
+                if today is None and cassette.meta.get("date"):
+                    today = date.fromisoformat(cassette.meta["date"])
+        today = today or date.today()
+
+        with ExitStack() as stack:
+            if options["inventory"]:
+                # A scratch database, so lot ids, and with them the prompts, are the same on every run.
+                old_config = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+                stack.callback(teardown_databases, old_config, verbosity=0)
+                stack.callback(forget_warehouses)
+                forget_warehouses()
+                warehouse = default_warehouse()
+                try:
+                    load_inventory(options["inventory"], warehouse, today)
+                except (OSError, ValueError) as e:
+                    raise CommandError(f"Cannot load the inventory: {e}")
+            else:
+                warehouse = warehouse_option(options["warehouse"])
+            stack.enter_context(use_warehouse(warehouse))
+            if cassette is not None:
+                stack.enter_context(use_cassette(cassette))
+
+            view = ProposeActionAPIView()
+            results = []
+            for case in cases:
+                result = run_case(view, case, warehouse, today)
+                results.append(result)
+                if not options["json"]:
+                    mark = self.style.SUCCESS("ok  ") if result.action_ok and not result.mismatches \
+                        else self.style.ERROR("FAIL")
+                    self.stdout.write(f"{mark} {result.id:<20} {result.expected_action:<19} -> "
+                                      f"{result.action:<19} {result.fields_ok}/{result.fields_total} fields "
+                                      f"{result.seconds * 1000:7.0f} ms")
+
+        summary = summarize(results)
+        if options["json"]:
+            self.stdout.write(json.dumps({
+                "summary": summary,
+                "date": today.isoformat(),
+                "cases": [{**vars(r), "action_ok": r.action_ok} for r in results],
+            }, indent=2, default=str))
+        else:
+            self._report(results, summary, options["show_failures"])
+
+        threshold = options["min_action_accuracy"]
+        if threshold is not None and summary["action_accuracy"] < threshold:
+            raise CommandError(f"Action accuracy {summary['action_accuracy']:.1%} is below {threshold:.1%}.")
+
+    def _report(self, results, summary, show_failures):
+        failures = [r for r in results if not r.action_ok or r.mismatches]
+        for result in failures[:show_failures]:
+            self.stdout.write(self.style.WARNING(f"\n{result.id}: {result.query}"))
+            if not result.action_ok:
+                self.stdout.write(f"  action: expected {result.expected_action}, got {result.action}")
+            for name, expected, got in result.mismatches:
+                self.stdout.write(f"  {name}: expected {expected!r}, got {got!r}")
+
+        field_accuracy = summary["field_accuracy"]
+        tokens_per_second = summary["tokens_per_second"]
+        self.stdout.write("")
+        for action, accuracy in summary["action_accuracy_by_action"].items():
+            self.stdout.write(f"  {action:<19} {accuracy:.0%}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['cases']} cases{' (replayed)' if summary['replayed'] else ''}: "
+            f"action accuracy {summary['action_accuracy']:.1%}, "
+            f"field accuracy {'-' if field_accuracy is None else f'{field_accuracy:.1%}'}, "
+            f"{summary['exact_matches']} exact; latency p50 {summary['latency_p50_ms']:.0f} ms, "
+            f"p95 {summary['latency_p95_ms']:.0f} ms; "
+            f"{'-' if tokens_per_second is None else f'{tokens_per_second:.1f}'} tokens/s."
+        ))
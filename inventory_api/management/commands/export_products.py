@@ -0,0 +1,43 @@
+# inventory_api/management/commands/export_products.py
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory_api.bulk_io import FORMATS, export_chunks
+from inventory_api.management.commands.import_products import guess
+from inventory_api.models import Product
+from inventory_api.warehouses import warehouse_option
+
+
+class Command(BaseCommand):
+    help = "Exports a warehouse's stock lots as CSV or NDJSON, streamed (see inventory_api/bulk_io.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="Output file, or - for stdout (the default).")
+        parser.add_argument("--format", choices=FORMATS, help="File format (default: from the file name, else csv).")
+        parser.add_argument("--compress", choices=["zstd"], help="Compress with zstd (default: when the file ends in .zst).")
+        parser.add_argument("--warehouse", help="Code of the warehouse to export (default: the default one).")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format, compression = guess(path)
+        file_format = options["format"] or file_format or "csv"
+        compression = options["compress"] or (compression if compression == "zstd" else None)
+        lots = Product.objects.filter(warehouse=warehouse_option(options["warehouse"]))
+
+        started = time.perf_counter()
+        written = 0
+        out = sys.stdout.buffer if path == "-" else open(path, "wb")
+        try:
+            for chunk in export_chunks(file_format, compression, lots):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is sys.stdout.buffer:
+                out.flush()
+            else:
+                out.close()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if path != "-":
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {path} in {elapsed_ms:.0f} ms."))
@@ -0,0 +1,48 @@
+# inventory_api/management/commands/forecast_inventory.py
+import json
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory_api.forecasting import MODELS, at_risk, to_records
+from inventory_api.warehouses import warehouse_option
+
+
+class Command(BaseCommand):
+    help = "Forecast waste and stock-outs and list the SKUs at risk, highest expected loss first."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--horizon", type=int, help="Days ahead to forecast (default: FORECAST_HORIZON_DAYS).")
+        parser.add_argument("--window", type=int, help="Days of ledger history for consumption rates.")
+        parser.add_argument("--model", choices=MODELS, help="Consumption-rate model (default: FORECAST_MODEL).")
+        parser.add_argument("--date", help="Forecast as of this date (YYYY-MM-DD) instead of today.")
+        parser.add_argument("--limit", type=int, default=20, help="Rows to print (default: 20).")
+        parser.add_argument("--min-loss", type=float, default=0.0, help="Only list SKUs with a higher expected loss.")
+        parser.add_argument("--warehouse", help="Only this warehouse's SKUs (default: the whole catalogue).")
+        parser.add_argument("--json", action="store_true", help="Print JSON instead of a table.")
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options["date"]) if options["date"] else None
+        except ValueError:
+            raise CommandError(f"Invalid --date: {options['date']}")
+        warehouse = warehouse_option(options["warehouse"]) if options["warehouse"] else None
+
+        started = time.perf_counter()
+        risky = at_risk(today, options["horizon"], options["window"], options["model"], options["min_loss"],
+                        warehouse)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if options["json"]:
+            self.stdout.write(json.dumps(to_records(risky.head(options["limit"])), indent=2))
+            return
+        if risky.empty:
+            self.stdout.write(self.style.SUCCESS(f"No SKUs at risk ({elapsed_ms:.0f} ms)."))
+            return
+        if options["limit"] > 0:
+            self.stdout.write(risky.head(options["limit"]).to_string(index=False))
+        self.stdout.write(
+            f"{len(risky)} SKUs at risk, total expected loss {risky['expected_loss'].sum():.2f} "
+            f"(forecast in {elapsed_ms:.0f} ms)."
+        )
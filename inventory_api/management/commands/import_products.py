@@ -0,0 +1,68 @@
+# inventory_api/management/commands/import_products.py
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory_api.bulk_io import COMPRESSIONS, FORMATS, MODES, READ_ERRORS, import_stream
+from inventory_api.warehouses import warehouse_option
+
+SUFFIXES = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+COMPRESSED_SUFFIXES = {".zst": "zstd", ".gz": "gzip"}
+
+
+def guess(path):
+    """(format, compression) from a file name such as lots.csv.zst."""
+    compression = None
+    for suffix, name in COMPRESSED_SUFFIXES.items():
+        if path.endswith(suffix):
+            compression, path = name, path[:-len(suffix)]
+    file_format = next((name for suffix, name in SUFFIXES.items() if path.endswith(suffix)), None)
+    return file_format, compression
+
+
+class Command(BaseCommand):
+    help = "Imports stock lots from a CSV or NDJSON file, streamed and saved in chunks (see inventory_api/bulk_io.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin. .zst and .gz files are decompressed.")
+        parser.add_argument("--format", choices=FORMATS, help="File format (default: from the file name, else csv).")
+        parser.add_argument("--compression", choices=COMPRESSIONS, help="Compression (default: from the file name).")
+        parser.add_argument("--mode", choices=MODES, default="add",
+                            help="add: rows are received stock (default); set: rows are counted quantities.")
+        parser.add_argument("--warehouse", help="Code of the warehouse to import into (default: the default one).")
+        parser.add_argument("--errors", type=int, default=20, help="Invalid rows to print (default: 20).")
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format, compression = guess(path)
+        file_format = options["format"] or file_format or "csv"
+        compression = options["compression"] or compression
+        warehouse = warehouse_option(options["warehouse"])
+
+        started = time.perf_counter()
+        try:
+            stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+        try:
+            with stream:
+                summary = import_stream(stream, file_format, options["mode"], compression, source="import",
+                                        warehouse=warehouse)
+        except READ_ERRORS as e:
+            raise CommandError(f"Could not read {path}: {e} (chunks before the error were saved).")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if options["json"]:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        for error in summary["errors"][:options["errors"]]:
+            problems = "; ".join(f"{field}: {message}" for field, message in error["errors"].items())
+            self.stdout.write(self.style.WARNING(f"line {error['line']}: {problems}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['imported']} of {summary['rows']} rows in {elapsed_ms:.0f} ms: "
+            f"{summary['created_skus']} new SKUs, {summary['created_lots']} new lots, "
+            f"{summary['updated_lots']} lots updated, {summary['failed']} rows rejected."
+        ))
@@ -0,0 +1,256 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+# Scenario name -> default weight. Each scenario is one user interaction and
+# may hit several endpoints (e.g. propose then execute).
+DEFAULT_MIX = "list=10,query=3,propose_execute=3,scan=2"
+
+QUESTIONS = [
+    "how many items are running low?",
+    "which products expire this week?",
+    "what is the total stock value?",
+]
+ITEMS = ["Load Test Bread", "Load Test Milk", "Load Test Eggs", "Load Test Rice", "Load Test Juice"]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise CommandError(f"Unknown scenario '{name}'. Available: {', '.join(SCENARIOS)}")
+        try:
+            weights[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for '{name}': {weight}")
+    if not weights or sum(weights.values()) <= 0:
+        raise CommandError("The traffic mix must contain at least one scenario with a positive weight.")
+    return weights
+
+
+class Recorder:
+    """Thread-safe collection of per-endpoint and per-scenario latencies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, key, seconds, ok=True):
+        with self._lock:
+            self.latencies[key].append(seconds)
+            if not ok:
+                self.errors[key] += 1
+
+
+class Client:
+    """Wraps one requests.Session and records every call it makes."""
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def call(self, method, path, label=None, ok_statuses=(200, 201, 202, 204), **kwargs):
+        label = label or f"{method} {path}"
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            self.recorder.add(label, time.perf_counter() - started, response.status_code in ok_statuses)
+            return response
+        except requests.RequestException:
+            self.recorder.add(label, time.perf_counter() - started, ok=False)
+            return None
+
+
+def _json(response):
+    if response is None or not response.content:
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def scenario_list(client, rng, options):
+    response = client.call("GET", "/api/products/")
+    return response is not None and response.status_code == 200
+
+
+def scenario_query(client, rng, options):
+    response = client.call("POST", "/api/query/", json={"query": rng.choice(QUESTIONS)})
+    return response is not None and response.status_code == 200
+
+
+def scenario_propose_execute(client, rng, options):
+    if rng.random() < 0.7:
+        query = (f"add {rng.randint(1, 200)} units of {rng.choice(ITEMS)} at {rng.randint(10, 500)}rs each, "
+                 f"expiring in {rng.randint(1, 90)} days")
+    else:
+        query = f"change the price of {rng.choice(ITEMS)} to {rng.randint(10, 500)}"
+    proposal = _json(client.call("POST", "/api/query/", json={"query": query}))
+    if not proposal or proposal.get("action") not in ("CREATE", "UPDATE"):
+        return proposal is not None
+    response = client.call("POST", "/api/execute-action/", json=proposal)
+    return response is not None and response.status_code in (200, 201)
+
+
+def scenario_scan(client, rng, options):
+    gemini_url = options["gemini_url"]
+    if gemini_url:
+        # What the Telegram bot does before it calls us: one structured extraction.
+        started = time.perf_counter()
+        try:
+            response = client.session.post(
+                f"{gemini_url.rstrip('/')}/v1beta/models/gemini-2.5-flash:generateContent",
+                json={"contents": [{"role": "user", "parts": [{"text": "Extract product data."}]}]},
+                timeout=client.timeout,
+            )
+            ok = response.status_code == 200
+            client.recorder.add("gemini extract", time.perf_counter() - started, ok)
+            if not ok:
+                return False
+            part = response.json()["candidates"][0]["content"]["parts"][0]
+            payload = part["functionCall"]["args"] if "functionCall" in part else json.loads(part["text"])
+        except (requests.RequestException, KeyError, IndexError, ValueError):
+            client.recorder.add("gemini extract", time.perf_counter() - started, ok=False)
+            return False
+    else:
+        payload = {
+            "action": "CREATE",
+            "data": {"product_name": rng.choice(ITEMS), "price": None, "quantity": None,
+                     "expiry_date": "2030-01-01"},
+        }
+
+    response = client.call("POST", "/api/product/receive/", json=payload)
+    if response is None or response.status_code != 202:
+        return False
+    # The dashboard polls for the queued item and the reviewer confirms it.
+    proposal = _json(client.call("GET", "/api/product/check-scanned/"))
+    if not proposal:
+        return True
+    proposal.setdefault("data", {})
+    proposal["data"]["price"] = rng.randint(10, 500)
+    proposal["data"]["quantity"] = rng.randint(1, 100)
+    response = client.call("POST", "/api/execute-action/", json=proposal)
+    return response is not None and response.status_code in (200, 201)
+
+
+SCENARIOS = {
+    "list": scenario_list,
+    "query": scenario_query,
+    "propose_execute": scenario_propose_execute,
+    "scan": scenario_scan,
+}
+
+
+class Command(BaseCommand):
+    help = "Drives a running server with a realistic mix of API traffic and reports latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--gemini-url", default="",
+                            help="Gemini stub base URL (e.g. http://127.0.0.1:11436) to include extraction in scans.")
+        parser.add_argument("--rps", type=float, default=5.0, help="Target scenario starts per second.")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for.")
+        parser.add_argument("--concurrency", type=int, default=32, help="Maximum in-flight scenarios.")
+        parser.add_argument("--mix", default=DEFAULT_MIX,
+                            help=f"Scenario weights, e.g. '{DEFAULT_MIX}'. Available: {', '.join(SCENARIOS)}.")
+        parser.add_argument("--timeout", type=float, default=200.0, help="Per-request timeout in seconds.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--json", dest="json_path", default="", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        if options["rps"] <= 0 or options["duration"] <= 0:
+            raise CommandError("--rps and --duration must be positive.")
+        weights = parse_mix(options["mix"])
+        names, cumulative, total = [], [], 0.0
+        for name, weight in weights.items():
+            total += weight
+            names.append(name)
+            cumulative.append(total)
+
+        rng = random.Random(options["seed"])
+        recorder = Recorder()
+        local = threading.local()
+
+        def run(name, scheduled_at, scenario_seed):
+            if not hasattr(local, "client"):
+                local.client = Client(options["base_url"], recorder, options["timeout"])
+            ok = False
+            try:
+                ok = SCENARIOS[name](local.client, random.Random(scenario_seed), options)
+            finally:
+                # Measured from the scheduled start so queueing in the generator
+                # shows up in the numbers instead of being silently omitted.
+                recorder.add(f"scenario {name}", time.perf_counter() - scheduled_at, ok)
+
+        self.stdout.write(
+            f"Running {options['duration']:.0f}s at {options['rps']} rps against {options['base_url']} "
+            f"(mix: {', '.join(f'{n}={w:g}' for n, w in weights.items())})..."
+        )
+        interval = 1.0 / options["rps"]
+        started = time.perf_counter()
+        issued = 0
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            while True:
+                scheduled_at = started + issued * interval
+                if scheduled_at - started >= options["duration"]:
+                    break
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pick = rng.random() * total
+                name = next(n for n, c in zip(names, cumulative) if pick < c)
+                pool.submit(run, name, scheduled_at, rng.getrandbits(32))
+                issued += 1
+        elapsed = time.perf_counter() - started
+
+        report = self._report(recorder, elapsed)
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump({"elapsed_seconds": elapsed, "issued": issued, "results": report}, f, indent=2)
+
+    def _report(self, recorder, elapsed):
+        rows = []
+        header = f"{'operation':<34}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}"
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for key in sorted(recorder.latencies, key=lambda k: (k.startswith("scenario"), k)):
+            values = sorted(recorder.latencies[key])
+            row = {
+                "operation": key,
+                "count": len(values),
+                "errors": recorder.errors[key],
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "throughput_rps": len(values) / elapsed if elapsed else 0.0,
+            }
+            rows.append(row)
+            self.stdout.write(
+                f"{key:<34}{row['count']:>8}{row['errors']:>8}{row['p50_ms']:>10.1f}"
+                f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['throughput_rps']:>9.2f}"
+            )
+        self.stdout.write(f"\nWall time: {elapsed:.1f}s")
+        return rows
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from inventory_api.search import install_search_index
+
+
+class Command(BaseCommand):
+    help = ("Re-creates the product name search index (SQLite FTS5 table and sync triggers, or the Postgres "
+            "pg_trgm index) and refills it from the SKU table.")
+
+    def handle(self, *args, **options):
+        with connection.schema_editor() as schema_editor:
+            install_search_index(schema_editor)
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt ({connection.vendor})."))
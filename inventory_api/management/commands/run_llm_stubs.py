@@ -0,0 +1,93 @@
+import time
+from django.core.management.base import BaseCommand
+from inventory_api.stub_servers import (
+    GeminiStubHandler,
+    LatencyModel,
+    OllamaStubHandler,
+    make_server,
+    start_in_thread,
+)
+
+
+class Command(BaseCommand):
+    help = "Runs local stand-ins for the Ollama and Gemini APIs for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--ollama-port", type=int, default=11435,
+                            help="Port for the Ollama stub (set OLLAMA_URL to match; 0 disables).")
+        parser.add_argument("--ollama-instances", type=int, default=1,
+                            help="Run N independent Ollama stubs on consecutive ports, to exercise the "
+                                 "backend pool (set OLLAMA_URLS to the printed list).")
+        parser.add_argument("--gemini-port", type=int, default=11436,
+                            help="Port for the Gemini stub (0 disables).")
+        parser.add_argument("--model", default="phi3-finetuned-inventoryV2",
+                            help="Model name reported by the Ollama stub.")
+        parser.add_argument("--num-parallel", type=int, default=0,
+                            help="Requests each Ollama stub generates at once, like OLLAMA_NUM_PARALLEL "
+                                 "(0 = unlimited).")
+        parser.add_argument("--latency-dist", choices=LatencyModel.DISTRIBUTIONS, default="lognormal")
+        parser.add_argument("--latency-ms", type=float, default=800.0,
+                            help="Mean Ollama generation latency in milliseconds.")
+        parser.add_argument("--latency-sigma", type=float, default=0.5,
+                            help="Shape parameter for the lognormal distribution.")
+        parser.add_argument("--ttft-fraction", type=float, default=0.25,
+                            help="Share of each generation spent before the first token.")
+        parser.add_argument("--prefill-ms-per-kchar", type=float, default=0.0,
+                            help="Emulate prompt caching: time to first token grows with the uncached "
+                                 "prompt length (ms per 1000 chars). 0 uses --ttft-fraction instead.")
+        parser.add_argument("--gemini-latency-ms", type=float, default=1500.0,
+                            help="Mean Gemini extraction latency in milliseconds.")
+        parser.add_argument("--error-rate", type=float, default=0.0,
+                            help="Fraction of requests answered with an injected error (0-1).")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--verbose", action="store_true", help="Log every request.")
+
+    def handle(self, *args, **options):
+        servers = []
+        seed = options["seed"]
+
+        ollama_urls = []
+        if options["ollama_port"]:
+            for i in range(max(1, options["ollama_instances"])):
+                latency = LatencyModel(options["latency_dist"], options["latency_ms"], options["latency_sigma"],
+                                       options["error_rate"], None if seed is None else seed + 100 * i)
+                server = make_server(
+                    OllamaStubHandler, options["host"], options["ollama_port"] + i, latency,
+                    model_name=options["model"], ttft_fraction=options["ttft_fraction"], verbose=options["verbose"],
+                    prefill_ms_per_kchar=options["prefill_ms_per_kchar"], num_parallel=options["num_parallel"],
+                )
+                servers.append(("Ollama", server))
+                ollama_urls.append("http://%s:%s" % server.server_address[:2])
+
+        if options["gemini_port"]:
+            latency = LatencyModel(options["latency_dist"], options["gemini_latency_ms"], options["latency_sigma"],
+                                   options["error_rate"], None if seed is None else seed + 1)
+            servers.append(("Gemini", make_server(
+                GeminiStubHandler, options["host"], options["gemini_port"], latency, verbose=options["verbose"],
+            )))
+
+        if not servers:
+            self.stderr.write("Both stubs are disabled; nothing to run.")
+            return
+
+        for name, server in servers:
+            start_in_thread(server)
+            host, port = server.server_address[:2]
+            self.stdout.write(self.style.SUCCESS(f"{name} stub listening on http://{host}:{port}"))
+        if len(ollama_urls) > 1:
+            self.stdout.write(f"OLLAMA_URLS={','.join(ollama_urls)}")
+        self.stdout.write(
+            f"Latency: {options['latency_dist']} (Ollama mean {options['latency_ms']}ms, "
+            f"Gemini mean {options['gemini_latency_ms']}ms), error rate {options['error_rate']:.1%}. Ctrl-C to stop."
+        )
+
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for _, server in servers:
+                server.shutdown()
+                server.server_close()
@@ -0,0 +1,90 @@
+# inventory_api/management/commands/run_llm_workers.py
+import os
+import signal
+import socket
+import threading
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from inventory_api.jobs import claim, purge_finished, run
+from inventory_api.models import LLMJob
+
+logger = logging.getLogger(__name__)
+
+# Seconds between deletions of old finished jobs.
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = ("Runs async /api/query/ jobs (?async=1) from the job table. Start as many of these "
+            "processes as the model servers can keep busy; they share the queue.")
+
+    def add_arguments(self, parser):
+        config = getattr(settings, "LLM_JOBS", {})
+        parser.add_argument("--workers", type=int, default=config.get("WORKERS", 4),
+                            help="Jobs this process runs at once (default: LLM_JOB_WORKERS).")
+        parser.add_argument("--poll-interval", type=float, default=config.get("POLL_INTERVAL", 0.5),
+                            help="Seconds an idle worker waits before looking for jobs again.")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once the queue is empty (including jobs sent back to wait for a busy "
+                                 "model) instead of polling for more.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        # Finish the jobs in hand on SIGTERM (and Ctrl-C) instead of abandoning them to the lease.
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        counts = {"done": 0, "failed": 0, "requeued": 0}
+        counts_lock = threading.Lock()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        def work(name):
+            try:
+                while not stop.is_set():
+                    job = claim(name)
+                    if job is None:
+                        if options["once"] and not LLMJob.objects.filter(status=LLMJob.Status.QUEUED).exists():
+                            return
+                        stop.wait(options["poll_interval"])
+                        continue
+                    try:
+                        outcome = run(job, name)
+                    except Exception:
+                        # E.g. the database was unavailable; the job's lease hands it to a worker later.
+                        logger.exception("LLM worker %s could not run job %s:", name, job.pk)
+                        outcome = "failed"
+                    with counts_lock:
+                        counts[outcome] += 1
+                    close_old_connections()
+            finally:
+                # Each thread opened its own database connection.
+                connection.close()
+
+        deleted = purge_finished()
+        threads = [threading.Thread(target=work, args=(f"{prefix}:{i}",), daemon=True)
+                   for i in range(max(1, options["workers"]))]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(threads)} LLM job workers running ({prefix}); removed {deleted} old jobs. Ctrl-C to stop."
+        ))
+
+        last_purge = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(1)
+                if time.monotonic() - last_purge >= PURGE_INTERVAL:
+                    last_purge = time.monotonic()
+                    purge_finished()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping after the running jobs...")
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS(
+            f"Answered {counts['done']} jobs, {counts['failed']} failed, {counts['requeued']} sent back to the queue."
+        ))
@@ -1,45 +1,211 @@
-import json
+# inventory_api/management/commands/seed_products.py
+import time
 from datetime import date, timedelta
-from django.core.management.base import BaseCommand
-from inventory_api.models import Product
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from inventory_api.models import Product, Sku, StockMovement
+from inventory_api.rollups import refresh_today
+from inventory_api.stock import receive_lot, refresh_sku_totals
+from inventory_api.warehouses import warehouse_option
+
+# (item, base price, shelf life in days) for the synthetic catalogue.
+ITEMS = [
+    ("Whole Milk", 1.20, 10), ("Greek Yogurt", 1.75, 25), ("Cheddar Cheese", 6.50, 60), ("Butter", 3.20, 60),
+    ("Double Cream", 1.90, 12), ("Free-Range Eggs", 5.00, 28), ("Sourdough Loaf", 3.25, 5), ("Croissants", 2.80, 4),
+    ("Baby Spinach", 2.99, 8), ("Avocado", 2.10, 6), ("Oranges", 3.50, 14), ("Apples", 2.60, 30),
+    ("Chicken Breast", 8.50, 4), ("Salmon Fillet", 12.00, 3), ("Artisanal Salami", 11.25, 40), ("Tofu", 2.40, 30),
+    ("Hummus", 4.20, 15), ("Fresh Pasta", 4.00, 7), ("Dried Spaghetti", 1.60, 540), ("Basmati Rice", 3.40, 720),
+    ("Oat Cereal", 3.90, 270), ("Coffee Beans", 14.00, 365), ("Green Tea", 3.10, 540), ("Kidney Beans", 0.95, 900),
+    ("Dark Chocolate", 2.50, 300), ("Potato Chips", 1.80, 120), ("Frozen Peas", 2.20, 365), ("Ice Cream", 5.50, 270),
+    ("Apple Juice", 3.99, 180), ("Kombucha", 4.75, 20), ("Craft Beer", 9.99, 180), ("Olive Oil", 8.50, 540),
+]
+BRAND_STARTS = ["Nor", "Sun", "Green", "Oak", "Silver", "River", "Hill", "Meadow", "Stone", "Brook", "Golden", "Wild",
+                "Clear", "North", "Maple", "Fair", "High", "Red", "Blue", "Pine", "Old", "Bright", "West", "Honey"]
+BRAND_ENDS = ["dale", "field", "vale", "ford", "wood", "brook", "farm", "gate", "leigh", "ton", "crest", "haven",
+              "mere", "side", "land", "well", "moor", "bury", "croft", "view", "ridge", "holm", "stead", "fold"]
+# (size, price multiplier)
+SIZES = [("Small", 0.6), ("250g", 0.8), ("500g", 1.0), ("1kg", 1.8), ("Family Size", 2.6), ("Twin Pack", 1.9)]
+
+SAMPLE_PRODUCTS = [
+    ("Organic Milk", 4.99, 45), ("Cheddar Cheese", 6.50, 60), ("Whole Wheat Bread", 3.25, 5), ("Greek Yogurt", 1.75, 25),
+    ("Free-Range Eggs", 5.00, 28), ("Apple Juice", 3.99, 180), ("Baby Spinach", 2.99, 8), ("Chicken Breast", 12.50, 3),
+    ("Avocado", 2.10, 6), ("Sourdough Loaf", 5.50, -2), ("Hummus", 4.20, 15), ("Almond Milk", 3.50, 50),
+    ("Salmon Fillet", 15.00, 1), ("Craft Beer 6-Pack", 14.99, 90), ("Bag of Oranges", 7.00, 12),
+    ("Imported Olives", 8.50, -30), ("Artisanal Salami", 11.25, 40), ("Kombucha", 4.75, 20), ("Fresh Pasta", 6.00, 0),
+    ("Premium Coffee Beans", 18.00, 365),
+]
+
 
 class Command(BaseCommand):
-    help = 'Seeds the database with initial product data.'
-
-    def handle(self, *args, **kwargs):
-        # Clear existing data to avoid duplicates
-        Product.objects.all().delete()
-        self.stdout.write(self.style.WARNING('Existing products deleted.'))
-
-        # Use a dynamic date for "today"
-        today = date.today()
-
-        # This is the dummy data from your project plan.
-        products_data = [
-            {"product_name": "Organic Milk", "price": 4.99, "expiry_date": (today + timedelta(days=45)).strftime('%Y-%m-%d')},
-            {"product_name": "Cheddar Cheese", "price": 6.50, "expiry_date": (today + timedelta(days=60)).strftime('%Y-%m-%d')},
-            {"product_name": "Whole Wheat Bread", "price": 3.25, "expiry_date": (today + timedelta(days=5)).strftime('%Y-%m-%d')},
-            {"product_name": "Greek Yogurt", "price": 1.75, "expiry_date": (today + timedelta(days=25)).strftime('%Y-%m-%d')},
-            {"product_name": "Free-Range Eggs", "price": 5.00, "expiry_date": (today + timedelta(days=28)).strftime('%Y-%m-%d')},
-            {"product_name": "Apple Juice", "price": 3.99, "expiry_date": (today + timedelta(days=180)).strftime('%Y-%m-%d')},
-            {"product_name": "Baby Spinach", "price": 2.99, "expiry_date": (today + timedelta(days=8)).strftime('%Y-%m-%d')},
-            {"product_name": "Chicken Breast", "price": 12.50, "expiry_date": (today + timedelta(days=3)).strftime('%Y-%m-%d')},
-            {"product_name": "Avocado", "price": 2.10, "expiry_date": (today + timedelta(days=6)).strftime('%Y-%m-%d')},
-            {"product_name": "Sourdough Loaf", "price": 5.50, "expiry_date": (today - timedelta(days=2)).strftime('%Y-%m-%d')},
-            {"product_name": "Hummus", "price": 4.20, "expiry_date": (today + timedelta(days=15)).strftime('%Y-%m-%d')},
-            {"product_name": "Almond Milk", "price": 3.50, "expiry_date": (today + timedelta(days=50)).strftime('%Y-%m-%d')},
-            {"product_name": "Salmon Fillet", "price": 15.00, "expiry_date": (today + timedelta(days=1)).strftime('%Y-%m-%d')},
-            {"product_name": "Craft Beer 6-Pack", "price": 14.99, "expiry_date": (today + timedelta(days=90)).strftime('%Y-%m-%d')},
-            {"product_name": "Bag of Oranges", "price": 7.00, "expiry_date": (today + timedelta(days=12)).strftime('%Y-%m-%d')},
-            {"product_name": "Imported Olives", "price": 8.50, "expiry_date": (today - timedelta(days=30)).strftime('%Y-%m-%d')},
-            {"product_name": "Artisanal Salami", "price": 11.25, "expiry_date": (today + timedelta(days=40)).strftime('%Y-%m-%d')},
-            {"product_name": "Kombucha", "price": 4.75, "expiry_date": (today + timedelta(days=20)).strftime('%Y-%m-%d')},
-            {"product_name": "Fresh Pasta", "price": 6.00, "expiry_date": today.strftime('%Y-%m-%d')},
-            {"product_name": "Premium Coffee Beans", "price": 18.00, "expiry_date": (today + timedelta(days=365)).strftime('%Y-%m-%d')}
+    help = ("Seeds the database with products: the 20-item sample, or with --count a synthetic catalogue of any "
+            "size for benchmarks, into one warehouse. Replaces that warehouse's stock and its stock ledger "
+            "unless --append. Every lot is booked in with a RECEIPT ledger entry.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, help="Generate this many stock lots instead of the sample.")
+        parser.add_argument("--skus", type=int, help="SKUs the lots are spread over (default: count / 8).")
+        parser.add_argument("--seed", type=int, help="Random seed, for a reproducible catalogue.")
+        parser.add_argument("--expired", type=float, default=0.05, help="Share of lots already expired (default: 0.05).")
+        parser.add_argument("--low-stock", type=float, default=0.1,
+                            help="Share of SKUs below the low-stock threshold, ALERT_MIN_QUANTITY (default: 0.1).")
+        parser.add_argument("--append", action="store_true", help="Add to the existing data instead of replacing it.")
+        parser.add_argument("--warehouse",
+                            help="Code of the warehouse to stock, created if missing (default: the default one).")
+        parser.add_argument("--chunk-size", type=int, default=50000, help="Rows inserted per transaction.")
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        if count is not None and count < 1:
+            raise CommandError("--count must be at least 1.")
+        if not (0 <= options["expired"] <= 1 and 0 <= options["low_stock"] <= 1):
+            raise CommandError("--expired and --low-stock are fractions between 0 and 1.")
+
+        warehouse = warehouse_option(options["warehouse"], create=True)
+        started = time.perf_counter()
+        if not options["append"]:
+            self._wipe(warehouse)
+            self.stdout.write(self.style.WARNING(f"Existing products and stock ledger of {warehouse.code} deleted."))
+
+        if count is None:
+            today = date.today()
+            for name, price, days in SAMPLE_PRODUCTS:
+                receive_lot(name, price, today + timedelta(days=days), source="seed", warehouse=warehouse)
+            self.stdout.write(self.style.SUCCESS(f"{len(SAMPLE_PRODUCTS)} products have been added to the database."))
+            return
+
+        rng = np.random.default_rng(options["seed"])
+        skus = max(1, min(options["skus"] or count // 8, count))
+        sku_ids, created = self._seed_skus(rng, warehouse, skus, options["low_stock"], options["chunk_size"])
+        self._seed_lots(rng, warehouse, sku_ids, count, options["expired"], options["chunk_size"])
+        if options["append"]:
+            for start in range(0, len(sku_ids["id"]), 5000):
+                refresh_sku_totals(sku_ids["id"][start:start + 5000].tolist())
+        else:
+            refresh_sku_totals()
+        refresh_today()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {count} lots over {skus} SKUs ({created} new) into {warehouse.code} in {elapsed:.1f} s."
+        ))
+
+    def _wipe(self, warehouse):
+        # Plain DELETEs: QuerySet.delete() would load every lot to send its delete signals (and write
+        # each one off in the ledger). Past days' rollups keep the stock as it was then.
+        skus = Sku._meta.db_table
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {StockMovement._meta.db_table}"
+                    f" WHERE sku_id IN (SELECT id FROM {skus} WHERE warehouse_id = %s)", [warehouse.pk])
+                for model in (Product, Sku):
+                    cursor.execute(f"DELETE FROM {model._meta.db_table} WHERE warehouse_id = %s", [warehouse.pk])
+            refresh_today()
+
+    def _seed_skus(self, rng, warehouse, skus, low_stock, chunk_size):
+        """
+        Inserts `skus` distinct brand/item/size SKUs into `warehouse` (existing
+        names are kept as they are). Returns their ids, prices, shelf lives and low-stock
+        flags as arrays, and how many were new.
+        """
+        combos = len(BRAND_STARTS) * len(BRAND_ENDS) * len(ITEMS) * len(SIZES)
+        # Every combination is used once before names get a " #2", " #3"... suffix.
+        picks = np.concatenate([rng.permutation(combos) + series * combos for series in range(-(-skus // combos))])[:skus]
+        series, combo = np.divmod(picks, combos)
+        combo, size = np.divmod(combo, len(SIZES))
+        combo, item = np.divmod(combo, len(ITEMS))
+        start, end = np.divmod(combo, len(BRAND_ENDS))
+
+        base_price = np.array([price for _, price, _ in ITEMS])[item]
+        multiplier = np.array([factor for _, factor in SIZES])[size]
+        # Brands price around the item's base; shelf prices end in 9.
+        price = np.maximum(np.floor(base_price * multiplier * rng.lognormal(0, 0.25, skus) * 10) / 10 + 0.09, 0.29)
+        names = [
+            f"{BRAND_STARTS[s]}{BRAND_ENDS[e]} {ITEMS[i][0]} {SIZES[z][0]}" + (f" #{n + 1}" if n else "")
+            for s, e, i, z, n in zip(start.tolist(), end.tolist(), item.tolist(), size.tolist(), series.tolist())
         ]
+        keys = [name.casefold() for name in names]
+
+        table = Sku._meta.db_table
+        created = 0
+        for first in range(0, skus, chunk_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} (warehouse_id, name, name_key, price, total_quantity, lot_count)"
+                    f" VALUES ({warehouse.pk}, %s, %s, %s, 0, 0) ON CONFLICT (warehouse_id, name_key) DO NOTHING",
+                    zip(names[first:first + chunk_size], keys[first:first + chunk_size],
+                        np.round(price[first:first + chunk_size], 2).tolist()),
+                )
+                created += cursor.rowcount
+
+        # Lots carry their SKU's name and price, which for an existing SKU are the ones already stored.
+        stored = {}
+        for first in range(0, skus, 5000):
+            stored.update({
+                key: rest for key, *rest in Sku.objects.filter(warehouse=warehouse, name_key__in=keys[first:first + 5000])
+                .annotate(price_value=Cast("price", FloatField())).values_list("name_key", "id", "name", "price_value")
+            })
+        ids, names, prices = zip(*(stored[key] for key in keys))
+        return {
+            "id": np.array(ids),
+            "name": np.array(names, dtype=object),
+            "price": np.array(prices),
+            "shelf_life": np.array([life for _, _, life in ITEMS])[item],
+            "low": rng.random(skus) < low_stock,
+        }, created
+
+    def _seed_lots(self, rng, warehouse, skus, count, expired, chunk_size):
+        """
+        Inserts `count` lots, each with its RECEIPT ledger entry. Every SKU
+        gets one, and the rest go to SKUs with a long-tailed popularity. A
+        lot's remaining shelf life is uniform over its item's; `expired` of
+        them are 1-30 days past their date. Quantities are then set so that
+        exactly the low-stock SKUs total under the threshold.
+        """
+        n_skus = len(skus["id"])
+        popularity = rng.permutation(1.0 / np.arange(1, n_skus + 1) ** 0.8)
+        sku = np.concatenate([np.arange(n_skus), rng.choice(n_skus, size=count - n_skus, p=popularity / popularity.sum())])
 
-        for product_data in products_data:
-            Product.objects.create(**product_data)
+        days = np.floor(rng.random(count) * (skus["shelf_life"][sku] + 1)).astype(np.int64)
+        is_expired = rng.random(count) < expired
+        days[is_expired] = -rng.integers(1, 31, size=is_expired.sum())
+        expiry = (np.datetime64(date.today()) + days).astype("datetime64[D]")
 
-        self.stdout.write(self.style.SUCCESS(f'{len(products_data)} products have been added to the database.'))
+        threshold = settings.ROLLUPS["LOW_STOCK_QUANTITY"]
+        quantity = np.clip(np.round(rng.lognormal(np.log(24), 0.8, count)), 1, 500).astype(np.int64)
+        lots_per_sku = np.bincount(sku, minlength=n_skus)
+        low = skus["low"][sku]
+        # Low-stock SKUs: each lot under an even share of the threshold.
+        cap = np.maximum((threshold - 1) // lots_per_sku[sku], 1)
+        quantity[low] = 1 + np.floor(rng.random(low.sum()) * cap[low]).astype(np.int64)
+        # Other SKUs: top up the first lot (lot i < n_skus belongs to SKU i) to clear the threshold.
+        shortfall = np.maximum(threshold - np.bincount(sku, weights=quantity, minlength=n_skus), 0).astype(np.int64)
+        headroom = np.where(shortfall > 0, rng.integers(0, threshold + 1, size=n_skus), 0)
+        quantity[:n_skus] += np.where(skus["low"], 0, shortfall + headroom)
 
+        table, ledger = Product._meta.db_table, StockMovement._meta.db_table
+        for first in range(0, count, chunk_size):
+            chunk = sku[first:first + chunk_size]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+                (last_id,) = cursor.fetchone()
+                cursor.executemany(
+                    f"INSERT INTO {table} (warehouse_id, sku_id, product_name, price, quantity, expiry_date, version,"
+                    f" discount_percent) VALUES ({warehouse.pk}, %s, %s, %s, %s, %s, 0, 0)",
+                    zip(skus["id"][chunk].tolist(), skus["name"][chunk].tolist(), skus["price"][chunk].tolist(),
+                        quantity[first:first + chunk_size].tolist(), expiry[first:first + chunk_size].tolist()),
+                )
+                # The chunk's lots are the ones past the previous highest id.
+                cursor.execute(
+                    f"INSERT INTO {ledger} (sku_id, lot_id, product_name, kind, quantity, source, note, created_at)"
+                    f" SELECT sku_id, id, product_name, %s, quantity, 'seed', '', %s FROM {table}"
+                    f" WHERE id > %s AND warehouse_id = %s",
+                    [StockMovement.Kind.RECEIPT, timezone.now(), last_id, warehouse.pk],
+                )
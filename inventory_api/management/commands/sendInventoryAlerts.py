@@ -2,13 +2,18 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import date
-from inventory_api.models import Product
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from django.db import connection
+from inventory_api.models import Sku, Warehouse
 import logging
 from django.conf import settings
 
 min_q = getattr(settings, "ALERT_MIN_QUANTITY", 50)
 
 from inventory_api.gmail_utils import get_gmail_service, build_html_body, send_html_email
+from inventory_api.metrics import ALERT_RUN_SECONDS, ALERT_WAREHOUSE_SECONDS, timed
+from inventory_api.warehouses import warehouse_option
 
 try:
     import pandas as pd
@@ -18,7 +23,8 @@ except Exception:
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = "Scan inventory for expired/low-stock items and send email alerts."
+    help = ("Scan each warehouse's inventory for expired/low-stock items and send one email alert per warehouse. "
+            "Warehouses are processed in parallel.")
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -32,56 +38,109 @@ class Command(BaseCommand):
             action="store_true",
             help="Don't send email, just print what would be sent.",
         )
+        parser.add_argument(
+            "--warehouse",
+            action="append",
+            help="Only alert for this warehouse code (repeatable; default: every warehouse).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "WAREHOUSES", {}).get("ALERT_WORKERS", 4),
+            help="Warehouses processed at once (default: WAREHOUSE_ALERT_WORKERS).",
+        )
 
     def handle(self, *args, **options):
-        min_q = options["min_quantity"]
-        dry_run = options["dry_run"]
+        with timed(ALERT_RUN_SECONDS, outcome="ok") as run:
+            run["outcome"] = self._run(options)
 
+    def _run(self, options) -> str:
+        """Runs one alert pass over the warehouses and returns its outcome label for metrics."""
+        if options["warehouse"]:
+            warehouses = [warehouse_option(code) for code in options["warehouse"]]
+        else:
+            warehouses = list(Warehouse.objects.all())
+        if not warehouses:
+            self.stdout.write(self.style.SUCCESS(f"[{timezone.now()}] No warehouses to check."))
+            return "no_alerts"
+
+        # Each site's queries and Gmail send are independent and mostly wait on
+        # I/O, so threads overlap them. Gmail API clients are not thread-safe:
+        # every worker thread builds its own.
+        self._local = threading.local()
         today = date.today()
-        expired_qs = Product.objects.filter(expiry_date__lt=today)
-        low_stock_qs = Product.objects.filter(quantity__lt=min_q)
+        with ThreadPoolExecutor(max_workers=max(1, min(options["workers"], len(warehouses)))) as pool:
+            outcomes = list(pool.map(lambda warehouse: self._alert_warehouse(warehouse, today, options), warehouses))
 
-        # Combine uniquely
-        combined_qs = (expired_qs | low_stock_qs).distinct()
+        for outcome in ("send_failed", "sent", "dry_run"):
+            if outcome in outcomes:
+                return outcome
+        return "no_alerts"
 
-        if not combined_qs.exists():
-            self.stdout.write(self.style.SUCCESS(f"[{timezone.now()}] No expired/low-stock items found."))
-            return
+    def _alert_warehouse(self, warehouse, today, options) -> str:
+        """Alerts for one warehouse in a worker thread; returns its outcome."""
+        try:
+            with timed(ALERT_WAREHOUSE_SECONDS, warehouse=warehouse.code, outcome="ok") as run:
+                run["outcome"] = self._alert(warehouse, today, options["min_quantity"], options["dry_run"])
+            return run["outcome"]
+        except Exception as e:
+            logger.exception("Inventory alert for warehouse %s failed:", warehouse.code)
+            self.stderr.write(self.style.ERROR(f"[{warehouse.code}] Alert failed: {e}"))
+            return "send_failed"
+        finally:
+            # The thread opened its own database connection.
+            connection.close()
+
+    def _alert(self, warehouse, today, min_q, dry_run) -> str:
+        # One alert row per SKU of this warehouse: expired if any of its lots has
+        # expired, low on stock if the total across its lots is under the threshold.
+        # Read once (sku_warehouse_expiry_idx); the totals are counted from the rows.
+        stocked = Sku.objects.filter(warehouse=warehouse, lot_count__gt=0)
+        expired_qs = stocked.filter(earliest_expiry__lt=today)
+        low_stock_qs = stocked.filter(total_quantity__lt=min_q)
+        combined_qs = (expired_qs | low_stock_qs).distinct().order_by("earliest_expiry", "id")
+
+        rows = [
+            {
+                "id": pk,
+                "product_name": name,
+                "quantity": quantity,
+                "price": float(price) if price is not None else None,
+                "expiry_date": earliest_expiry.isoformat() if earliest_expiry else None,
+            }
+            for pk, name, quantity, price, earliest_expiry in combined_qs.values_list(
+                "id", "name", "total_quantity", "price", "earliest_expiry")
+        ]
+        if not rows:
+            self.stdout.write(self.style.SUCCESS(
+                f"[{timezone.now()}] [{warehouse.code}] No expired/low-stock items found."))
+            return "no_alerts"
+
+        total_expired = sum(1 for row in rows if row["expiry_date"] and row["expiry_date"] < today.isoformat())
+        total_low_stock = sum(1 for row in rows if row["quantity"] < min_q)
 
         # Build DataFrame or list of dicts for email utils
-        rows = []
-        for p in combined_qs:
-            rows.append({
-                "id": p.id,
-                "product_name": p.product_name,
-                "quantity": p.quantity,
-                "price": float(p.price) if p.price is not None else None,
-                "expiry_date": p.expiry_date.isoformat() if p.expiry_date else None,
-            })
-
-        df = None
-        if pd:
-            df = pd.DataFrame(rows)
-        else:
-            df = rows  # list of dicts
-
-        total_expired = expired_qs.count()
-        total_low_stock = low_stock_qs.count()
+        df = pd.DataFrame(rows) if pd else rows
 
         html_body = build_html_body(df, total_expired, total_low_stock)
-        subject = f"⚠️ {combined_qs.count()} Inventory Alerts Detected — {date.today().strftime('%d-%m-%Y')}"
+        subject = f"⚠️ {len(rows)} Inventory Alerts Detected at {warehouse.name} — {today.strftime('%d-%m-%Y')}"
 
         if dry_run:
             # Print to console (debug)
-            self.stdout.write("DRY RUN: Would send email with subject: " + subject)
+            self.stdout.write(f"DRY RUN [{warehouse.code}]: Would send email with subject: " + subject)
             self.stdout.write(html_body)
-            return
+            return "dry_run"
 
         # send
         try:
-            service = get_gmail_service()
-            send_html_email(service, html_body, subject)
-            self.stdout.write(self.style.SUCCESS(f"Email sent successfully. {combined_qs.count()} items included."))
+            service = getattr(self._local, "service", None)
+            if service is None:
+                service = self._local.service = get_gmail_service()
+            send_html_email(service, html_body, subject, recipient=warehouse.alert_email or None)
+            self.stdout.write(self.style.SUCCESS(
+                f"[{warehouse.code}] Email sent successfully. {len(rows)} items included."))
+            return "sent"
         except Exception as e:
-            logger.exception("Failed to send inventory alert email:")
-            self.stderr.write(self.style.ERROR(f"Failed to send email: {e}"))
+            logger.exception("Failed to send inventory alert email for warehouse %s:", warehouse.code)
+            self.stderr.write(self.style.ERROR(f"[{warehouse.code}] Failed to send email: {e}"))
+            return "send_failed"
@@ -0,0 +1,134 @@
+# inventory_api/markdown.py
+"""
+Rule-based markdowns for stock that is close to expiry.
+
+Every lot expiring within the longest tier (or already discounted) is scored
+in one vectorized pass over days to expiry, quantity and price:
+
+- discount: the first tier in MARKDOWN["TIERS"] whose day limit covers the
+  lot's days to expiry, one tier deeper when the lot holds more than
+  MARKDOWN["DEEP_STOCK_QUANTITY"] units, and 0 beyond the last tier (which
+  lifts markdowns from lots whose expiry moved out);
+- score: the stock value at risk per day left, quantity * price /
+  (1 + days), which orders the plan so the lots that matter most come first.
+
+Expired lots are left alone; they are written off, not sold. The plan
+depends only on the lots and the date, so a run repeated on the same day
+changes nothing. The model is only asked to explain a plan (explain_plan()),
+never to make one.
+"""
+import json
+from collections import defaultdict, namedtuple
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .models import Product
+
+# Lot ids per UPDATE statement (SQLite before 3.32 allows 999 parameters per statement).
+UPDATE_BATCH = 900
+
+# One planned change of a lot's discount.
+Markdown = namedtuple(
+    "Markdown", "lot_id product_name expiry_date days_left quantity price score old_percent new_percent")
+
+EXPLAIN_PROMPT = """You are an inventory management assistant. The store applies these markdowns to stock close to expiry (days_left is days until expiry; percent is the new discount):
+
+{plan_json}
+
+Explain the plan to the store manager in two or three sentences: which items matter most and why.
+Respond with a single JSON object: {{"action": "EXPLAIN_MARKDOWNS", "explanation": "..."}}"""
+
+
+def _tiers(config):
+    """Tier day limits and percents as arrays, nearest expiry first."""
+    tiers = sorted(config.get("TIERS", ((1, 50), (3, 30), (7, 15))))
+    return np.array([days for days, _ in tiers]), np.array([percent for _, percent in tiers])
+
+
+def plan_markdowns(today=None, config=None):
+    """
+    The discount changes the rules call for on `today`, highest score first.
+    Lots whose discount is already right are not included.
+    """
+    today = today or date.today()
+    config = config if config is not None else getattr(settings, "MARKDOWN", {})
+    tier_days, tier_percent = _tiers(config)
+    horizon = date.fromordinal(today.toordinal() + int(tier_days[-1]))
+
+    # Two index range scans rather than one OR: lots inside the tiers (product_expiry_idx), and
+    # marked-down lots past them (product_discounted_idx). Expired lots never change.
+    # Price is read as a float: Decimal conversion would cost more than the scoring itself.
+    fields = ("id", "product_name", "expiry_date", "quantity", "price_value", "discount_percent")
+    lots = Product.objects.filter(quantity__gt=0).order_by().annotate(price_value=Cast("price", FloatField()))
+    rows = list(lots.filter(expiry_date__gte=today, expiry_date__lte=horizon).values_list(*fields))
+    rows += lots.filter(discount_percent__gt=0, expiry_date__gt=horizon).values_list(*fields)
+    if not rows:
+        return []
+    ids, names, expiry, quantity, price, current = zip(*rows)
+    days = np.fromiter((d.toordinal() for d in expiry), dtype=np.int64, count=len(expiry)) - today.toordinal()
+    quantity = np.fromiter(quantity, dtype=np.int64, count=len(quantity))
+    price = np.fromiter(price, dtype=np.float64, count=len(price))
+    current = np.fromiter(current, dtype=np.int64, count=len(current))
+
+    tier = np.searchsorted(tier_days, days, side="left")
+    in_tiers = (days >= 0) & (tier < len(tier_days))
+    tier = np.where(quantity > config.get("DEEP_STOCK_QUANTITY", 50), np.maximum(tier - 1, 0), tier)
+    percent = np.where(in_tiers, tier_percent[np.minimum(tier, len(tier_percent) - 1)], 0)
+    percent = np.where(days < 0, current, percent)
+    score = np.where(in_tiers, quantity * price / (1 + np.maximum(days, 0)), 0.0)
+
+    changed = np.flatnonzero(percent != current)
+    changed = changed[np.lexsort((np.array(ids)[changed], -score[changed]))]
+    return [
+        Markdown(ids[i], names[i], expiry[i], days_left, lot_quantity, round(lot_price, 2), round(lot_score, 2), old, new)
+        for i, days_left, lot_quantity, lot_price, lot_score, old, new in zip(
+            changed.tolist(), days[changed].tolist(), quantity[changed].tolist(), price[changed].tolist(),
+            score[changed].tolist(), current[changed].tolist(), percent[changed].tolist())
+    ]
+
+
+def apply_markdowns(plan):
+    """
+    Writes the planned discounts in one transaction. Returns the number of
+    lots changed. There are only a few distinct percents, so this is one
+    UPDATE ... WHERE id IN (...) per percent and batch; bulk_update() would
+    build a CASE over every id, which SQLite evaluates row by row.
+    """
+    by_percent = defaultdict(list)
+    for m in plan:
+        by_percent[m.new_percent].append(m.lot_id)
+    changed = 0
+    with transaction.atomic():
+        for percent, lot_ids in by_percent.items():
+            for start in range(0, len(lot_ids), UPDATE_BATCH):
+                changed += Product.objects.filter(pk__in=lot_ids[start:start + UPDATE_BATCH]).update(
+                    discount_percent=percent)
+    return changed
+
+
+def explain_plan(plan, limit=10):
+    """
+    A short explanation of the plan's top `limit` changes, from the model.
+    Returns None when the model is unavailable or answers with something else.
+    """
+    from .mcp import get_llm_reasoning
+    from .resilience import CircuitOpen, DeadlineExceeded
+    from .scheduler import SchedulerBusy
+
+    if not plan:
+        return None
+    plan_json = json.dumps([
+        {"product_name": m.product_name, "days_left": m.days_left, "quantity": m.quantity,
+         "price": m.price, "percent": m.new_percent}
+        for m in plan[:limit]
+    ])
+    try:
+        result = get_llm_reasoning(EXPLAIN_PROMPT.format(plan_json=plan_json), caller="reason_inventory")
+    except (SchedulerBusy, CircuitOpen, DeadlineExceeded):
+        return None
+    return (result or {}).get("explanation")
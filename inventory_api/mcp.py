@@ -1,84 +1,202 @@
-import os
-import json
+import logging
+import time
 import requests
+from django.conf import settings
 
-def get_llm_reasoning(prompt: str) -> dict:
+from . import cassettes, fastjson
+from .cassettes import CassetteMiss
+from .coalesce import coalesce_key, singleflight
+from .llm_backends import LLMBackendError, NoBackendAvailable, get_backend_pool
+from .metrics import (
+    LLM_ACTIONS,
+    LLM_JSON_PARSE_FAILURES,
+    LLM_REQUEST_SECONDS,
+    observe_prompt,
+)
+from .resilience import CircuitOpen, DeadlineExceeded, current_deadline, get_breaker, remaining
+from .scheduler import SchedulerBusy, get_scheduler, priority_for
+
+logger = logging.getLogger(__name__)
+
+# Call outcomes that count against the circuit breaker.
+BREAKER_FAILURES = {"unavailable", "http_error", "connection_error", "timeout"}
+
+
+def _parse_action(text: str, caller: str):
+    """Parses the model output (with orjson) and counts the proposed action type."""
+    reasoned_action_json = fastjson.loads(text)
+    action = reasoned_action_json.get("action") if isinstance(reasoned_action_json, dict) else None
+    LLM_ACTIONS.labels(caller=caller, action=str(action or "NONE").upper()).inc()
+    return reasoned_action_json
+
+
+def get_llm_reasoning(prompt: str, caller: str = "query", system: str = None) -> dict:
     """
-    Sends a prompt to a local LLM (via Ollama) and gets a reasoned action.
-    This is now a generic function that takes any prompt.
+    Sends a prompt to a local LLM (Ollama or an OpenAI-compatible server such
+    as LM Studio) and gets a reasoned action. The call goes to whichever
+    backend in settings.LLM_BACKENDS currently has the fewest requests in
+    flight (see llm_backends.BackendPool).
+
+    `caller` labels the call in the /metrics output (e.g. "query",
+    "reason_inventory"). `system` is an optional stable prefix (rules,
+    examples); keeping it identical across calls lets the server reuse its KV
+    cache instead of re-evaluating it every time.
+
+    Identical calls already in flight (double-clicks, several users sending
+    the same command) are coalesced into one model call; see coalesce.py.
+    With a cassette active, calls are recorded or replayed (cassettes.py).
+    Raises scheduler.SchedulerBusy when the model queue is full,
+    resilience.CircuitOpen while the model is failing and
+    resilience.DeadlineExceeded when the request's time budget runs out.
     """
+    key = coalesce_key(_model_name(), system, prompt)
+    return singleflight(key, lambda: _call_llm(prompt, caller, system))
+
+
+def _model_name() -> str:
+    return getattr(settings, "OLLAMA_CONFIG", {}).get("MODEL", "")
+
+
+def _call_llm(prompt: str, caller: str, system: str) -> dict:
+    """Checks the circuit breaker, waits for a generation slot, then calls the model."""
+    observe_prompt(caller, (system or "") + prompt)
+    with get_breaker().call() as guard:
+        with get_scheduler().slot(priority_for(caller)):
+            return _generate_action(prompt, caller, system, guard)
+
+
+def _record(guard: dict, outcome: str, seconds: float) -> None:
+    """Reports a finished call to the circuit breaker."""
+    guard["ok"] = None if outcome == "deadline" else outcome not in BREAKER_FAILURES
+    guard["seconds"] = seconds
+
+
+def _deadline_passed() -> bool:
+    # A read timeout cut short by the deadline fires a hair before it.
+    deadline = current_deadline()
+    return deadline is not None and time.monotonic() >= deadline - 0.1
+
+
+def _generate_action(prompt: str, caller: str, system: str, guard: dict) -> dict:
+    started = time.perf_counter()
+    outcome = "ok"
+    text = None
 
-    ollama_api_url = "http://localhost:11434/api/generate"
-    # Sends a prompt to a local LLM (via LM Studio) and gets a reasoned action.
-    # LM Studio's local se
-    # rver runs on port 1234 and mimics the OpenAI API structure
-    # default_url = "http://26.113.213.80:1234/v1/chat/completions"
-    # lm_studio_api_url = os.environ.get(
-
-    #     'LM_STUDIO_URL', default_url
-    # )
-
-    # if "WINDOWS_HOST_IP" in lm_studio_api_url:
-    #      return {"error": "LM Studio URL is not configured. Please edit inventory_api/mcp.py and set your Windows host IP."}
-    
-    # headers = {"Content-Type": "application/json"}
-
-    # The payload needs to be in the OpenAI chat completions format
-
-    payload = {
-        "model": "phi3-finetuned-inventoryV2",
-        "prompt": prompt,
-        "stream": False,
-        "format": "json"
-        # The model name is often ignored by LM Studio; it uses the model loaded in the UI.
-        # However, it's good practice to include it.
-        # "model": "openai/gptoss-oss-20b", 
-        # "messages": [
-        #     {"role": "system", "content": "You are a helpful database assistant that only responds with valid JSON."},
-        #     {"role": "user", "content": prompt}
-        # ],
-        # "temperature": 0.7,
-        # "stream": False # We want a single response
-    }
-    
-
-    
     try:
-        response = requests.post(ollama_api_url, json=payload, timeout=180)
-        # --- DEBUGGING STEP: Print the raw response text ---
-        print("-" * 20)
-        print("Raw Ollama Response Status Code:", response.status_code)
-        print("Raw Ollama Response Text:")
-        print(response.text) # <-- THIS IS THE KEY DEBUG LINE
-        print("-" * 20)
-        # --- END DEBUGGING STEP ---
-         
-        if response.status_code != 200:
-            print(f"Ollama returned an error: {response.status_code}")
-            print(f"Response body: {response.text}")
-            return {"error": f"Ollama returned a non-200 status code: {response.text}"}
-            
-        response.raise_for_status()
-        response_data = response.json()
-        
-        reasoned_action_string = response_data.get("response", "{}")
-
-        # --- DEBUGGING STEP 2: Print the string *before* parsing ---
-        print("String to be parsed as JSON:", reasoned_action_string)
-        print("-" * 20)
-        # --- END DEBUGGING STEP 2 ---
-        
-        reasoned_action_json = json.loads(reasoned_action_string)
-        
-        return reasoned_action_json
+        # The request's remaining budget caps the HTTP timeout.
+        text = cassettes.generate(_model_name(), system, prompt, lambda stats: get_backend_pool().call(
+            lambda backend: backend.generate(prompt, system, timeout=remaining(), stats=stats)))
+        return _parse_action(text, caller)
 
+    except NoBackendAvailable as e:
+        outcome = "unavailable"
+        logger.error("%s", e)
+        return {"error": "No language model server is available right now. Please try again shortly."}
+    except LLMBackendError as e:
+        outcome = "http_error"
+        logger.error("LLM backend returned an error: %s", e)
+        return {"error": f"The language model server returned an error: {e}"}
+    except requests.exceptions.Timeout as e:
+        if _deadline_passed():
+            outcome = "deadline"
+            raise DeadlineExceeded("The request deadline passed before the language model answered.") from e
+        outcome = "timeout"
+        logger.error("Timed out waiting for the local LLM: %s", e)
+        return {"error": "The local language model did not answer in time."}
     except requests.exceptions.RequestException as e:
-        print(f"Error communicating with local LLM: {e}")
+        outcome = "connection_error"
+        logger.error("Error communicating with local LLM: %s", e)
         return {"error": "Could not connect to the local language model. Is Ollama running?"}
-    except (json.JSONDecodeError, IndexError, KeyError) as e:
-        print(f"Error parsing JSON from LLM response: {e}")
-        response_text = response.text if 'response' in locals() else 'No response text'
-        print(f"Raw response was: {response_text}")
+    except (fastjson.JSONDecodeError, IndexError, KeyError) as e:
+        outcome = "parse_error"
+        LLM_JSON_PARSE_FAILURES.labels(caller=caller).inc()
+        logger.error("Error parsing JSON from LLM response: %s. Raw response was: %s", e, text)
         return {"error": "Invalid or unexpected JSON response from the model."}
+    except DeadlineExceeded:
+        outcome = "deadline"
+        raise
+    except CassetteMiss as e:
+        outcome = "cassette_miss"
+        logger.error("%s", e)
+        return {"error": str(e)}
+    finally:
+        elapsed = time.perf_counter() - started
+        _record(guard, outcome, elapsed)
+        LLM_REQUEST_SECONDS.labels(caller=caller, outcome=outcome).observe(elapsed)
+
+
+def stream_llm_reasoning(prompt: str, caller: str = "query", system: str = None):
+    """
+    Streaming variant of get_llm_reasoning. Yields
+    {"type": "token", "text": ...} for every piece the model generates and
+    ends with {"type": "done", "result": <parsed action or {"error": ...}>}.
+    If the call was turned away (queue full, circuit open, deadline passed)
+    the error also carries "retry_after" and the HTTP "status" to report.
+    """
+    observe_prompt(caller, (system or "") + prompt)
+    try:
+        with get_breaker().call() as guard:
+            with get_scheduler().slot(priority_for(caller)):
+                yield from _stream_action(prompt, caller, system, guard)
+    except SchedulerBusy as e:
+        yield {"type": "done", "result": {"error": str(e), "retry_after": e.retry_after, "status": 429}}
+    except CircuitOpen as e:
+        yield {"type": "done", "result": {"error": str(e), "retry_after": e.retry_after, "status": 503}}
+    except DeadlineExceeded as e:
+        yield {"type": "done", "result": {"error": str(e), "retry_after": 1, "status": 504}}
+
+
+def _stream_action(prompt: str, caller: str, system: str, guard: dict):
+    started = time.perf_counter()
+    outcome = "ok"
+    pieces = []
+
+    try:
+        for text in cassettes.stream(_model_name(), system, prompt,
+                                     lambda stats: _pooled_stream(prompt, system, stats)):
+            remaining()  # stop generating once the deadline has passed
+            pieces.append(text)
+            yield {"type": "token", "text": text}
+
+        yield {"type": "done", "result": _parse_action("".join(pieces) or "{}", caller)}
+
+    except NoBackendAvailable as e:
+        outcome = "unavailable"
+        logger.error("%s", e)
+        yield {"type": "done", "result": {"error": "No language model server is available right now. Please try again shortly."}}
+    except LLMBackendError as e:
+        outcome = "http_error"
+        logger.error("LLM backend returned an error: %s", e)
+        yield {"type": "done", "result": {"error": f"The language model server returned an error: {e}"}}
+    except requests.exceptions.Timeout as e:
+        if _deadline_passed():
+            outcome = "deadline"
+            raise DeadlineExceeded("The request deadline passed before the language model answered.") from e
+        outcome = "timeout"
+        logger.error("Timed out waiting for the local LLM: %s", e)
+        yield {"type": "done", "result": {"error": "The local language model did not answer in time."}}
+    except requests.exceptions.RequestException as e:
+        outcome = "connection_error"
+        logger.error("Error communicating with local LLM: %s", e)
+        yield {"type": "done", "result": {"error": "Could not connect to the local language model. Is Ollama running?"}}
+    except (fastjson.JSONDecodeError, IndexError, KeyError) as e:
+        outcome = "parse_error"
+        LLM_JSON_PARSE_FAILURES.labels(caller=caller).inc()
+        logger.error("Error parsing JSON from streamed LLM response: %s. Raw output was: %s", e, "".join(pieces))
+        yield {"type": "done", "result": {"error": "Invalid or unexpected JSON response from the model."}}
+    except DeadlineExceeded:
+        outcome = "deadline"
+        raise
+    except CassetteMiss as e:
+        outcome = "cassette_miss"
+        logger.error("%s", e)
+        yield {"type": "done", "result": {"error": str(e)}}
+    finally:
+        elapsed = time.perf_counter() - started
+        _record(guard, outcome, elapsed)
+        LLM_REQUEST_SECONDS.labels(caller=caller, outcome=outcome).observe(elapsed)
 
 
+def _pooled_stream(prompt: str, system: str, stats: dict):
+    with get_backend_pool().acquire() as backend:
+        yield from backend.stream(prompt, system, timeout=remaining(), stats=stats)
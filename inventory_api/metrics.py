@@ -0,0 +1,213 @@
+# inventory_api/metrics.py
+"""
+Prometheus metrics for the LLM calls and async jobs, the scanned-product
+queue, the alert job and Gmail sends, exposed at /metrics.
+
+With several worker processes (gunicorn, the cron job, ...) set
+PROMETHEUS_MULTIPROC_DIR to a shared, writable directory before the processes
+start; every process then writes its samples there and /metrics aggregates
+them. Without it, /metrics only reports the serving process.
+
+If prometheus_client is not installed every metric is a no-op.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+except Exception:
+    Counter = Gauge = Histogram = None
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300)
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUEUE_WAIT_BUCKETS = (1, 3, 10, 30, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+SIZE_BUCKETS = tuple(1024 * 2 ** i for i in range(13))  # 1 KiB .. 4 MiB
+
+
+class _NoopMetric:
+    """Stands in for a metric when prometheus_client is unavailable."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _metric(cls, name, documentation, labelnames=(), **kwargs):
+    if cls is None:
+        return _NoopMetric()
+    return cls(name, documentation, labelnames, **kwargs)
+
+
+# --- LLM calls ---
+LLM_REQUEST_SECONDS = _metric(
+    Histogram, "warevision_llm_request_seconds",
+    "Wall time of LLM calls by caller and outcome.",
+    ["caller", "outcome"], buckets=LATENCY_BUCKETS,
+)
+LLM_PROMPT_BYTES = _metric(
+    Histogram, "warevision_llm_prompt_bytes",
+    "UTF-8 size of prompts sent to the LLM.",
+    ["caller"], buckets=SIZE_BUCKETS,
+)
+LLM_PROMPT_TOKENS = _metric(
+    Histogram, "warevision_llm_prompt_tokens_estimated",
+    "Estimated prompt tokens (bytes / 4) sent to the LLM.",
+    ["caller"], buckets=tuple(b // 4 for b in SIZE_BUCKETS),
+)
+LLM_JSON_PARSE_FAILURES = _metric(
+    Counter, "warevision_llm_json_parse_failures_total",
+    "LLM responses that could not be parsed as JSON.",
+    ["caller"],
+)
+LLM_ACTIONS = _metric(
+    Counter, "warevision_llm_actions_total",
+    "Actions returned by the LLM, by caller and action type.",
+    ["caller", "action"],
+)
+LLM_COALESCED_REQUESTS = _metric(
+    Counter, "warevision_llm_coalesced_requests_total",
+    "LLM calls answered by an identical in-flight call instead of the model, "
+    "by scope (process = same worker, worker = another worker process).",
+    ["scope"],
+)
+LLM_QUEUE_WAIT_SECONDS = _metric(
+    Histogram, "warevision_llm_queue_wait_seconds",
+    "Time LLM calls waited for a generation slot, by priority class.",
+    ["priority"], buckets=FAST_BUCKETS + (30, 60, 120, 300, 600),
+)
+LLM_QUEUE_DEPTH = _metric(
+    Gauge, "warevision_llm_queue_depth",
+    "LLM calls waiting for a generation slot, by priority class.",
+    ["priority"], multiprocess_mode="livesum",
+)
+LLM_QUEUE_REJECTIONS = _metric(
+    Counter, "warevision_llm_queue_rejections_total",
+    "LLM calls turned away by the scheduler (queue_full or timeout).",
+    ["priority", "reason"],
+)
+LLM_CIRCUIT_STATE = _metric(
+    Gauge, "warevision_llm_circuit_state",
+    "Circuit breaker state for the model dependency (0 closed, 1 half-open, 2 open).",
+    ["breaker"], multiprocess_mode="max",
+)
+LLM_CIRCUIT_REJECTIONS = _metric(
+    Counter, "warevision_llm_circuit_rejections_total",
+    "Model calls failed fast because the circuit breaker was open.",
+    ["breaker"],
+)
+
+# --- Async LLM jobs ---
+LLM_JOB_QUEUE_WAIT_SECONDS = _metric(
+    Histogram, "warevision_llm_job_queue_wait_seconds",
+    "Time async /api/query/ jobs waited in the job table before a worker claimed them.",
+    buckets=FAST_BUCKETS + (30, 60, 120, 300, 600),
+)
+LLM_JOB_SECONDS = _metric(
+    Histogram, "warevision_llm_job_seconds",
+    "Time a worker spent on one async job attempt, by outcome (done, failed, requeued).",
+    ["outcome"], buckets=LATENCY_BUCKETS,
+)
+
+# --- Scanned product (HITL) queue ---
+SCANNED_QUEUE_DEPTH = _metric(
+    Gauge, "warevision_scanned_queue_depth",
+    "Scanned products waiting for review, per warehouse.",
+    ["warehouse"], multiprocess_mode="livesum",
+)
+SCANNED_QUEUE_WAIT_SECONDS = _metric(
+    Histogram, "warevision_scanned_queue_wait_seconds",
+    "Time scanned products spent in the queue before the dashboard picked them up.",
+    ["warehouse"], buckets=QUEUE_WAIT_BUCKETS,
+)
+
+# --- Response compression ---
+COMPRESSED_RESPONSE_BYTES = _metric(
+    Counter, "warevision_compressed_response_bytes_total",
+    "Bytes of compressed responses by encoding, before (side=body) and after (side=wire) compression.",
+    ["encoding", "side"],
+)
+
+# --- Alert job & Gmail ---
+ALERT_RUN_SECONDS = _metric(
+    Histogram, "warevision_alert_run_seconds",
+    "Duration of sendInventoryAlerts runs by outcome.",
+    ["outcome"], buckets=LATENCY_BUCKETS,
+)
+ALERT_WAREHOUSE_SECONDS = _metric(
+    Histogram, "warevision_alert_warehouse_seconds",
+    "Time to build and send one warehouse's alert report, by warehouse and outcome.",
+    ["warehouse", "outcome"], buckets=LATENCY_BUCKETS,
+)
+GMAIL_SEND_SECONDS = _metric(
+    Histogram, "warevision_gmail_send_seconds",
+    "Latency of Gmail API send calls by outcome.",
+    ["outcome"], buckets=FAST_BUCKETS + (30, 60),
+)
+
+
+def estimate_tokens(num_bytes: int) -> int:
+    """Rough token count for English/JSON prompts (~4 bytes per token)."""
+    return max(1, num_bytes // 4)
+
+
+def observe_prompt(caller: str, prompt: str) -> None:
+    size = len(prompt.encode("utf-8"))
+    LLM_PROMPT_BYTES.labels(caller=caller).observe(size)
+    LLM_PROMPT_TOKENS.labels(caller=caller).observe(estimate_tokens(size))
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """
+    Observe the duration of a block. An `outcome` label, if the histogram has
+    one, is set to "error" when the block raises; callers can also override it
+    through the yielded dict.
+    """
+    state = {"outcome": "ok"}
+    started = time.perf_counter()
+    try:
+        yield state
+    except Exception:
+        state["outcome"] = "error"
+        raise
+    finally:
+        if "outcome" in labels:
+            labels["outcome"] = state["outcome"]
+        elapsed = time.perf_counter() - started
+        (histogram.labels(**labels) if labels else histogram).observe(elapsed)
+
+
+def render_latest():
+    """Return (body, content_type) for the /metrics endpoint."""
+    if Counter is None:
+        return b"# prometheus_client is not installed\n", "text/plain; charset=utf-8"
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _name_key(name):
+    return " ".join((name or "").split()).casefold()
+
+
+def products_to_lots(apps, schema_editor):
+    """
+    Groups existing Product rows into SKUs by normalized name. Rows of the
+    same SKU with the same expiry date are merged into one lot. The SKU takes
+    the name and price of its most recently added row.
+    """
+    Sku = apps.get_model('inventory_api', 'Sku')
+    Product = apps.get_model('inventory_api', 'Product')
+
+    groups = defaultdict(list)
+    for product in Product.objects.order_by('id'):
+        groups[_name_key(product.product_name)].append(product)
+
+    for key, rows in groups.items():
+        latest = rows[-1]
+        name = " ".join(latest.product_name.split())
+        sku = Sku.objects.create(name=name, name_key=key, price=latest.price)
+
+        lots = {}
+        for product in rows:
+            lot = lots.get(product.expiry_date)
+            if lot is None:
+                lots[product.expiry_date] = product
+            else:
+                lot.quantity += product.quantity
+                product.delete()
+        for lot in lots.values():
+            lot.sku = sku
+            lot.product_name = name
+            lot.price = sku.price
+            lot.save()
+
+        sku.total_quantity = sum(lot.quantity for lot in lots.values())
+        sku.lot_count = len(lots)
+        sku.earliest_expiry = min(lots)
+        sku.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0002_product_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sku',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('name_key', models.CharField(max_length=255, unique=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_quantity', models.IntegerField(default=0)),
+                ('lot_count', models.IntegerField(default=0)),
+                ('earliest_expiry', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['earliest_expiry'], name='sku_earliest_expiry_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='inventory_api.sku'),
+        ),
+        migrations.RunPython(products_to_lots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='inventory_api.sku'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sku', 'expiry_date'], name='product_sku_fefo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['expiry_date'], name='product_expiry_idx'),
+        ),
+    ]
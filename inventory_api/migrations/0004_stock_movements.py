@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0003_sku_lots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_name', models.CharField(max_length=255)),
+                ('kind', models.CharField(choices=[('RECEIPT', 'Receipt'), ('SALE', 'Sale'), ('ADJUSTMENT', 'Adjustment'), ('WRITE_OFF', 'Write Off')], max_length=16)),
+                ('quantity', models.IntegerField()),
+                ('source', models.CharField(blank=True, max_length=32)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('lot', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='inventory_api.product')),
+                ('sku', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='inventory_api.sku')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['sku', 'created_at'], name='movement_sku_time_idx'), models.Index(fields=['kind', 'created_at'], name='movement_kind_time_idx'), models.Index(fields=['created_at'], name='movement_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+import logging
+
+from django.db import DatabaseError, migrations
+
+logger = logging.getLogger(__name__)
+
+# The search index as this migration created it, frozen here so later
+# changes to inventory_api/search.py do not change what it does.
+SQLITE_INDEX_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS inventory_api_sku_fts USING fts5("
+    "name, content='inventory_api_sku', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS inventory_api_sku_fts_ai AFTER INSERT ON inventory_api_sku BEGIN "
+    "INSERT INTO inventory_api_sku_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS inventory_api_sku_fts_ad AFTER DELETE ON inventory_api_sku BEGIN "
+    "INSERT INTO inventory_api_sku_fts(inventory_api_sku_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS inventory_api_sku_fts_au AFTER UPDATE OF name ON inventory_api_sku BEGIN "
+    "INSERT INTO inventory_api_sku_fts(inventory_api_sku_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO inventory_api_sku_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS inventory_api_sku_fts_vocab USING fts5vocab(inventory_api_sku_fts, 'row')",
+    "INSERT INTO inventory_api_sku_fts(inventory_api_sku_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS inventory_api_sku_fts_ai",
+    "DROP TRIGGER IF EXISTS inventory_api_sku_fts_ad",
+    "DROP TRIGGER IF EXISTS inventory_api_sku_fts_au",
+    "DROP TABLE IF EXISTS inventory_api_sku_fts_vocab",
+    "DROP TABLE IF EXISTS inventory_api_sku_fts",
+]
+POSTGRES_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS sku_name_trgm_idx ON inventory_api_sku USING gin (name gin_trgm_ops)",
+]
+POSTGRES_DROP_SQL = ["DROP INDEX IF EXISTS sku_name_trgm_idx"]
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        try:
+            for sql in SQLITE_INDEX_SQL:
+                schema_editor.execute(sql)
+        except DatabaseError as e:
+            # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer).
+            logger.warning("SQLite full-text search unavailable, product search will scan: %s", e)
+    elif vendor == "postgresql":
+        for sql in POSTGRES_INDEX_SQL:
+            schema_editor.execute(sql)
+
+
+def backwards(apps, schema_editor):
+    statements = {"sqlite": SQLITE_DROP_SQL, "postgresql": POSTGRES_DROP_SQL}.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0004_stock_movements'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+DISCOUNT_TAG = "[DISCOUNT]"
+# Discount given to lots that reason_inventory had tagged, the markdown engine's lowest tier.
+TAGGED_DISCOUNT = 15
+
+
+def _name_key(name):
+    return " ".join((name or "").split()).casefold()
+
+
+def discount_tags_to_field(apps, schema_editor):
+    """
+    reason_inventory used to mark a product by appending " [DISCOUNT]" to its
+    name, which 0003 turned into a SKU of its own. Each tagged SKU goes back
+    under its untagged name (merging into that SKU when it exists) and its
+    lots get discount_percent instead.
+    """
+    Sku = apps.get_model('inventory_api', 'Sku')
+    Product = apps.get_model('inventory_api', 'Product')
+    StockMovement = apps.get_model('inventory_api', 'StockMovement')
+
+    for tagged in Sku.objects.filter(name__contains=DISCOUNT_TAG):
+        name = " ".join(tagged.name.replace(DISCOUNT_TAG, " ").split())
+        sku = Sku.objects.filter(name_key=_name_key(name)).exclude(pk=tagged.pk).first()
+        if sku is None:
+            tagged.name, tagged.name_key = name, _name_key(name)
+            tagged.save()
+            sku = tagged
+        Product.objects.filter(sku=tagged).update(
+            sku=sku, product_name=sku.name, price=sku.price, discount_percent=TAGGED_DISCOUNT)
+        StockMovement.objects.filter(sku_id=tagged.pk).update(sku_id=sku.pk)
+        if sku.pk != tagged.pk:
+            tagged.delete()
+
+        totals = Product.objects.filter(sku=sku).aggregate(
+            total=Sum('quantity'), count=Count('id'), earliest=Min('expiry_date'))
+        sku.total_quantity = totals['total'] or 0
+        sku.lot_count = totals['count']
+        sku.earliest_expiry = totals['earliest']
+        sku.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0005_sku_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount_percent',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('discount_percent__gt', 0)), fields=['expiry_date'], name='product_discounted_idx'),
+        ),
+        migrations.RunPython(discount_tags_to_field, migrations.RunPython.noop),
+    ]
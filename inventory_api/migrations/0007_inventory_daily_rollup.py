@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0006_product_discount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('sku_count', models.IntegerField(default=0)),
+                ('lot_count', models.IntegerField(default=0)),
+                ('total_units', models.IntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('expired_lots', models.IntegerField(default=0)),
+                ('expired_units', models.IntegerField(default=0)),
+                ('expired_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('low_stock_skus', models.IntegerField(default=0)),
+                ('received_units', models.IntegerField(default=0)),
+                ('sold_units', models.IntegerField(default=0)),
+                ('adjusted_units', models.IntegerField(default=0)),
+                ('written_off_units', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+    ]
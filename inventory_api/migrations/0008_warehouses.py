@@ -0,0 +1,119 @@
+import logging
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import DatabaseError, migrations, models
+
+logger = logging.getLogger(__name__)
+
+# The search index as of this migration (see 0005_sku_search_index), frozen here so later
+# changes to inventory_api/search.py do not change what it does.
+SQLITE_INDEX_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS inventory_api_sku_fts USING fts5("
+    "name, content='inventory_api_sku', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS inventory_api_sku_fts_ai AFTER INSERT ON inventory_api_sku BEGIN "
+    "INSERT INTO inventory_api_sku_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS inventory_api_sku_fts_ad AFTER DELETE ON inventory_api_sku BEGIN "
+    "INSERT INTO inventory_api_sku_fts(inventory_api_sku_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS inventory_api_sku_fts_au AFTER UPDATE OF name ON inventory_api_sku BEGIN "
+    "INSERT INTO inventory_api_sku_fts(inventory_api_sku_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO inventory_api_sku_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS inventory_api_sku_fts_vocab USING fts5vocab(inventory_api_sku_fts, 'row')",
+    "INSERT INTO inventory_api_sku_fts(inventory_api_sku_fts) VALUES ('rebuild')",
+]
+POSTGRES_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS sku_name_trgm_idx ON inventory_api_sku USING gin (name gin_trgm_ops)",
+]
+
+
+def stock_to_default_warehouse(apps, schema_editor):
+    """Files every existing SKU and lot under the default warehouse."""
+    Warehouse = apps.get_model('inventory_api', 'Warehouse')
+    Sku = apps.get_model('inventory_api', 'Sku')
+    Product = apps.get_model('inventory_api', 'Product')
+
+    config = getattr(settings, 'WAREHOUSES', {})
+    warehouse, _ = Warehouse.objects.get_or_create(
+        code=config.get('DEFAULT', 'main'), defaults={'name': config.get('DEFAULT_NAME', 'Main warehouse')})
+    Sku.objects.update(warehouse=warehouse)
+    Product.objects.update(warehouse=warehouse)
+
+
+def reinstall_search_index(apps, schema_editor):
+    # SQLite rebuilt inventory_api_sku above, which dropped the search index's sync triggers.
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        try:
+            for sql in SQLITE_INDEX_SQL:
+                schema_editor.execute(sql)
+        except DatabaseError as e:
+            logger.warning("SQLite full-text search unavailable, product search will scan: %s", e)
+    elif vendor == "postgresql":
+        for sql in POSTGRES_INDEX_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0007_inventory_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Warehouse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=32, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('alert_email', models.EmailField(blank=True, max_length=254)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sku',
+            name='warehouse',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='skus', to='inventory_api.warehouse'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='warehouse',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='lots', to='inventory_api.warehouse'),
+        ),
+        migrations.RunPython(stock_to_default_warehouse, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='sku',
+            name='warehouse',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='skus', to='inventory_api.warehouse'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='warehouse',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='lots', to='inventory_api.warehouse'),
+        ),
+        migrations.AlterField(
+            model_name='sku',
+            name='name_key',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='sku',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'name_key'), name='sku_warehouse_name_key_uniq'),
+        ),
+        migrations.RemoveIndex(
+            model_name='sku',
+            name='sku_earliest_expiry_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sku',
+            index=models.Index(fields=['warehouse', 'earliest_expiry'], name='sku_warehouse_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['warehouse', 'expiry_date'], name='product_warehouse_expiry_idx'),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0009_llm_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryRollupDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku_count', models.IntegerField(default=0)),
+                ('lot_count', models.IntegerField(default=0)),
+                ('total_units', models.IntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('expired_lots', models.IntegerField(default=0)),
+                ('expired_units', models.IntegerField(default=0)),
+                ('expired_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('low_stock_skus', models.IntegerField(default=0)),
+                ('received_units', models.IntegerField(default=0)),
+                ('sold_units', models.IntegerField(default=0)),
+                ('adjusted_units', models.IntegerField(default=0)),
+                ('written_off_units', models.IntegerField(default=0)),
+                ('date', models.DateField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='rollup_delta_date_idx')],
+            },
+        ),
+    ]
@@ -1,17 +1,246 @@
-from django.db import models
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
+
+
+def normalize_sku_name(name: str) -> str:
+    """Key that identifies a SKU: case and whitespace differences do not make a new item."""
+    return " ".join((name or "").split()).casefold()
+
+
+class Warehouse(models.Model):
+    """
+    A site that holds stock. Each warehouse has its own SKUs (with their own
+    prices and totals) and lots; see warehouses.py for how a request picks one.
+    """
+    code = models.SlugField(max_length=32, unique=True)
+    name = models.CharField(max_length=255)
+    # Where this site's inventory alerts go; blank means ALERT_EMAIL_TO.
+    alert_email = models.EmailField(blank=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['code']
+
+
+class Sku(models.Model):
+    """
+    A stocked item of one warehouse: its identity and price. Stock itself
+    lives in lots (Product rows); total_quantity, lot_count and
+    earliest_expiry are denormalized from them by stock.refresh_sku_totals().
+    """
+    # No index of its own: the (warehouse, ...) constraint and index below lead with it.
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT, related_name='skus', db_index=False)
+    name = models.CharField(max_length=255)
+    name_key = models.CharField(max_length=255)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_quantity = models.IntegerField(default=0)
+    lot_count = models.IntegerField(default=0)
+    earliest_expiry = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        from .warehouses import current_warehouse_id
+
+        self.name_key = normalize_sku_name(self.name)
+        if self.warehouse_id is None:
+            self.warehouse_id = current_warehouse_id()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'name_key'], name='sku_warehouse_name_key_uniq'),
+        ]
+        indexes = [
+            # A site's stocked SKUs, "what expires next" first, without touching the lot table.
+            models.Index(fields=['warehouse', 'earliest_expiry'], name='sku_warehouse_expiry_idx'),
+        ]
 
 
 class Product(models.Model):
     """
-    Represents a product in the inventory.
+    A stock lot: a quantity of one SKU with one expiry date. product_name,
+    price and warehouse mirror the SKU so the /api/products/ shape is
+    unchanged and a site's lots are read without a join; saving a lot files
+    it under the SKU for its name in its warehouse and keeps that SKU's price
+    and totals in step.
     """
+    # Indexed through product_warehouse_expiry_idx.
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT, related_name='lots', db_index=False)
+    sku = models.ForeignKey(Sku, on_delete=models.CASCADE, related_name='lots')
     product_name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    quantity = models.IntegerField(default=1) 
+    quantity = models.IntegerField(default=1)
     expiry_date = models.DateField()
+    # Bumped by every stock movement; lets a client apply a change only to the quantity it last saw.
+    version = models.IntegerField(default=0)
+    # Markdown for stock near expiry, set by the markdown engine (see markdown.py).
+    discount_percent = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return self.product_name
 
+    def save(self, *args, **kwargs):
+        from .rollups import touch, tracking
+        from .stock import file_lot_under_sku, refresh_sku_totals
+
+        previous_sku_id = self.sku_id
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic(), tracking():
+            touch([previous_sku_id])
+            if update_fields is None:
+                file_lot_under_sku(self)
+            elif {'product_name', 'price', 'sku'} & set(update_fields):
+                file_lot_under_sku(self)
+                kwargs['update_fields'] = set(update_fields) | {'product_name', 'price', 'sku'}
+            super().save(*args, **kwargs)
+            refresh_sku_totals({previous_sku_id, self.sku_id})
+
+    class Meta:
+        ordering = ['expiry_date']
+        indexes = [
+            # First-expiry-first-out picking within a SKU.
+            models.Index(fields=['sku', 'expiry_date'], name='product_sku_fefo_idx'),
+            # "Expiring within N days" and expired-lot range scans, company-wide (rollups, markdowns)...
+            models.Index(fields=['expiry_date'], name='product_expiry_idx'),
+            # ...and within one site, which is also the order /api/products/ lists a site's lots in.
+            models.Index(fields=['warehouse', 'expiry_date'], name='product_warehouse_expiry_idx'),
+            # Marked-down lots, so the markdown engine finds the ones to lift without a scan.
+            models.Index(fields=['expiry_date'], condition=models.Q(discount_percent__gt=0),
+                         name='product_discounted_idx'),
+        ]
+
+
+class StockMovement(models.Model):
+    """
+    One entry of the append-only stock ledger: a signed quantity change of a
+    lot. The references are not foreign-key constraints, so history stays
+    intact after lots and SKUs are deleted; product_name keeps what the item
+    was called at the time.
+    """
+    class Kind(models.TextChoices):
+        RECEIPT = 'RECEIPT'
+        SALE = 'SALE'
+        ADJUSTMENT = 'ADJUSTMENT'
+        WRITE_OFF = 'WRITE_OFF'
+
+    sku = models.ForeignKey(Sku, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    lot = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    product_name = models.CharField(max_length=255)
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    quantity = models.IntegerField()
+    source = models.CharField(max_length=32, blank=True)
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+d} {self.product_name}"
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['sku', 'created_at'], name='movement_sku_time_idx'),
+            models.Index(fields=['kind', 'created_at'], name='movement_kind_time_idx'),
+            models.Index(fields=['created_at'], name='movement_time_idx'),
+        ]
+
+
+class RollupCounts(models.Model):
+    """The level and flow columns of a daily rollup (see InventoryDailyRollup)."""
+    sku_count = models.IntegerField(default=0)
+    lot_count = models.IntegerField(default=0)
+    total_units = models.IntegerField(default=0)
+    # At shelf price, before markdowns.
+    stock_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    expired_lots = models.IntegerField(default=0)
+    expired_units = models.IntegerField(default=0)
+    expired_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    low_stock_skus = models.IntegerField(default=0)
+    received_units = models.IntegerField(default=0)
+    sold_units = models.IntegerField(default=0)
+    # Net: stock counts and corrections go both ways.
+    adjusted_units = models.IntegerField(default=0)
+    written_off_units = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class InventoryDailyRollup(RollupCounts):
+    """
+    Inventory totals for one day, maintained by rollups.py: stock levels as
+    of the end of the day (as of now, for today) and the ledger units that
+    moved during it, plus the day's InventoryRollupDelta rows not folded in
+    yet. Counts cover stock on hand: lots and SKUs holding units.
+    """
+    date = models.DateField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Inventory on {self.date}"
+
+    class Meta:
+        ordering = ['date']
+
+
+class InventoryRollupDelta(RollupCounts):
+    """
+    One transaction's change to a day's InventoryDailyRollup. Stock writers
+    append these instead of updating the day's row, so they never wait on
+    each other for it; rollups.fold() adds them into the rows.
+    """
+    date = models.DateField()
+
+    def __str__(self):
+        return f"Inventory change on {self.date}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date'], name='rollup_delta_date_idx'),
+        ]
+
+
+class LLMJob(models.Model):
+    """
+    A /api/query/?async=1 request waiting for, or answered by, a
+    run_llm_workers process (see jobs.py). `result` holds the proposal body
+    the synchronous call would have returned and `result_status` its status.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED'
+        RUNNING = 'RUNNING'
+        DONE = 'DONE'
+        FAILED = 'FAILED'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='+')
+    query = models.TextField()
+    status = models.CharField(max_length=8, choices=Status.choices, default=Status.QUEUED)
+    # Not claimed before this time (set when a busy model sends the job back to the queue).
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Which worker holds a RUNNING job, and until when; an expired lease may be claimed again.
+    worker = models.CharField(max_length=64, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    result_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.status} {self.query[:40]}"
+
     class Meta:
-        ordering = ['expiry_date'] 
+        ordering = ['created_at']
+        indexes = [
+            # What the workers poll for: the oldest claimable job of a status.
+            models.Index(fields=['status', 'available_at'], name='llmjob_claim_idx'),
+        ]
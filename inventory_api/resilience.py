@@ -0,0 +1,208 @@
+# inventory_api/resilience.py
+"""
+Deadlines and a circuit breaker for the model dependency.
+
+Deadlines: DeadlineMiddleware gives every request a time budget, taken from
+the client's `X-Request-Timeout-Ms` header (its remaining budget) or
+LLM_RESILIENCE["DEFAULT_DEADLINE"]. Queue waits, coalescing waits and the
+HTTP timeout of the model call are all capped by what is left of it, so a
+request never outlives its caller. Outside a request there is no deadline and
+the backend's own TIMEOUT applies.
+
+Circuit breaker: after FAILURE_THRESHOLD consecutive failed or slow
+(> SLOW_CALL_SECONDS) model calls the breaker opens and calls fail at once
+with CircuitOpen. After OPEN_SECONDS it lets HALF_OPEN_PROBES calls through;
+a successful probe closes it, a failed one opens it again. /api/query/ falls
+back to the deterministic parser in commands.py while it is open.
+"""
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .metrics import LLM_CIRCUIT_REJECTIONS, LLM_CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = "HTTP_X_REQUEST_TIMEOUT_MS"
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the model answered."""
+
+
+class CircuitOpen(Exception):
+    """The model dependency is failing; calls are short-circuited for `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# --- Deadlines ---
+
+def current_deadline():
+    """The time.monotonic() value the current request must finish by, or None."""
+    return _deadline.get()
+
+
+@contextmanager
+def deadline_at(deadline):
+    """Run a block under an absolute deadline (e.g. one captured for a streaming generator)."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(default=None):
+    """
+    Seconds left before the current deadline, capped at `default`. Returns
+    `default` when there is no deadline; raises DeadlineExceeded when it has
+    passed.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("The request deadline passed before the language model answered.")
+    return left if default is None else min(left, default)
+
+
+class DeadlineMiddleware:
+    """Sets the request deadline from X-Request-Timeout-Ms or the configured default."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = getattr(settings, "LLM_RESILIENCE", {})
+        self.default = config.get("DEFAULT_DEADLINE", 180.0)
+        self.maximum = config.get("MAX_DEADLINE", self.default)
+
+    def __call__(self, request):
+        budget = self.default
+        header = request.META.get(DEADLINE_HEADER)
+        if header:
+            try:
+                budget = min(max(float(header) / 1000.0, 0.0), self.maximum)
+            except ValueError:
+                pass
+        with deadline_at(time.monotonic() + budget):
+            return self.get_response(request)
+
+
+# --- Circuit breaker ---
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, name="llm", failure_threshold=5, slow_call_seconds=60.0, open_seconds=30.0, half_open_probes=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        LLM_CIRCUIT_STATE.labels(breaker=name).set(STATE_VALUES[CLOSED])
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+            self._probes = 0
+        return self._state
+
+    def _set_state(self, state):
+        if state != self._state:
+            logger.warning("Circuit breaker '%s': %s -> %s", self.name, self._state, state)
+            self._state = state
+            LLM_CIRCUIT_STATE.labels(breaker=self.name).set(STATE_VALUES[state])
+
+    def _retry_after(self):
+        return max(1, math.ceil(self.open_seconds - (time.monotonic() - self._opened_at)))
+
+    def check(self):
+        """Raises CircuitOpen if a call would be short-circuited right now."""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._probes >= self.half_open_probes):
+                raise CircuitOpen("The language model is unavailable right now.", self._retry_after())
+
+    def _before(self):
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            LLM_CIRCUIT_REJECTIONS.labels(breaker=self.name).inc()
+            raise CircuitOpen("The language model is unavailable right now.", self._retry_after())
+
+    def _after(self, probe, ok, seconds):
+        with self._lock:
+            if probe:
+                self._probes -= 1
+            if ok is None:
+                # Neither success nor failure (e.g. rejected by the scheduler).
+                return
+            if ok and seconds is not None and seconds > self.slow_call_seconds:
+                ok = False
+            if ok:
+                self._failures = 0
+                if self._state == HALF_OPEN:
+                    self._set_state(CLOSED)
+                return
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    @contextmanager
+    def call(self):
+        """
+        Guards one call. Set result["ok"] (True/False) and result["seconds"]
+        inside the block; leaving ok as None records nothing.
+        """
+        probe = self._before()
+        result = {"ok": None, "seconds": None}
+        try:
+            yield result
+        finally:
+            self._after(probe, result["ok"], result["seconds"])
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                config = getattr(settings, "LLM_RESILIENCE", {})
+                _breaker = CircuitBreaker(
+                    failure_threshold=config.get("FAILURE_THRESHOLD", 5),
+                    slow_call_seconds=config.get("SLOW_CALL_SECONDS", 60.0),
+                    open_seconds=config.get("OPEN_SECONDS", 30.0),
+                    half_open_probes=config.get("HALF_OPEN_PROBES", 1),
+                )
+    return _breaker
@@ -0,0 +1,530 @@
+# inventory_api/rollups.py
+"""
+Daily inventory rollups: one InventoryDailyRollup row per day, so stock
+value trends, expired units per week and the like read one row per day
+instead of scanning the lot table.
+
+A row holds levels (stock on hand at the end of the day, or now for today:
+units, value at shelf price, expired lots, units and value, and SKUs under
+LOW_STOCK_QUANTITY units) and flows (ledger units received, sold, adjusted
+and written off during the day).
+
+Today's row is kept up to date by the code that changes stock (stock.py,
+Product.save() and the lot-delete signals), without rereading the table:
+
+- Writers touch() a SKU before changing its lots or price, inside
+  tracking(). The tracker locks the SKU's row, reads its levels then (one
+  grouped query over its lots) and again when the outermost tracking()
+  block exits, and appends the difference for today as one
+  InventoryRollupDelta row. The lock (SELECT ... FOR UPDATE; SQLite's
+  IMMEDIATE transactions already serialize writers) keeps two writers of
+  the same SKU under READ COMMITTED from starting from the same levels and
+  counting the first one's change twice; writers of different SKUs do not
+  wait on each other. Only the two states are compared, so anything in
+  between (repricing, expiry edits, lots moving between SKUs, savepoints
+  rolled back) counts exactly once.
+- Ledger entries add to the day's flows (record_flows()).
+- A lot deleted outside tracking() (QuerySet.delete(), a SKU's cascade)
+  is taken off by the delete signal on its own (lot_deleted()).
+
+Writers only ever insert deltas: no stock change updates the day's row, so
+they do not queue on it (on PostgreSQL an UPDATE would hold that one row
+locked until each writer commits). Reads add the day's pending deltas to
+its row in one statement (daily_rows()), and fold(), run by the report
+view, adds them into the rows and deletes them.
+
+The first touch of a day opens its row, and any missing days before it,
+from a snapshot of the current state (aggregate queries only). Nothing was
+touched on the missing days, so they differ from today only in which lots
+count as expired. Stock written around these paths (bulk_create(),
+QuerySet.update()) needs refresh_today().
+
+backfill() rebuilds past days from the stock ledger: each lot's and SKU's
+quantity is walked back from today through its movements, and the
+resulting piecewise-constant histories are summed per day with difference
+arrays. The ledger does not record prices, renames or the expiry dates of
+deleted lots, so history uses today's prices and never counts a deleted
+lot as expired.
+"""
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import InventoryDailyRollup, InventoryRollupDelta, Product, Sku, StockMovement
+
+LEVELS = (
+    "sku_count", "lot_count", "total_units", "stock_value",
+    "expired_lots", "expired_units", "expired_value", "low_stock_skus",
+)
+MONEY = ("stock_value", "expired_value")
+FLOWS = {
+    StockMovement.Kind.RECEIPT: "received_units",
+    StockMovement.Kind.SALE: "sold_units",
+    StockMovement.Kind.ADJUSTMENT: "adjusted_units",
+    StockMovement.Kind.WRITE_OFF: "written_off_units",
+}
+# Kept as units out, positive, rather than the ledger's negative quantities.
+OUTFLOWS = ("sold_units", "written_off_units")
+COUNTS = LEVELS + tuple(FLOWS.values())
+PERIODS = ("day", "week", "month")
+
+_tracker = contextvars.ContextVar("rollup_tracker", default=None)
+# The latest day this process knows has a row; saves an existence check per write.
+_opened_day = None
+
+
+def _low_stock_quantity():
+    return getattr(settings, "ROLLUPS", {}).get("LOW_STOCK_QUANTITY", 50)
+
+
+def _value():
+    return Cast("quantity", FloatField()) * Cast("price", FloatField())
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _money(value):
+    return Decimal(str(round(float(value), 2)))
+
+
+class _Tracker:
+    def __init__(self, today):
+        self.today = today
+        self.before = {}
+        self.flows = defaultdict(int)
+
+    def apply(self):
+        change = np.zeros(len(LEVELS))
+        if self.before:
+            after = _sku_levels(list(self.before), self.today)
+            for sku_id, levels in self.before.items():
+                change += after.get(sku_id, 0) - levels
+        deltas = {}
+        for field, value in zip(LEVELS, change):
+            value = _money(value) if field in MONEY else int(round(value))
+            if value:
+                deltas[field] = value
+        deltas.update({field: units for field, units in self.flows.items() if units})
+        _add(self.today, deltas)
+
+
+def _sku_levels(sku_ids, today):
+    """
+    The SKUs' shares of the levels, {sku_id: array in LEVELS order}, for
+    those holding stock. Plain SQL: this runs twice per stock change, and
+    compiling the equivalent annotated queryset costs more than running it.
+    """
+    table = Product._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT sku_id, COUNT(*), SUM(quantity), SUM(quantity * price),"
+            f" SUM(CASE WHEN expiry_date < %s THEN 1 ELSE 0 END),"
+            f" SUM(CASE WHEN expiry_date < %s THEN quantity ELSE 0 END),"
+            f" SUM(CASE WHEN expiry_date < %s THEN quantity * price ELSE 0 END)"
+            f" FROM {table} WHERE quantity > 0 AND sku_id IN ({', '.join(['%s'] * len(sku_ids))}) GROUP BY sku_id",
+            [today, today, today, *sku_ids],
+        )
+        rows = cursor.fetchall()
+    threshold = _low_stock_quantity()
+    return {
+        sku_id: np.array([1, lots, units, float(value), expired_lots, expired_units, float(expired_value),
+                          units < threshold], dtype=np.float64)
+        for sku_id, lots, units, value, expired_lots, expired_units, expired_value in rows
+    }
+
+
+@contextmanager
+def tracking():
+    """
+    Collects the level changes made to touch()ed SKUs inside the block and
+    adds them to today's row when the outermost block exits. Enter it just
+    inside the transaction.atomic() block that makes the changes: when the
+    block raises, the changes are rolled back, and so is the tracking.
+    """
+    tracker = _tracker.get()
+    if tracker is not None:
+        flows = dict(tracker.flows)
+        try:
+            yield
+        except BaseException:
+            # The savepoint took this block's ledger entries with it; levels are compared by state anyway.
+            tracker.flows = defaultdict(int, flows)
+            raise
+        return
+
+    tracker = _Tracker(timezone.localdate())
+    token = _tracker.set(tracker)
+    try:
+        yield
+    finally:
+        _tracker.reset(token)
+    tracker.apply()
+
+
+def touch(sku_ids):
+    """
+    Call before changing the lots or price of these SKUs. Opens today's row
+    if needed and, inside tracking(), locks the SKUs' rows until the
+    transaction ends and records where they stand.
+    """
+    tracker = _tracker.get()
+    open_day(tracker.today if tracker else None)
+    if tracker is None:
+        return
+    new = {sku_id for sku_id in sku_ids if sku_id is not None} - tracker.before.keys()
+    if new:
+        if connection.features.has_select_for_update:
+            # In id order, so writers touching several SKUs take the locks in the same order.
+            list(Sku.objects.select_for_update().filter(pk__in=new).order_by("pk").values_list("pk", flat=True))
+        levels = _sku_levels(new, tracker.today)
+        tracker.before.update({sku_id: levels.get(sku_id, np.zeros(len(LEVELS))) for sku_id in new})
+
+
+def record_flows(entries):
+    """Adds new ledger entries to today's flows (when the tracking() block ends, inside one)."""
+    units = defaultdict(int)
+    for entry in entries:
+        field = FLOWS[entry.kind]
+        units[field] += -entry.quantity if field in OUTFLOWS else entry.quantity
+    tracker = _tracker.get()
+    if tracker is None:
+        _add(timezone.localdate(), units)
+    else:
+        for field, value in units.items():
+            tracker.flows[field] += value
+
+
+@contextmanager
+def lot_deleted(lot):
+    """
+    Wraps the SKU-total refresh after `lot` was deleted. Outside tracking()
+    it takes the lot's own levels off today's row, plus any change to its
+    SKU's counts, read from the SKU's totals before and after the refresh.
+    Inside tracking() the tracker covers it (the delete signal touched the SKU).
+    """
+    if _tracker.get() is not None:
+        yield
+        return
+    before = Sku.objects.filter(pk=lot.sku_id).values_list("total_quantity", flat=True).first() or 0
+    yield
+    after = Sku.objects.filter(pk=lot.sku_id).values_list("total_quantity", flat=True).first() or 0
+
+    today = timezone.localdate()
+    threshold = _low_stock_quantity()
+    deltas = {
+        "sku_count": int(after > 0) - int(before > 0),
+        "low_stock_skus": int(0 < after < threshold) - int(0 < before < threshold),
+    }
+    if lot.quantity > 0:
+        value = _money(lot.quantity * Decimal(str(lot.price)))
+        deltas.update(lot_count=-1, total_units=-lot.quantity, stock_value=-value)
+        if lot.expiry_date < today:
+            deltas.update(expired_lots=-1, expired_units=-lot.quantity, expired_value=-value)
+    _add(today, {field: value for field, value in deltas.items() if value})
+
+
+def _add(day, deltas):
+    if not deltas:
+        return
+    if open_day(day):
+        # Not opened before the change (a write outside tracking(), or the row was rebuilt
+        # meanwhile); the snapshot just taken already includes it.
+        return
+    # Plain SQL, like _sku_levels(): a small INSERT on the hot path of every stock change. The
+    # model's defaults are Python-side, so every column is given.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {InventoryRollupDelta._meta.db_table} (date, {', '.join(COUNTS)})"
+            f" VALUES (%s{', %s' * len(COUNTS)})",
+            [day, *(deltas.get(field, 0) for field in COUNTS)],
+        )
+
+
+def _remember_open(day):
+    global _opened_day
+    _opened_day = max(day, _opened_day or day)
+
+
+def open_day(day=None):
+    """
+    Creates the row for `day` (default today), and for any missing days
+    since the last row, if needed. Returns whether it did.
+    """
+    day = day or timezone.localdate()
+    if _opened_day is not None and day <= _opened_day:
+        return False
+    created = not InventoryDailyRollup.objects.filter(date=day).exists()
+    if created:
+        last = InventoryDailyRollup.objects.filter(date__lt=day).order_by("-date").values_list("date", flat=True).first()
+        days = [day] if last is None else [last + timedelta(days=n) for n in range(1, (day - last).days + 1)]
+        InventoryDailyRollup.objects.bulk_create(snapshot(days), ignore_conflicts=True)
+    # Only once the row is committed; a rolled-back open leaves the next write to check again.
+    transaction.on_commit(partial(_remember_open, day))
+    return created
+
+
+def fold():
+    """
+    Adds the pending InventoryRollupDelta rows into their days' rows and
+    deletes them; returns how many it folded. Deltas of days without a row
+    (rebuilt or deleted since) are dropped, as daily_rows() ignores them.
+    Only readers call this, so the rows it updates are never contended by
+    stock writers.
+    """
+    table = InventoryRollupDelta._meta.db_table
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # DELETE ... RETURNING takes exactly the committed deltas it removes, whatever commits meanwhile.
+            cursor.execute(f"DELETE FROM {table} RETURNING date, {', '.join(COUNTS)}")
+            deltas = cursor.fetchall()
+        totals = defaultdict(lambda: defaultdict(int))
+        for day, *values in deltas:
+            for field, value in zip(COUNTS, values):
+                if value:
+                    totals[_as_date(day)][field] += Decimal(str(value)) if field in MONEY else value
+        for day, changes in sorted(totals.items()):
+            InventoryDailyRollup.objects.filter(date=day).update(
+                **{field: F(field) + value for field, value in changes.items()})
+    return len(deltas)
+
+
+def _as_date(value):
+    # SQLite hands dates from plain SQL back as text.
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def daily_rows(since, until):
+    """
+    {"date", *COUNTS} per day from `since` to `until` that has a row,
+    oldest first, with the day's pending deltas added. One statement, so a
+    concurrent fold() is seen either entirely or not at all.
+    """
+    rollup, delta = InventoryDailyRollup._meta.db_table, InventoryRollupDelta._meta.db_table
+    columns = ", ".join(COUNTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT date, {', '.join(f'SUM({field})' for field in COUNTS)} FROM ("
+            f" SELECT date, 1 AS base, {columns} FROM {rollup} WHERE date >= %s AND date <= %s"
+            f" UNION ALL"
+            f" SELECT date, 0 AS base, {columns} FROM {delta} WHERE date >= %s AND date <= %s"
+            f") AS counts GROUP BY date HAVING SUM(base) > 0 ORDER BY date",
+            [since, until, since, until],
+        )
+        rows = cursor.fetchall()
+    return [
+        {"date": _as_date(day), **{field: _money(value) if field in MONEY else int(value)
+                                   for field, value in zip(COUNTS, values)}}
+        for day, *values in rows
+    ]
+
+
+def snapshot(days):
+    """
+    Unsaved rows for `days` (ascending) from the lot table as it stands:
+    the same levels for every day except which lots count as expired (one
+    aggregate per expiry date, accumulated), and each day's ledger flows.
+    """
+    by_expiry = pd.DataFrame.from_records(
+        Product.objects.filter(quantity__gt=0).order_by("expiry_date").values("expiry_date")
+        .annotate(lots=Count("id"), units=Sum("quantity"), value=Sum(_value()))
+        .values_list("expiry_date", "lots", "units", "value"),
+        columns=["expiry_date", "lots", "units", "value"],
+    )
+    # Row k: lots, units and value of the lots expiring before the k-th expiry date.
+    cumulative = np.vstack([np.zeros(3), by_expiry[["lots", "units", "value"]].to_numpy(np.float64).cumsum(axis=0)])
+    expired = cumulative[np.searchsorted(pd.to_datetime(by_expiry["expiry_date"]).to_numpy(),
+                                         pd.to_datetime(pd.Series(days)).to_numpy())]
+    lots, units, value = cumulative[-1]
+    threshold = _low_stock_quantity()
+    skus = Sku.objects.aggregate(
+        sku_count=Count("id", filter=Q(total_quantity__gt=0)),
+        low_stock_skus=Count("id", filter=Q(total_quantity__gt=0, total_quantity__lt=threshold)),
+    )
+    flows = _flows(_ledger(days[0], days[-1]), (days[-1] - days[0]).days + 1)
+
+    rows = []
+    for day, (expired_lots, expired_units, expired_value) in zip(days, expired):
+        offset = (day - days[0]).days
+        rows.append(InventoryDailyRollup(
+            date=day, sku_count=skus["sku_count"], lot_count=int(lots), total_units=int(units),
+            stock_value=_money(value), expired_lots=int(expired_lots), expired_units=int(expired_units),
+            expired_value=_money(expired_value), low_stock_skus=skus["low_stock_skus"],
+            **{field: int(daily[offset]) for field, daily in flows.items()},
+        ))
+    return rows
+
+
+def refresh_today():
+    """Recomputes today's row from a snapshot, after stock was changed around the tracked paths."""
+    row = snapshot([timezone.localdate()])[0]
+    with transaction.atomic():
+        InventoryRollupDelta.objects.filter(date=row.date).delete()
+        InventoryDailyRollup.objects.update_or_create(
+            date=row.date, defaults={field: getattr(row, field) for field in COUNTS})
+
+
+def _ledger(first, last):
+    """Ledger entries from the start of `first` to the end of `last`, with `day` counted from `first`."""
+    start = _day_start(first)
+    entries = (
+        StockMovement.objects.filter(created_at__gte=start, created_at__lt=_day_start(last + timedelta(days=1)))
+        .order_by()
+        .values_list("lot_id", "sku_id", "kind", "quantity", "created_at")
+    )
+    # A plain cursor skips Django's per-row model and timestamp handling (see forecasting.py).
+    sql, params = entries.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ledger = pd.DataFrame.from_records(cursor.fetchall(),
+                                           columns=["lot_id", "sku_id", "kind", "quantity", "created_at"])
+    created_at = pd.to_datetime(ledger["created_at"], utc=True, format="ISO8601")
+    ledger["day"] = ((created_at - pd.Timestamp(start)) // pd.Timedelta(days=1)).to_numpy(np.int64)
+    return ledger.drop(columns="created_at")
+
+
+def _flows(ledger, n):
+    """Units per flow field and day, as arrays of length n."""
+    flows = {}
+    for kind, field in FLOWS.items():
+        entries = ledger[ledger["kind"] == kind]
+        units = np.bincount(entries["day"], weights=entries["quantity"].to_numpy(np.float64), minlength=n)[:n]
+        flows[field] = -units if field in OUTFLOWS else units
+    return flows
+
+
+def _histories(owner, day, delta, now, n):
+    """
+    Walks quantities back from today: `now[k]` stands at the end of day
+    n-1, and owner k's quantity changed by `delta` on `day`. Returns
+    (owner, start, end, value) segments, one owner holding `value` at the
+    end of each day from start to end-1; together they cover days 0..n-1
+    for every owner.
+    """
+    moves = (pd.DataFrame({"owner": owner, "day": day, "delta": delta})
+             .groupby(["owner", "day"], as_index=False)["delta"].sum())
+    o, d, dq = (moves[column].to_numpy() for column in ("owner", "day", "delta"))
+    # Change on or after each row's day, per owner.
+    later = moves.iloc[::-1].groupby("owner")["delta"].cumsum().iloc[::-1].to_numpy()
+    first = np.ones(len(o), dtype=bool)
+    first[1:] = o[1:] != o[:-1]
+    end = np.full(len(o), n)
+    end[:-1] = np.where(first[1:], n, d[1:])
+    untouched = np.setdiff1d(np.arange(len(now)), o)
+    return (
+        np.concatenate([untouched, o[first], o]),
+        np.concatenate([np.zeros(len(untouched), np.int64), np.zeros(first.sum(), np.int64), d]),
+        np.concatenate([np.full(len(untouched), n), d[first], end]),
+        np.concatenate([now[untouched], now[o[first]] - later[first], now[o] - later + dq]).clip(0, None),
+    )
+
+
+def _spread(start, end, weights, n):
+    """Per-day sums of weights held over [start, end), via a difference array."""
+    weights = np.asarray(weights, dtype=np.float64)
+    diff = np.bincount(start, weights, minlength=n + 1) - np.bincount(end, weights, minlength=n + 1)
+    return np.cumsum(diff)[:n]
+
+
+def backfill(since, today=None):
+    """
+    Rebuilds the rows from `since` through today from the current lots and
+    the ledger (see the module docstring), replacing those that exist.
+    Returns the number of rows written.
+    """
+    today = today or timezone.localdate()
+    n = (today - since).days + 1
+    if n < 1:
+        return 0
+    ledger = _ledger(since, today)
+    skus = pd.DataFrame.from_records(
+        Sku.objects.order_by().annotate(price_value=Cast("price", FloatField()))
+        .values_list("id", "price_value", "total_quantity"),
+        columns=["sku_id", "price", "quantity"],
+    )
+    lots = pd.DataFrame.from_records(
+        Product.objects.order_by().annotate(price_value=Cast("price", FloatField()))
+        .values_list("id", "sku_id", "quantity", "price_value", "expiry_date"),
+        columns=["lot_id", "sku_id", "quantity", "price", "expiry_date"],
+    )
+    # Deleted lots appear only in the ledger: no stock now, their SKU's price, no expiry date.
+    moved = ledger.dropna(subset=["lot_id"]).astype({"lot_id": np.int64})
+    deleted = moved.groupby("lot_id")["sku_id"].last().drop(lots["lot_id"], errors="ignore")
+    lots = pd.concat([lots, pd.DataFrame({
+        "lot_id": deleted.index, "sku_id": deleted.to_numpy(), "quantity": 0,
+        "price": deleted.map(skus.set_index("sku_id")["price"]).fillna(0.0).to_numpy(), "expiry_date": None,
+    })], ignore_index=True)
+    # Lots count as expired from the day after their expiry date; n means never within the range.
+    expires = (pd.to_datetime(lots["expiry_date"]) - pd.Timestamp(since)).dt.days.fillna(n).to_numpy(np.int64)
+
+    owner, start, end, units = _histories(pd.Index(lots["lot_id"]).get_indexer(moved["lot_id"]), moved["day"],
+                                          moved["quantity"], lots["quantity"].to_numpy(np.float64), n)
+    held = units > 0
+    value = units * lots["price"].to_numpy(np.float64)[owner]
+    expired_from = np.maximum(start, expires[owner] + 1)
+    expired = expired_from < end
+    levels = {
+        "lot_count": _spread(start, end, held, n),
+        "total_units": _spread(start, end, units, n),
+        "stock_value": _spread(start, end, value, n),
+        "expired_lots": _spread(expired_from[expired], end[expired], held[expired], n),
+        "expired_units": _spread(expired_from[expired], end[expired], units[expired], n),
+        "expired_value": _spread(expired_from[expired], end[expired], value[expired], n),
+    }
+
+    sku_index = pd.Index(skus["sku_id"]).union(pd.Index(ledger["sku_id"].unique()))
+    now = np.zeros(len(sku_index))
+    now[sku_index.get_indexer(skus["sku_id"])] = skus["quantity"].to_numpy(np.float64)
+    _, start, end, units = _histories(sku_index.get_indexer(ledger["sku_id"]), ledger["day"], ledger["quantity"], now, n)
+    levels["sku_count"] = _spread(start, end, units > 0, n)
+    levels["low_stock_skus"] = _spread(start, end, (units > 0) & (units < _low_stock_quantity()), n)
+    levels.update(_flows(ledger, n))
+
+    rows = [
+        InventoryDailyRollup(date=since + timedelta(days=i), **{
+            field: _money(daily[i]) if field in MONEY else int(round(daily[i])) for field, daily in levels.items()
+        })
+        for i in range(n)
+    ]
+    with transaction.atomic():
+        InventoryRollupDelta.objects.filter(date__gte=since, date__lte=today).delete()
+        InventoryDailyRollup.objects.filter(date__gte=since, date__lte=today).delete()
+        InventoryDailyRollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def report(since, until, period="day"):
+    """
+    Rows from `since` to `until`, oldest first, per day or per week/month
+    (starting on the period's first day): a period's levels are those of
+    its last day, its flows the sum over its days.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}'; expected one of {', '.join(PERIODS)}.")
+    frame = pd.DataFrame.from_records(daily_rows(since, until))
+    if frame.empty:
+        return []
+    dates = pd.to_datetime(frame["date"])
+    if period == "week":
+        dates = dates - pd.to_timedelta(dates.dt.weekday, unit="D")
+    elif period == "month":
+        dates = dates.dt.to_period("M").dt.start_time
+    grouped = frame.groupby(dates.dt.date.rename("period_start"), sort=True)
+    result = grouped[list(LEVELS)].last().join(grouped[list(FLOWS.values())].sum())
+    result.insert(0, "days", grouped.size())
+    for field in MONEY:
+        result[field] = result[field].map(lambda value: f"{value:.2f}")
+    # period_start stays a date; the API's renderer writes it as YYYY-MM-DD.
+    return result.reset_index().astype(object).to_dict("records")
@@ -0,0 +1,169 @@
+# inventory_api/scheduler.py
+"""
+Admission control for model calls.
+
+At most LLM_SCHEDULER["MAX_CONCURRENCY"] generations run at once per process;
+further calls wait in a priority queue where interactive callers (the
+dashboard's /api/query/) go ahead of batch work (reason_inventory, other
+background jobs). Each class has a bounded queue and a maximum wait; beyond
+either, SchedulerBusy is raised with a Retry-After estimate so the API can
+answer 429 instead of stacking up model timeouts.
+
+Queue wait is recorded separately from generation time, both in
+/metrics (warevision_llm_queue_wait_seconds) and as the "llm_queue" stage of
+the Server-Timing header.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_REJECTIONS, LLM_QUEUE_WAIT_SECONDS
+from .resilience import DeadlineExceeded, current_deadline, remaining
+from .timing import span
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+class SchedulerBusy(Exception):
+    """The model queue is full (or the wait timed out); retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "cancelled")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=4, max_queue=None, queue_timeout=None):
+        self.max_concurrency = max(1, max_concurrency)
+        # Per priority class: waiting-room size and the longest allowed wait.
+        self.max_queue = max_queue or {INTERACTIVE: 16, BATCH: 64}
+        self.queue_timeout = queue_timeout or {INTERACTIVE: 30.0, BATCH: 600.0}
+        self._lock = threading.Lock()
+        self._active = 0
+        self._heap = []  # (priority, seq, waiter)
+        self._queued = {INTERACTIVE: 0, BATCH: 0}
+        self._seq = itertools.count()
+        # Moving average of how long a slot is held, for Retry-After.
+        self._avg_service = 5.0
+
+    def _retry_after(self, priority) -> int:
+        ahead = sum(n for p, n in self._queued.items() if p <= priority) + 1
+        return max(1, math.ceil(self._avg_service * ahead / self.max_concurrency))
+
+    def check_admission(self, priority):
+        """Raises SchedulerBusy if a call of this priority would be rejected right now."""
+        with self._lock:
+            if self._active >= self.max_concurrency and self._queued[priority] >= self.max_queue[priority]:
+                raise SchedulerBusy("The language model is busy. Please try again shortly.",
+                                    self._retry_after(priority))
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        """Blocks until a generation slot is free; raises SchedulerBusy instead of waiting too long."""
+        name = PRIORITY_NAMES[priority]
+        started = time.perf_counter()
+        with span("llm_queue"):
+            self._acquire(priority, name)
+        LLM_QUEUE_WAIT_SECONDS.labels(priority=name).observe(time.perf_counter() - started)
+
+        held_from = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - held_from)
+
+    def _acquire(self, priority, name):
+        # Never wait past the request's deadline (raises DeadlineExceeded if it has passed).
+        timeout = remaining(self.queue_timeout[priority])
+        with self._lock:
+            if self._active < self.max_concurrency and not any(self._queued.values()):
+                self._active += 1
+                return
+            if self._queued[priority] >= self.max_queue[priority]:
+                LLM_QUEUE_REJECTIONS.labels(priority=name, reason="queue_full").inc()
+                raise SchedulerBusy("The language model is busy. Please try again shortly.",
+                                    self._retry_after(priority))
+            waiter = _Waiter()
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self._queued[priority] += 1
+            LLM_QUEUE_DEPTH.labels(priority=name).inc()
+
+        waiter.event.wait(timeout)
+
+        with self._lock:
+            if waiter.granted:
+                return
+            # Timed out: leave the queue (the heap entry is skipped when popped).
+            waiter.cancelled = True
+            self._queued[priority] -= 1
+            LLM_QUEUE_DEPTH.labels(priority=name).dec()
+            LLM_QUEUE_REJECTIONS.labels(priority=name, reason="timeout").inc()
+            deadline = current_deadline()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("The request deadline passed while waiting for the language model.")
+            raise SchedulerBusy("Timed out waiting for the language model. Please try again shortly.",
+                                self._retry_after(priority))
+
+    def _release(self, held_seconds):
+        with self._lock:
+            self._avg_service = 0.8 * self._avg_service + 0.2 * held_seconds
+            while self._heap:
+                priority, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                # Hand the slot straight to the next waiter; _active is unchanged.
+                self._queued[priority] -= 1
+                LLM_QUEUE_DEPTH.labels(priority=PRIORITY_NAMES[priority]).dec()
+                waiter.granted = True
+                waiter.event.set()
+                return
+            self._active -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "queued": {PRIORITY_NAMES[p]: n for p, n in self._queued.items()},
+            }
+
+
+def priority_for(caller: str) -> int:
+    config = getattr(settings, "LLM_SCHEDULER", {})
+    return INTERACTIVE if caller in config.get("INTERACTIVE_CALLERS", ("query",)) else BATCH
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                config = getattr(settings, "LLM_SCHEDULER", {})
+                _scheduler = LLMScheduler(
+                    max_concurrency=config.get("MAX_CONCURRENCY", 4),
+                    max_queue={INTERACTIVE: config.get("MAX_QUEUE", 16),
+                               BATCH: config.get("MAX_BATCH_QUEUE", 64)},
+                    queue_timeout={INTERACTIVE: config.get("QUEUE_TIMEOUT", 30.0),
+                                   BATCH: config.get("BATCH_QUEUE_TIMEOUT", 600.0)},
+                )
+    return _scheduler
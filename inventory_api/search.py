@@ -0,0 +1,290 @@
+# inventory_api/search.py
+"""
+Product (SKU) name search that tolerates partial and misspelled names.
+
+Matching works on trigrams, like PostgreSQL's pg_trgm. A SKU matches when
+enough of the query's trigrams occur in its name: word_similarity is the
+share of the query's trigrams found in the name. This handles both "milk"
+for "Amul Taaza Milk 1L" and "choclate" for "Dark Chocolate". Ties are
+broken by whole-name similarity.
+
+- SQLite: an FTS5 table with the trigram tokenizer (inventory_api_sku_fts).
+  It is an external-content index over inventory_api_sku and triggers keep it
+  in sync. Candidates come from a bm25-ranked AND of the query's trigrams,
+  falling back to a bm25-ranked OR of its rarest ones (see _fts_candidates),
+  and are re-scored in Python.
+- PostgreSQL: a GIN pg_trgm index on inventory_api_sku.name, ordered by
+  TrigramWordSimilarity.
+- Anything else, or SQLite without FTS5: a substring scan.
+
+Search is per warehouse: candidates are drawn from the current warehouse's
+SKUs only (the FTS passes join inventory_api_sku on its rowid), so one
+site's catalogue cannot crowd another's matches out of the CANDIDATES.
+Every backend ranks candidates in SQL before the LIMIT, and a SKU whose
+normalized name is the query (name_key) is always a candidate, so the best
+match is found however many names contain the query.
+
+Django rebuilds SQLite tables for some schema changes, which drops the sync
+triggers. A migration that alters inventory_api_sku must re-create them
+from its own copy of the SQL below, as 0008_warehouses does (migrations
+must not import this module, or changing it would change them), or the
+index must be rebuilt with `manage.py rebuild_search_index`.
+"""
+import logging
+import re
+import threading
+import time
+
+from django.db import DatabaseError, connection
+from django.db.models.functions import Length
+
+from .models import Sku, normalize_sku_name
+from .warehouses import current_warehouse_id
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "inventory_api_sku_fts"
+FTS_VOCAB_TABLE = "inventory_api_sku_fts_vocab"
+# Candidates re-scored per query, at least; deeper pages fetch as many as they reach.
+CANDIDATES = 100
+# Trigrams OR-ed in the ranked pass: the rarest are the most selective and the cheapest to rank.
+RAREST_TERMS = 12
+TERM_CACHE_SECONDS = 300
+TERM_CACHE_SIZE = 100_000
+# Minimum share of the query's trigrams a name must contain.
+MIN_WORD_SIMILARITY = 0.5
+# resolve_sku_name() gives up when the runner-up scores within this of the best match.
+AMBIGUITY_MARGIN = 0.05
+
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"name, content='inventory_api_sku', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON inventory_api_sku BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON inventory_api_sku BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name ON inventory_api_sku BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, 'row')",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_VOCAB_TABLE}",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS sku_name_trgm_idx ON inventory_api_sku USING gin (name gin_trgm_ops)",
+]
+POSTGRES_DROP_SQL = ["DROP INDEX IF EXISTS sku_name_trgm_idx"]
+
+_fts_available = None
+_term_cache = {}
+_term_cache_lock = threading.Lock()
+_term_cache_reset = 0.0
+
+
+def install_search_index(schema_editor):
+    """Creates (or re-creates and fills) the search index for the database's vendor."""
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        try:
+            for sql in SQLITE_INDEX_SQL:
+                schema_editor.execute(sql)
+        except DatabaseError as e:
+            # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer).
+            logger.warning("SQLite full-text search unavailable, product search will scan: %s", e)
+    elif vendor == "postgresql":
+        for sql in POSTGRES_INDEX_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_DROP_SQL, "postgresql": POSTGRES_DROP_SQL}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def trigrams(text: str) -> set:
+    """pg_trgm-style trigrams: lowercased words, each padded with two spaces before and one after."""
+    grams = set()
+    for word in re.findall(r"\w+", (text or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(query: str, name: str):
+    """(word_similarity, similarity) of `name` to `query`, both in [0, 1]."""
+    query_grams, name_grams = trigrams(query), trigrams(name)
+    if not query_grams or not name_grams:
+        return 0.0, 0.0
+    shared = len(query_grams & name_grams)
+    return shared / len(query_grams), shared / len(query_grams | name_grams)
+
+
+def _sqlite_fts_ready() -> bool:
+    global _fts_available
+    if _fts_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts_available = cursor.fetchone() is not None
+    return _fts_available
+
+
+def _fts_terms(query: str):
+    """Every 3-character window of the query (what the trigram tokenizer indexes), as FTS5 strings."""
+    text = " ".join(query.lower().split())
+    return sorted({'"{}"'.format(text[i:i + 3].replace('"', '""')) for i in range(len(text) - 2)})
+
+
+def _term_frequencies(cursor, terms):
+    """
+    Document counts of FTS terms from the fts5vocab table. They are cached
+    per process for TERM_CACHE_SECONDS, because a vocab lookup costs about a
+    millisecond per term and the counts change slowly.
+    """
+    global _term_cache_reset
+    now = time.monotonic()
+    with _term_cache_lock:
+        if now - _term_cache_reset > TERM_CACHE_SECONDS or len(_term_cache) > TERM_CACHE_SIZE:
+            _term_cache.clear()
+            _term_cache_reset = now
+        missing = [term for term in terms if term not in _term_cache]
+    if missing:
+        cursor.execute(
+            f"SELECT term, doc FROM {FTS_VOCAB_TABLE} WHERE term IN ({', '.join(['%s'] * len(missing))})",
+            [term[1:-1].replace('""', '"') for term in missing],
+        )
+        found = {'"{}"'.format(term.replace('"', '""')): docs for term, docs in cursor.fetchall()}
+        with _term_cache_lock:
+            for term in missing:
+                _term_cache[term] = found.get(term, 0)
+    with _term_cache_lock:
+        return {term: _term_cache.get(term, 0) for term in terms}
+
+
+def _fts_candidates(cursor, query: str, warehouse_id, limit):
+    """
+    Two passes, each ranked by bm25 (short names holding the query's
+    trigrams first) and keeping only SKUs of the warehouse `warehouse_id`.
+    First the names containing every trigram of the query that occurs
+    anywhere in the index, which covers partial names and typos that make
+    up non-existent trigrams. If that finds nothing, the names containing
+    any of the query's RAREST_TERMS rarest trigrams. Returns (ids, total):
+    the best `limit` ids, and how many names the AND pass matched (the
+    OR pass is not counted past its ids, most of its matches score too low).
+    """
+    terms = _fts_terms(query)
+    frequency = _term_frequencies(cursor, terms)
+    present = sorted((term for term in terms if frequency.get(term)), key=frequency.get)
+    if not present:
+        return [], 0
+
+    # CROSS JOIN makes SQLite drive the join from the MATCH; left to itself it may scan the
+    # warehouse's SKUs and probe the index once per row, which takes seconds at 10k SKUs.
+    matching = (
+        f"FROM {FTS_TABLE} CROSS JOIN inventory_api_sku AS sku ON sku.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s AND sku.warehouse_id = %s"
+    )
+    every = " AND ".join(present)
+    cursor.execute(f"SELECT {FTS_TABLE}.rowid {matching} ORDER BY bm25({FTS_TABLE}) LIMIT %s",
+                   [every, warehouse_id, limit])
+    ids = [row[0] for row in cursor.fetchall()]
+    if len(ids) == limit:
+        cursor.execute(f"SELECT COUNT(*) {matching}", [every, warehouse_id])
+        return ids, cursor.fetchone()[0]
+    if ids or len(present) == 1:
+        return ids, len(ids)
+    cursor.execute(
+        f"SELECT {FTS_TABLE}.rowid {matching} ORDER BY bm25({FTS_TABLE}) LIMIT %s",
+        [" OR ".join(present[:RAREST_TERMS]), warehouse_id, limit],
+    )
+    ids = [row[0] for row in cursor.fetchall()]
+    return ids, len(ids)
+
+
+def _candidate_ids(query: str, warehouse_id, limit):
+    """
+    (ids, total): the ids of up to `limit` SKUs of the warehouse, best
+    first, and how many SKUs matched the query in SQL.
+    """
+    query = query.strip()
+    skus = Sku.objects.filter(warehouse_id=warehouse_id)
+    if connection.vendor == "sqlite" and _sqlite_fts_ready() and len(query) >= 3:
+        with connection.cursor() as cursor:
+            return _fts_candidates(cursor, query, warehouse_id, limit)
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        matches = (skus.annotate(word_similarity=TrigramWordSimilarity(query, "name"))
+                   .filter(word_similarity__gte=MIN_WORD_SIMILARITY / 2))
+        ids = list(matches.order_by("-word_similarity", "id").values_list("id", flat=True)[:limit])
+    else:
+        matches = skus.filter(name__icontains=query)
+        # Every match contains the query; the shortest names are the closest.
+        ids = list(matches.order_by(Length("name"), "id").values_list("id", flat=True)[:limit])
+    return ids, matches.count() if len(ids) == limit else len(ids)
+
+
+def _named(query: str, warehouse_id):
+    """The warehouse's SKU named `query`, ignoring case and spacing (its name_key), as a queryset."""
+    return Sku.objects.filter(warehouse_id=warehouse_id, name_key=normalize_sku_name(query))
+
+
+def search_skus(query: str, limit: int = 20, offset: int = 0, warehouse=None):
+    """
+    Returns (count, [(sku, score), ...]) for the page starting at `offset`,
+    best first, among the SKUs of `warehouse` (default: the current one).
+    The page is re-scored from at least CANDIDATES candidates ranked in
+    SQL. `count` is the number of matches; when there are more than the
+    candidates, those beyond them are counted as the SQL pass found them.
+    """
+    query = (query or "").strip()
+    if not query:
+        return 0, []
+    needle = query.lower()
+    scored = []
+    warehouse_id = warehouse.pk if warehouse is not None else current_warehouse_id()
+    ids, total = _candidate_ids(query, warehouse_id, max(CANDIDATES, offset + limit))
+    exact = _named(query, warehouse_id).values_list("id", flat=True).first()
+    if exact is not None and exact not in ids:
+        ids.append(exact)
+        total += 1
+    for pk, name in Sku.objects.filter(pk__in=ids).values_list("id", "name"):
+        word_score, name_score = similarity(query, name)
+        if needle in name.lower():
+            word_score = 1.0
+        if word_score >= MIN_WORD_SIMILARITY:
+            scored.append((word_score, name_score, name, pk))
+    scored.sort(key=lambda item: (-item[0], -item[1], item[2]))
+    page = scored[offset:offset + limit]
+    skus = Sku.objects.in_bulk([pk for *_, pk in page])
+    count = len(scored) + max(total - len(ids), 0)
+    return count, [(skus[pk], round((word_score + name_score) / 2, 3)) for word_score, name_score, _, pk in page]
+
+
+def resolve_sku_name(name: str, min_score: float = 0.6, warehouse=None):
+    """
+    The SKU of `warehouse` (default: the current one) a free-text name most
+    likely refers to, or None when there is no confident match: the SKU
+    with that exact name (ignoring case and spacing) if there is one, else
+    the best search result, unless the runner-up is about as good. Used
+    when the model names a product instead of giving its id, or gives an
+    id that does not exist.
+    """
+    warehouse_id = warehouse.pk if warehouse is not None else current_warehouse_id()
+    exact = _named(name, warehouse_id).first()
+    if exact is not None:
+        return exact
+    _, results = search_skus(name, limit=2, warehouse=warehouse)
+    if not results or results[0][1] < min_score:
+        return None
+    if len(results) > 1 and results[0][1] - results[1][1] < AMBIGUITY_MARGIN:
+        return None
+    return results[0][0]
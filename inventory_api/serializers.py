@@ -1,10 +1,131 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Product
+from .models import LLMJob, Product, Sku, StockMovement, Warehouse
+from .stock import Movement, apply_movements, receive_lot
 
 class ProductSerializer(serializers.ModelSerializer):
     """
-    Serializer for the Product model. Converts Product model instances to JSON.
+    Serializer for the Product model (a stock lot). Converts Product model instances to JSON.
     """
     class Meta:
         model = Product
-        fields = ['id', 'product_name', 'price', 'expiry_date']
\ No newline at end of file
+        fields = ['id', 'product_name', 'price', 'quantity', 'expiry_date', 'sku', 'version', 'discount_percent']
+        # discount_percent is set by the markdown engine (reason_inventory).
+        read_only_fields = ['sku', 'version', 'discount_percent']
+
+    def create(self, validated_data):
+        # Stock of an item that is already stocked joins its SKU (and the lot with the same expiry).
+        lot, _ = receive_lot(source=self.context.get('source', 'api'), **validated_data)
+        return lot
+
+    def update(self, instance, validated_data):
+        # A new quantity becomes an ADJUSTMENT movement, applied only if the lot is
+        # still at the version the client sent (or the one read for this
+        # request); other fields are saved without writing quantity back.
+        quantity = validated_data.pop('quantity', None)
+        with transaction.atomic():
+            if validated_data:
+                for field, value in validated_data.items():
+                    setattr(instance, field, value)
+                instance.save(update_fields=list(validated_data))
+            if quantity is not None and quantity != instance.quantity:
+                expected_version = serializers.IntegerField().to_internal_value(
+                    self.initial_data.get('version', instance.version))
+                apply_movements(
+                    [Movement(instance, quantity - instance.quantity, StockMovement.Kind.ADJUSTMENT, expected_version)],
+                    source=self.context.get('source', 'api'),
+                )
+                instance.refresh_from_db()
+        return instance
+
+
+# ProductSerializer's fields as .values_list() columns ("sku" is read as sku_id).
+PRODUCT_LIST_COLUMNS = tuple(Product._meta.get_field(name).attname for name in ProductSerializer.Meta.fields)
+
+
+def product_rows(queryset):
+    """
+    ProductSerializer's output for every lot of `queryset`, read with
+    .values_list() instead of a model instance and a serializer pass per
+    row: same keys in the same order, prices as two-decimal strings (the
+    database converter already quantizes them) and dates left as dates for
+    the renderer to write as YYYY-MM-DD.
+    """
+    return [
+        {"id": pk, "product_name": name, "price": str(price), "quantity": quantity, "expiry_date": expiry_date,
+         "sku": sku_id, "version": version, "discount_percent": discount_percent}
+        for pk, name, price, quantity, expiry_date, sku_id, version, discount_percent
+        in queryset.values_list(*PRODUCT_LIST_COLUMNS)
+    ]
+
+
+class SkuSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the Sku model: one row per item with its stock totals.
+    """
+    class Meta:
+        model = Sku
+        fields = ['id', 'name', 'price', 'total_quantity', 'lot_count', 'earliest_expiry']
+        read_only_fields = ['total_quantity', 'lot_count', 'earliest_expiry']
+
+
+class SkuUpdateSerializer(serializers.Serializer):
+    """
+    Validates an UPDATE proposal made against a SKU (see stock.update_sku).
+    """
+    product_name = serializers.CharField(max_length=255, required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+    quantity_delta = serializers.IntegerField(required=False)
+    expiry_date = serializers.DateField(required=False)
+    # The values the proposal pre-filled quantity and expiry_date with.
+    expected_total_quantity = serializers.IntegerField(min_value=0, required=False)
+    expected_expiry_date = serializers.DateField(required=False)
+
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    """
+    Validates a request to the adjust endpoints: a signed quantity change,
+    optionally conditional on the lot version the client last saw.
+    """
+    delta = serializers.IntegerField()
+    kind = serializers.ChoiceField(choices=StockMovement.Kind.choices, default=StockMovement.Kind.ADJUSTMENT)
+    expected_version = serializers.IntegerField(required=False)
+    note = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+    def validate_delta(self, value):
+        if value == 0:
+            raise serializers.ValidationError("delta must not be zero.")
+        return value
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    """
+    Serializer for StockMovement ledger entries (read-only).
+    """
+    class Meta:
+        model = StockMovement
+        fields = ['id', 'sku', 'lot', 'product_name', 'kind', 'quantity', 'source', 'note', 'created_at']
+        read_only_fields = fields
+
+
+class WarehouseSerializer(serializers.ModelSerializer):
+    """
+    Serializer for Warehouse: a site, addressed by its code.
+    """
+    class Meta:
+        model = Warehouse
+        fields = ['id', 'code', 'name', 'alert_email']
+
+
+class LLMJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for LLMJob (read-only): an async /api/query/ request. `result`
+    is the proposal and `result_status` the status the synchronous call
+    would have answered with; both are null until the job has finished.
+    """
+    class Meta:
+        model = LLMJob
+        fields = ['id', 'status', 'query', 'attempts', 'created_at', 'started_at', 'finished_at',
+                  'result_status', 'result']
+        read_only_fields = fields
@@ -0,0 +1,43 @@
+# inventory_api/signals.py
+"""
+Keeps SKU totals and today's inventory rollup in step when lots are deleted
+(Product.save() handles saves) and writes off whatever stock a deleted lot
+still held. Also keeps this process's scan de-duplication indexes current
+when SKUs change.
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Product, Sku, StockMovement
+from .rollups import lot_deleted, touch
+from .similarity import loaded_index
+from .stock import delete_source, record_movement, refresh_sku_totals
+
+
+@receiver(pre_delete, sender=Product)
+def track_lot_delete(sender, instance, **kwargs):
+    touch([instance.sku_id])
+
+
+@receiver(post_delete, sender=Product)
+def refresh_totals_after_lot_delete(sender, instance, **kwargs):
+    if instance.quantity > 0:
+        record_movement(instance, -instance.quantity, StockMovement.Kind.WRITE_OFF, source=delete_source(),
+                        note="lot deleted")
+    with lot_deleted(instance):
+        refresh_sku_totals([instance.sku_id])
+
+
+@receiver(post_save, sender=Sku)
+def index_saved_sku(sender, instance, **kwargs):
+    # Nothing to do until a scan has built the warehouse's index; it will read the table then.
+    index = loaded_index(instance.warehouse_id)
+    if index is not None:
+        index.upsert(instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Sku)
+def unindex_deleted_sku(sender, instance, **kwargs):
+    index = loaded_index(instance.warehouse_id)
+    if index is not None:
+        index.remove(instance.pk)
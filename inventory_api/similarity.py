@@ -0,0 +1,267 @@
+# inventory_api/similarity.py
+"""
+In-memory near-duplicate index over SKU names, used to catch scanned
+products that are already in the catalogue ("Amul Taaza 1 L Milk" against
+"Amul Taaza Milk 1L").
+
+Each name becomes a TF-IDF vector of hashed character trigrams, L2
+normalized, so that cosine similarity is a dot product. Vectors are kept
+column-wise in NumPy arrays (an inverted index: for each hash bucket, the
+rows that contain it and their weights). Scoring a batch of queries gathers
+the postings of each query's buckets and sums them with np.bincount,
+touching only rows that share a trigram. argpartition then picks the top k.
+
+There is one index per warehouse, per process, built lazily from that
+warehouse's SKUs, so a scan is only matched against its own site's
+catalogue and an index's size follows one site's.
+- upsert()/remove() (wired to Sku signals) keep it current in the process
+  that made the change. Changed names go to a small delta segment that is
+  re-hashed on each change and merged into the base when it grows.
+- SKUs added by other processes are picked up by an id watermark on lookup.
+- Renames and deletes made by other processes are picked up by a full
+  rebuild every SCAN_DEDUP["REBUILD_SECONDS"]. Matches are re-read from the
+  database before they are shown.
+"""
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NGRAM = 3
+HASH_BITS = 18
+BUCKETS = 1 << HASH_BITS
+# Merge the delta segment into the base once it holds this share of the rows.
+DELTA_MERGE_RATIO = 0.05
+DELTA_MERGE_MIN = 2000
+
+UNIT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(kg|g|gm|ml|l|ltr|litre|liter|pcs|pc|pack)\b")
+UNIT_ALIASES = {"gm": "g", "ltr": "l", "litre": "l", "liter": "l", "pc": "pcs"}
+
+
+def normalize(name: str) -> str:
+    """Lower case, punctuation to spaces, '1 L' / '1ltr' -> '1l'."""
+    text = re.sub(r"[^\w.]+", " ", (name or "").lower())
+    text = UNIT_RE.sub(lambda m: f"{m.group(1)}{UNIT_ALIASES.get(m.group(2), m.group(2))}", text)
+    return " ".join(text.split())
+
+
+def _buckets(name: str):
+    """
+    Hashed trigram counts of the normalized name, per word, so word order
+    does not matter. str hashes are salted per process, which is fine for an
+    index that lives in one process.
+    """
+    counts = {}
+    for word in normalize(name).split():
+        padded = f" {word} "
+        for i in range(max(len(padded) - NGRAM + 1, 1)):
+            bucket = hash(padded[i:i + NGRAM]) & (BUCKETS - 1)
+            counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+class _Segment:
+    """An immutable inverted index over a set of rows."""
+
+    def __init__(self, ids, features, idf):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.alive = np.ones(len(ids), dtype=bool)
+        sizes = np.fromiter((len(counts) for counts in features), dtype=np.int64, count=len(features))
+        buckets = np.fromiter((b for counts in features for b in counts), dtype=np.int64, count=int(sizes.sum()))
+        tf = np.fromiter((c for counts in features for c in counts.values()), dtype=np.float32, count=len(buckets))
+        rows = np.repeat(np.arange(len(features), dtype=np.int32), sizes)
+        weights = (1.0 + np.log(tf)) * idf[buckets]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(features)))
+        weights = weights / np.maximum(norms, 1e-12)[rows]
+
+        order = np.argsort(buckets, kind="stable")
+        self.rows = rows[order]
+        self.weights = weights[order].astype(np.float32)
+        self.indptr = np.zeros(BUCKETS + 1, dtype=np.int64)
+        np.cumsum(np.bincount(buckets, minlength=BUCKETS), out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, queries):
+        """(len(queries), len(self)) cosine scores for [(buckets, weights), ...]."""
+        n = len(self)
+        gathered_rows, gathered_weights = [], []
+        for q, (buckets, weights) in enumerate(queries):
+            for bucket, weight in zip(buckets.tolist(), weights.tolist()):
+                start, end = self.indptr[bucket], self.indptr[bucket + 1]
+                if start == end:
+                    continue
+                gathered_rows.append(self.rows[start:end] + q * n)
+                gathered_weights.append(self.weights[start:end] * weight)
+        if not gathered_rows:
+            return np.zeros((len(queries), n), dtype=np.float32)
+        flat = np.bincount(np.concatenate(gathered_rows), weights=np.concatenate(gathered_weights),
+                           minlength=len(queries) * n)
+        scores = flat.reshape(len(queries), n)
+        scores[:, ~self.alive] = 0.0
+        return scores
+
+
+class SimilarityIndex:
+    def __init__(self, names_by_id=None):
+        self._lock = threading.RLock()
+        self._names = {}
+        self._base = None
+        self._delta = None
+        self._delta_ids = []
+        self._idf = None
+        self._watermark = 0
+        self.built_at = 0.0
+        if names_by_id is not None:
+            self.rebuild(names_by_id)
+
+    def rebuild(self, names_by_id):
+        """Replaces the index contents with {sku_id: name}."""
+        names = dict(names_by_id)
+        ids = list(names)
+        features = [_buckets(names[i]) for i in ids]
+        document_frequency = np.bincount(
+            np.fromiter((b for counts in features for b in counts), dtype=np.int64), minlength=BUCKETS)
+        idf = np.log((1 + len(ids)) / (1 + document_frequency)).astype(np.float32) + 1.0
+        base = _Segment(ids, features, idf)
+        with self._lock:
+            self._names = names
+            self._idf = idf
+            self._base = base
+            self._delta = None
+            self._delta_ids = []
+            self._watermark = max(ids, default=0)
+            self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._names)
+
+    def _kill(self, sku_ids):
+        for segment in (self._base, self._delta):
+            if segment is not None:
+                segment.alive[np.isin(segment.ids, sku_ids)] = False
+
+    def upsert(self, sku_id, name):
+        self.upsert_many({sku_id: name})
+
+    def upsert_many(self, names_by_id):
+        """Adds or renames SKUs; the delta segment is re-hashed once per call."""
+        with self._lock:
+            changed = {i: name for i, name in names_by_id.items() if self._names.get(i) != name}
+            if not changed:
+                return
+            self._kill(list(changed))
+            self._names.update(changed)
+            self._delta_ids = [i for i in self._delta_ids if i not in changed] + list(changed)
+            self._watermark = max(self._watermark, *changed)
+            if len(self._delta_ids) > max(DELTA_MERGE_MIN, DELTA_MERGE_RATIO * len(self._names)):
+                self.rebuild(self._names)
+            else:
+                self._delta = _Segment(self._delta_ids, [_buckets(self._names[i]) for i in self._delta_ids],
+                                       self._idf)
+
+    def remove(self, sku_id):
+        with self._lock:
+            if self._names.pop(sku_id, None) is not None:
+                self._kill([sku_id])
+                self._delta_ids = [i for i in self._delta_ids if i != sku_id]
+
+    def _query_vector(self, name):
+        counts = _buckets(name)
+        buckets = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) \
+            * self._idf[buckets]
+        norm = np.linalg.norm(weights)
+        return buckets, (weights / norm if norm else weights)
+
+    def top_k(self, names, k=3, min_score=0.0):
+        """
+        For each name, up to k (sku_id, score) pairs with cosine score >=
+        min_score, best first.
+        """
+        with self._lock:
+            if self._base is None or not names:
+                return [[] for _ in names]
+            queries = [self._query_vector(name) for name in names]
+            results = [[] for _ in names]
+            for segment in (self._base, self._delta):
+                if segment is None or not len(segment):
+                    continue
+                scores = segment.scores(queries)
+                count = min(k, scores.shape[1])
+                top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+                for q, rows in enumerate(top):
+                    results[q].extend(
+                        (int(segment.ids[row]), float(scores[q, row])) for row in rows if scores[q, row] >= min_score
+                    )
+        return [sorted(matches, key=lambda m: -m[1])[:k] for matches in results]
+
+
+# warehouse id -> SimilarityIndex
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def _load_names(warehouse_id, min_id=0):
+    from .models import Sku
+
+    return dict(Sku.objects.filter(warehouse_id=warehouse_id, id__gt=min_id).values_list("id", "name"))
+
+
+def get_similarity_index(warehouse_id=None) -> SimilarityIndex:
+    """
+    The index of the warehouse `warehouse_id` (default: the current one),
+    built on first use and refreshed as described above.
+    """
+    from .warehouses import current_warehouse_id
+
+    if warehouse_id is None:
+        warehouse_id = current_warehouse_id()
+    config = getattr(settings, "SCAN_DEDUP", {})
+    index = _indexes.get(warehouse_id)
+    if index is None:
+        with _index_lock:
+            index = _indexes.get(warehouse_id)
+            if index is None:
+                started = time.perf_counter()
+                index = _indexes[warehouse_id] = SimilarityIndex(_load_names(warehouse_id))
+                logger.info("Built SKU similarity index for warehouse %s: %d names in %.0f ms",
+                            warehouse_id, len(index), (time.perf_counter() - started) * 1000)
+                return index
+    if time.monotonic() - index.built_at > config.get("REBUILD_SECONDS", 600):
+        index.rebuild(_load_names(warehouse_id))
+    else:
+        index.upsert_many(_load_names(warehouse_id, index._watermark))
+    return index
+
+
+def loaded_index(warehouse_id):
+    """The warehouse's index if this process has built it, else None."""
+    return _indexes.get(warehouse_id)
+
+
+def find_duplicates(names, k=None, min_score=None, warehouse_id=None):
+    """
+    Likely catalogue matches for each scanned name among the SKUs of the
+    warehouse `warehouse_id` (default: the current one): a list per name of
+    {"sku_id", "name", "score"} dicts, best first, re-read from the database
+    so deleted SKUs never show up.
+    """
+    from .models import Sku
+
+    config = getattr(settings, "SCAN_DEDUP", {})
+    k = k or config.get("TOP_K", 3)
+    min_score = config.get("MIN_SCORE", 0.5) if min_score is None else min_score
+    matches = get_similarity_index(warehouse_id).top_k(names, k=k, min_score=min_score)
+    skus = Sku.objects.in_bulk({sku_id for found in matches for sku_id, _ in found})
+    return [
+        [{"sku_id": sku_id, "name": skus[sku_id].name, "score": round(score, 3)}
+         for sku_id, score in found if sku_id in skus]
+        for found in matches
+    ]
@@ -0,0 +1,337 @@
+# inventory_api/stock.py
+"""
+SKU and lot bookkeeping.
+
+Product rows are stock lots (a quantity with one expiry date); each belongs
+to a Sku that holds the item's identity and price. Receiving an item that is
+already stocked adds a lot to its SKU, or tops up the lot with the same
+expiry, instead of creating a duplicate product. The SKU's total_quantity,
+lot_count and earliest_expiry are kept in step here so prompts, alerts and
+reports read one row per item. SKUs are per warehouse: the same item at
+two sites is two SKUs, each with its own price and totals, and a lot
+belongs to its SKU's warehouse.
+
+Quantities change only through apply_movements(): each change is a
+conditional UPDATE ... SET quantity = quantity + delta (and version =
+version + 1) that cannot take a lot below zero, plus an entry in the
+StockMovement ledger. Concurrent changes add up instead of overwriting each
+other, and no row is read and written back.
+
+Lots are saved through Product.save() and deleted through the ORM, which
+both refresh the totals (see signals.py); stock a deleted lot still held is
+written off under the source set by deleting() ("delete" outside one). Code that writes lots with
+bulk_create() or QuerySet.update() must call refresh_sku_totals() itself,
+and rollups.refresh_today(): every write here also keeps today's inventory
+rollup in step (see rollups.py).
+"""
+import contextvars
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Product, Sku, StockMovement, normalize_sku_name
+from .rollups import record_flows, touch, tracking
+from .warehouses import current_warehouse_id
+
+_delete_source = contextvars.ContextVar("delete_source", default="delete")
+
+# Attempts at a FEFO withdrawal before giving up when other writers keep changing the same lots.
+FEFO_ATTEMPTS = 3
+
+# Keys of sku_inventory() rows, in the order the prompt lists them.
+INVENTORY_FIELDS = ("id", "product_name", "price", "quantity", "expiry_date")
+
+# A quantity change of one lot; expected_version makes it conditional on the lot's version.
+Movement = namedtuple("Movement", "lot delta kind expected_version", defaults=(None,))
+
+
+class InsufficientStock(ValueError):
+    """A withdrawal would take a lot or SKU below zero."""
+
+
+class VersionConflict(Exception):
+    """The lot changed since the client read it (its version no longer matches)."""
+
+    def __init__(self, message, current_version):
+        super().__init__(message)
+        self.current_version = current_version
+
+
+class SkuChanged(Exception):
+    """The SKU's stock changed since the proposal being applied was made."""
+
+
+def file_lot_under_sku(lot):
+    """
+    Points `lot` at the SKU for its product_name in its warehouse (the
+    current one for a new lot), creating the SKU if needed. A lot saved with
+    a new price reprices the whole SKU.
+    """
+    key = normalize_sku_name(lot.product_name)
+    if lot.warehouse_id is None:
+        lot.warehouse_id = lot.sku.warehouse_id if lot.sku_id else current_warehouse_id()
+    if not lot.sku_id or lot.sku.name_key != key:
+        lot.sku, _ = Sku.objects.get_or_create(
+            warehouse_id=lot.warehouse_id,
+            name_key=key,
+            defaults={"name": " ".join(lot.product_name.split()), "price": lot.price},
+        )
+    sku = lot.sku
+    touch([sku.pk])
+    lot.product_name = sku.name
+    if lot.price is None:
+        lot.price = sku.price
+    elif Decimal(str(lot.price)) != sku.price:
+        sku.price = Decimal(str(lot.price))
+        Sku.objects.filter(pk=sku.pk).update(price=sku.price)
+        Product.objects.filter(sku=sku).exclude(pk=lot.pk).update(price=sku.price)
+
+
+def refresh_sku_totals(sku_ids=None):
+    """
+    Recomputes the denormalized totals of the given SKUs (all SKUs when
+    `sku_ids` is None) from their lots, in one UPDATE.
+    """
+    skus = Sku.objects.all()
+    if sku_ids is not None:
+        sku_ids = [sku_id for sku_id in sku_ids if sku_id is not None]
+        if not sku_ids:
+            return
+        skus = skus.filter(pk__in=sku_ids)
+    lots = Product.objects.filter(sku=OuterRef("pk")).order_by().values("sku")
+    skus.update(
+        total_quantity=Coalesce(Subquery(lots.annotate(total=Sum("quantity")).values("total")), 0),
+        lot_count=Coalesce(Subquery(lots.annotate(count=Count("pk")).values("count")), 0),
+        earliest_expiry=Subquery(lots.annotate(earliest=Min("expiry_date")).values("earliest")),
+    )
+
+
+def apply_movements(movements, source="", note=""):
+    """
+    Applies Movements atomically and appends them to the ledger (one bulk
+    insert). Raises InsufficientStock, VersionConflict or
+    Product.DoesNotExist, in which case nothing is applied.
+    """
+    movements = [m for m in movements if m.delta]
+    if not movements:
+        return []
+    sku_deltas = defaultdict(int)
+    with transaction.atomic(), tracking():
+        touch({m.lot.sku_id for m in movements})
+        for movement in movements:
+            lots = Product.objects.filter(pk=movement.lot.pk)
+            if movement.delta < 0:
+                lots = lots.filter(quantity__gte=-movement.delta)
+            if movement.expected_version is not None:
+                lots = lots.filter(version=movement.expected_version)
+            if not lots.update(quantity=F("quantity") + movement.delta, version=F("version") + 1):
+                _raise_rejected(movement)
+            sku_deltas[movement.lot.sku_id] += movement.delta
+        entries = StockMovement.objects.bulk_create(
+            StockMovement(sku_id=m.lot.sku_id, lot_id=m.lot.pk, product_name=m.lot.product_name,
+                          kind=m.kind, quantity=m.delta, source=source, note=note)
+            for m in movements
+        )
+        record_flows(entries)
+        for sku_id, delta in sku_deltas.items():
+            Sku.objects.filter(pk=sku_id).update(total_quantity=F("total_quantity") + delta)
+    return entries
+
+
+def _raise_rejected(movement):
+    """Explains why the conditional UPDATE for `movement` matched no row."""
+    current = Product.objects.filter(pk=movement.lot.pk).values("quantity", "version").first()
+    if current is None:
+        raise Product.DoesNotExist(f"Product with ID {movement.lot.pk} not found.")
+    if movement.expected_version is not None and current["version"] != movement.expected_version:
+        raise VersionConflict(
+            f"'{movement.lot.product_name}' changed since version {movement.expected_version}; "
+            f"it is now at version {current['version']}.",
+            current["version"],
+        )
+    raise InsufficientStock(
+        f"Only {current['quantity']} of '{movement.lot.product_name}' in this lot; cannot take {-movement.delta}."
+    )
+
+
+def record_movement(lot, delta, kind, source="", note=""):
+    """Appends a ledger entry for a change made outside apply_movements() (new or deleted lots)."""
+    entry = StockMovement.objects.create(sku_id=lot.sku_id, lot_id=lot.pk, product_name=lot.product_name,
+                                         kind=kind, quantity=delta, source=source, note=note)
+    record_flows([entry])
+    return entry
+
+
+@contextmanager
+def deleting(source):
+    """Ledgers the write-offs of lots deleted in the block under `source` (in this thread or task only)."""
+    token = _delete_source.set(source)
+    try:
+        yield
+    finally:
+        _delete_source.reset(token)
+
+
+def delete_source():
+    return _delete_source.get()
+
+
+def receive_lot(product_name, price, expiry_date, quantity=1, source="", note="", warehouse=None):
+    """
+    Books received stock into `warehouse` (default: the current one).
+    Returns (lot, created): stock with the same SKU and expiry date as an
+    existing lot is added to that lot.
+    """
+    with transaction.atomic(), tracking():
+        lot = Product(product_name=product_name, price=price, quantity=quantity, expiry_date=expiry_date,
+                      warehouse_id=warehouse.pk if warehouse is not None else current_warehouse_id())
+        file_lot_under_sku(lot)
+        existing = Product.objects.filter(sku=lot.sku, expiry_date=expiry_date).order_by("id").first()
+        if existing is None:
+            lot.save()
+            record_movement(lot, quantity, StockMovement.Kind.RECEIPT, source, note)
+            return lot, True
+        apply_movements([Movement(existing, quantity, StockMovement.Kind.RECEIPT)], source, note)
+        existing.refresh_from_db()
+        return existing, False
+
+
+def fefo_lots(sku):
+    """The SKU's lots with stock, first-expiring first (uses product_sku_fefo_idx)."""
+    return Product.objects.filter(sku=sku, quantity__gt=0).order_by("expiry_date", "id")
+
+
+def expiring_within(days, today=None, warehouse=None):
+    """
+    Lots that have not expired yet but will within `days` days, of every
+    warehouse or just `warehouse` (uses product_expiry_idx or
+    product_warehouse_expiry_idx).
+    """
+    today = today or date.today()
+    lots = Product.objects.filter(expiry_date__gte=today, expiry_date__lte=today + timedelta(days=days))
+    return lots if warehouse is None else lots.filter(warehouse=warehouse)
+
+
+def adjust_sku(sku, delta, kind=StockMovement.Kind.ADJUSTMENT, source="", note=""):
+    """
+    Changes the SKU's total stock by `delta`. Withdrawals are taken from the
+    first-expiring lots, and lots they empty are removed. Additions go to the
+    latest-expiring lot.
+    """
+    if not delta:
+        return []
+    if delta > 0:
+        lot = Product.objects.filter(sku=sku).order_by("-expiry_date", "-id").first()
+        if lot is None:
+            raise ValueError(f"'{sku.name}' has no stock lots; add it with an expiry date instead.")
+        return apply_movements([Movement(lot, delta, kind)], source, note)
+
+    for attempt in range(FEFO_ATTEMPTS):
+        needed = -delta
+        movements = []
+        for lot in fefo_lots(sku).only("id", "sku_id", "product_name", "quantity"):
+            taken = min(lot.quantity, needed)
+            movements.append(Movement(lot, -taken, kind))
+            needed -= taken
+            if not needed:
+                break
+        if needed:
+            raise InsufficientStock(f"Only {-delta - needed} of '{sku.name}' in stock; cannot take {-delta}.")
+        try:
+            with transaction.atomic(), tracking():
+                entries = apply_movements(movements, source, note)
+                Product.objects.filter(sku=sku, quantity=0).delete()
+            return entries
+        except InsufficientStock:
+            # Another writer drained one of the lots between the read and the update; plan again.
+            if attempt == FEFO_ATTEMPTS - 1:
+                raise
+
+
+def set_sku_quantity(sku, quantity, source="", note=""):
+    """Sets the SKU's total stock to `quantity` (a stock count) with one ADJUSTMENT (see adjust_sku)."""
+    if quantity < 0:
+        raise ValueError("Quantity cannot be negative.")
+    return adjust_sku(sku, quantity - _total_quantity(sku), StockMovement.Kind.ADJUSTMENT, source, note)
+
+
+def _total_quantity(sku):
+    return Product.objects.filter(sku=sku).aggregate(total=Coalesce(Sum("quantity"), 0))["total"]
+
+
+def update_sku(sku, data, source=""):
+    """
+    Applies an UPDATE proposal made against a SKU: product_name and price
+    apply to every lot, quantity sets the total (see set_sku_quantity),
+    quantity_delta changes it (see adjust_sku), and expiry_date only applies
+    when the SKU has a single lot. A positive quantity_delta with an
+    expiry_date is received stock (a scan matched to this SKU) and goes to
+    the lot with that expiry instead.
+
+    Proposals pre-fill quantity and expiry_date with the values they were
+    built against and send those as expected_total_quantity and
+    expected_expiry_date. A field still at its expected value was not
+    edited and is left alone; an edited one applies only if the SKU still
+    has that value, and raises SkuChanged otherwise.
+    """
+    receiving = data.get("quantity_delta", 0) > 0 and data.get("expiry_date") is not None
+    with transaction.atomic(), tracking():
+        touch([sku.pk])
+        if "product_name" in data and normalize_sku_name(data["product_name"]) != sku.name_key:
+            if Sku.objects.filter(warehouse_id=sku.warehouse_id, name_key=normalize_sku_name(data["product_name"])) \
+                    .exclude(pk=sku.pk).exists():
+                raise ValueError(f"A product named '{data['product_name']}' already exists.")
+            sku.name = " ".join(data["product_name"].split())
+        if "price" in data:
+            sku.price = data["price"]
+        sku.save()
+        Product.objects.filter(sku=sku).update(product_name=sku.name, price=sku.price)
+
+        expected_expiry = data.get("expected_expiry_date")
+        if "expiry_date" in data and not receiving and data["expiry_date"] != expected_expiry:
+            lots = list(Product.objects.filter(sku=sku)[:2])
+            if expected_expiry is not None and (len(lots) != 1 or lots[0].expiry_date != expected_expiry):
+                raise SkuChanged(f"The lots of '{sku.name}' changed since its expiry date was {expected_expiry}.")
+            if len(lots) != 1:
+                raise ValueError(f"'{sku.name}' has {len(lots)} stock lots; edit the expiry date of one lot instead.")
+            Product.objects.filter(pk=lots[0].pk).update(expiry_date=data["expiry_date"])
+        expected_total = data.get("expected_total_quantity")
+        if receiving:
+            receive_lot(sku.name, sku.price, data["expiry_date"], data["quantity_delta"], source=source,
+                        warehouse=sku.warehouse)
+        elif data.get("quantity_delta"):
+            adjust_sku(sku, data["quantity_delta"], source=source)
+        elif "quantity" in data and expected_total is None:
+            set_sku_quantity(sku, data["quantity"], source=source)
+        elif "quantity" in data and data["quantity"] != expected_total:
+            # touch() above locked the SKU, so the total cannot change between this check and the adjustment.
+            current = _total_quantity(sku)
+            if current != expected_total:
+                raise SkuChanged(f"'{sku.name}' now has {current} in stock, not {expected_total}; "
+                                 f"review the change again before setting it to {data['quantity']}.")
+            adjust_sku(sku, data["quantity"] - current, StockMovement.Kind.ADJUSTMENT, source)
+        refresh_sku_totals([sku.pk])
+    sku.refresh_from_db()
+    return sku
+
+
+def sku_inventory(warehouse=None):
+    """
+    One row per stocked SKU of `warehouse` (default: the current one), in
+    the shape the query prompt and the command parser expect. Reads
+    sku_warehouse_expiry_idx in order, so the cost is one site's SKUs.
+    Prices come back as floats from the database and dates stay dates
+    (fastjson.dumps writes them as YYYY-MM-DD), so rows need no conversion.
+    """
+    skus = (
+        Sku.objects.filter(warehouse_id=warehouse.pk if warehouse is not None else current_warehouse_id(),
+                           lot_count__gt=0)
+        .order_by("earliest_expiry", "id")
+        .values_list("id", "name", Cast("price", FloatField()), "total_quantity", "earliest_expiry")
+    )
+    return [dict(zip(INVENTORY_FIELDS, row)) for row in skus]
@@ -0,0 +1,119 @@
+# inventory_api/streaming.py
+"""
+Helpers for streaming proposals from /api/query/ while the model generates.
+
+IncrementalJSONParser consumes the model output piece by piece and reports
+top-level string fields (most importantly "action") as soon as their closing
+quote arrives, long before the JSON object is complete.
+"""
+from rest_framework.renderers import BaseRenderer
+
+from .fastjson import dumps
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+SSE_CONTENT_TYPE = "text/event-stream"
+
+
+class IncrementalJSONParser:
+    """
+    Minimal streaming scanner for a single JSON object. It tracks nesting and
+    string state character by character and records completed top-level
+    string values in `fields`. It does not validate the document; the full
+    text is still parsed in full once generation finishes.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+        self._expect_key = True
+        self._key = None
+
+    @property
+    def action(self):
+        return self.fields.get("action")
+
+    def feed(self, text: str) -> list:
+        """Consume more output; returns the names of fields completed by it."""
+        completed = []
+        for ch in text:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._buffer.append(ch)
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        value = "".join(self._buffer)
+                        if self._expect_key:
+                            self._key = value
+                        elif self._key is not None:
+                            self.fields[self._key] = value
+                            completed.append(self._key)
+                else:
+                    self._buffer.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._buffer = []
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = ch == "{"
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and ch == ":":
+                self._expect_key = False
+            elif self._depth == 1 and ch == ",":
+                self._expect_key = True
+                self._key = None
+        return completed
+
+
+def format_event(event: str, data: dict, sse: bool) -> bytes:
+    """One NDJSON line (`{"event": ..., ...}`) or one SSE message, encoded as API responses are."""
+    if sse:
+        return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(data) + b"\n\n"
+    return dumps({"event": event, **data}) + b"\n"
+
+
+def requested_stream_mode(request):
+    """Returns None, "ndjson" or "sse" from ?stream= or the Accept header of a DRF request."""
+    requested = request.query_params.get("stream", "").lower()
+    if requested in ("sse", "ndjson"):
+        return requested
+    if requested in ("1", "true"):
+        return "ndjson"
+    accepted = getattr(request, "accepted_renderer", None)
+    if accepted is not None and accepted.format in ("sse", "ndjson"):
+        return accepted.format
+    return None
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Lets DRF content negotiation accept `Accept: application/x-ndjson`.
+    Streaming responses bypass renderers; this only renders the non-streamed
+    errors (e.g. a missing query) as a single line.
+    """
+    media_type = NDJSON_CONTENT_TYPE
+    format = "ndjson"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return format_event("error", data if isinstance(data, dict) else {"data": data}, sse=False)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Same as NDJSONRenderer for `Accept: text/event-stream`."""
+    media_type = SSE_CONTENT_TYPE
+    format = "sse"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return format_event("error", data if isinstance(data, dict) else {"data": data}, sse=True)
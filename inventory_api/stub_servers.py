@@ -0,0 +1,409 @@
+# inventory_api/stub_servers.py
+"""
+Stand-in HTTP servers for the two models this project talks to, so the
+propose -> confirm -> execute and bot -> receive -> check-scanned flows can be
+load-tested without a GPU or a Gemini API key.
+
+- OllamaStubHandler mimics Ollama's `POST /api/generate` (including
+  `format: "json"` and NDJSON streaming) plus `GET /api/tags`.
+- GeminiStubHandler mimics `POST /v1beta/models/<model>:generateContent`
+  (and `:streamGenerateContent?alt=sse`) returning the structured output the
+  Telegram bot asks for, either as JSON text or as a function call.
+
+Both servers draw their latency from a configurable LatencyModel and can
+inject errors at a fixed rate. Run them with `manage.py run_llm_stubs`.
+"""
+import contextlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GEMINI_PATH_RE = re.compile(r"^/v1beta/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)$")
+USER_QUERY_RE = re.compile(r"The user's query is: \"(.*)\"", re.DOTALL)
+INVENTORY_ROW_RE = re.compile(r"\{\"id\":\s*(\d+),\s*\"product_name\":\s*\"((?:[^\"\\]|\\.)*)\"")
+ADD_RE = re.compile(
+    r"add\s+(?P<qty>\d+)\s+(?:units?\s+of\s+|loaves\s+of\s+|cartons\s+of\s+)?(?P<name>.+?)\s+at\s+"
+    r"(?:₹)?(?P<price>\d+(?:\.\d+)?)\s*(?:rs)?(?:\s+each)?,?\s+expiring\s+in\s+(?P<days>\d+)\s+days?",
+    re.IGNORECASE,
+)
+PRICE_RE = re.compile(r"price\s+of\s+(?:the\s+)?(?P<name>.+?)\s+to\s+(?:₹)?(?P<price>\d+(?:\.\d+)?)", re.IGNORECASE)
+
+SCAN_NAMES = [
+    "Amul Taaza Milk 1L", "Britannia Brown Bread", "Mother Dairy Curd 400g", "Nestle Maggi Noodles",
+    "Tata Salt 1kg", "Parle-G Biscuits", "Amul Butter 100g", "Haldiram Bhujia 200g",
+    "Kissan Mixed Fruit Jam", "Real Orange Juice 1L", "Epigamia Greek Yogurt", "Fortune Sunflower Oil 1L",
+]
+
+
+class LatencyModel:
+    """
+    Samples per-request latency (in seconds) and decides whether a request
+    should fail. Thread-safe; seeded for reproducible runs.
+    """
+    DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+    def __init__(self, distribution="lognormal", mean_ms=800.0, sigma=0.5, error_rate=0.0, seed=None):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}'. Use one of {self.DISTRIBUTIONS}.")
+        self.distribution = distribution
+        self.mean = max(mean_ms, 0.0) / 1000.0
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.mean == 0 or self.distribution == "fixed":
+                return self.mean
+            if self.distribution == "uniform":
+                return self._rng.uniform(0, 2 * self.mean)
+            if self.distribution == "exponential":
+                return self._rng.expovariate(1.0 / self.mean)
+            # lognormal with the requested mean
+            mu = math.log(self.mean) - (self.sigma ** 2) / 2
+            return self._rng.lognormvariate(mu, self.sigma)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def choice(self, seq):
+        with self._lock:
+            return self._rng.choice(seq)
+
+    def randint(self, a, b):
+        with self._lock:
+            return self._rng.randint(a, b)
+
+
+def _now_rfc3339() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def fake_inventory_action(prompt: str) -> dict:
+    """
+    Produce a plausible model answer for a prompt built by ProposeActionAPIView
+    (or reason_inventory --explain), using a few keyword rules on the user's query.
+    """
+    inventory = [(int(pid), name) for pid, name in INVENTORY_ROW_RE.findall(prompt)]
+
+    if "EXPLAIN_MARKDOWNS" in prompt:
+        return {"action": "EXPLAIN_MARKDOWNS",
+                "explanation": "The items closest to expiry with the most stock get the deepest discounts."}
+
+    matches = USER_QUERY_RE.findall(prompt)
+    query = matches[-1] if matches else prompt.strip().splitlines()[-1] if prompt.strip() else ""
+    lowered = query.lower()
+
+    def find_product_id(name_hint=None):
+        hint = (name_hint or lowered).lower()
+        for pid, name in inventory:
+            if name.lower() and name.lower() in hint:
+                return pid
+        return inventory[0][0] if inventory else None
+
+    add = ADD_RE.search(query)
+    if add:
+        return {
+            "action": "ADD",
+            "item_name": add.group("name"),
+            "quantity": int(add.group("qty")),
+            "price": float(add.group("price")),
+            "relative_expiry": {"days": int(add.group("days"))},
+        }
+    if lowered.startswith("add"):
+        return {"action": "QUERY_RESPONSE", "answer": "I can add that product, but what is the quantity?"}
+    if "expired" in lowered and ("delete" in lowered or "remove" in lowered):
+        return {"action": "BULK_DELETE_EXPIRED"}
+    price = PRICE_RE.search(query)
+    if price:
+        return {
+            "action": "UPDATE",
+            "product_id": find_product_id(price.group("name")),
+            "data": {"price": float(price.group("price"))},
+        }
+    if lowered.startswith(("delete", "remove")):
+        return {"action": "DELETE", "product_id": find_product_id()}
+    return {"action": "QUERY_RESPONSE", "answer": f"There are {len(inventory)} products in the inventory."}
+
+
+def fake_scan_payload(latency: LatencyModel) -> dict:
+    """The ProductAction object the Telegram bot asks Gemini for."""
+    expiry = date.today() + timedelta(days=latency.randint(-3, 120))
+    return {
+        "action": "CREATE",
+        "data": {
+            "product_name": latency.choice(SCAN_NAMES),
+            "price": None,
+            "quantity": None,
+            "expiry_date": expiry.isoformat(),
+        },
+    }
+
+
+class PromptCache:
+    """Remembers the last rendered prompt per model, like a single Ollama slot."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = {}
+
+    def evaluate(self, model: str, body: dict) -> int:
+        """Returns how many characters of this request would need evaluating."""
+        rendered = f"{body.get('system') or ''}\n{body.get('prompt', '')}"
+        with self._lock:
+            previous = self._last.get(model, "")
+            cached = len(os.path.commonprefix([previous, rendered]))
+            if str(body.get("keep_alive", "5m")) in ("0", "0s"):
+                self._last.pop(model, None)
+            else:
+                self._last[model] = rendered
+        return len(rendered) - cached
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "StubLLM/1.0"
+
+    def log_message(self, format, *args):
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            return None
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class OllamaStubHandler(_StubHandler):
+    """
+    Mimics the parts of the Ollama HTTP API that mcp.py uses: the native
+    /api/generate endpoint and the OpenAI-compatible /v1/chat/completions one
+    (what LM Studio serves), so both backend kinds can be load-tested.
+    """
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            return self._send_json(200, {"models": [{"name": self.server.model_name, "model": self.server.model_name}]})
+        if self.path == "/v1/models":
+            return self._send_json(200, {"object": "list", "data": [
+                {"id": self.server.model_name, "object": "model", "owned_by": "stub"}]})
+        if self.path == "/":
+            return self._send_json(200, {"status": "Ollama is running"})
+        return self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/v1/chat/completions"):
+            return self._send_json(404, {"error": "not found"})
+        body = self._read_json()
+        if body is None:
+            return self._send_json(400, {"error": "invalid JSON body"})
+        # Like OLLAMA_NUM_PARALLEL: requests beyond the slot count wait their turn.
+        with self.server.slots:
+            if self.path == "/v1/chat/completions":
+                return self._chat_completions(body)
+            return self._api_generate(body)
+
+    def _api_generate(self, body):
+        generation = self._generate(body)
+        if generation is None:
+            return self._send_json(500, {"error": "stub: injected model failure"})
+        text, model, total, ttft, final = generation
+
+        if not body.get("stream", True):
+            time.sleep(total)
+            return self._send_json(200, {**final, "response": text})
+
+        # Streaming: prefill delay, then the text in small pieces, then the summary line.
+        self._start_chunked("application/x-ndjson")
+        for piece in self._paced_pieces(text, total, ttft):
+            line = {"model": model, "created_at": _now_rfc3339(), "response": piece, "done": False}
+            self._write_chunk(json.dumps(line).encode("utf-8") + b"\n")
+        self._write_chunk(json.dumps({**final, "response": ""}).encode("utf-8") + b"\n")
+        self._end_chunked()
+
+    def _chat_completions(self, body):
+        messages = body.get("messages") or []
+        request = {
+            "model": body.get("model"),
+            "system": "\n".join(m.get("content", "") for m in messages if m.get("role") == "system"),
+            "prompt": "\n".join(m.get("content", "") for m in messages if m.get("role") != "system"),
+            "format": "json" if (body.get("response_format") or {}).get("type") == "json_object" else None,
+        }
+        generation = self._generate(request)
+        if generation is None:
+            return self._send_json(500, {"error": {"message": "stub: injected model failure", "type": "server_error"}})
+        text, model, total, ttft, final = generation
+        completion_id = f"chatcmpl-stub{int(time.time() * 1000)}"
+        usage = {
+            "prompt_tokens": final["prompt_eval_count"],
+            "completion_tokens": final["eval_count"],
+            "total_tokens": final["prompt_eval_count"] + final["eval_count"],
+        }
+
+        if not body.get("stream", False):
+            time.sleep(total)
+            return self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self._start_chunked("text/event-stream")
+        for piece in self._paced_pieces(text, total, ttft):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        last = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        self._write_chunk(f"data: {json.dumps(last)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self._end_chunked()
+
+    def _generate(self, body):
+        """
+        Samples latency and builds the answer for an /api/generate style body.
+        Returns (text, model, total, ttft, final_stats), or None for an
+        injected failure (after sleeping through the prefill).
+        """
+        latency = self.server.latency
+        total = latency.sample()
+        if latency.should_fail():
+            time.sleep(total * self.server.ttft_fraction)
+            return None
+
+        prompt = body.get("prompt", "")
+        text = json.dumps(fake_inventory_action(prompt))
+        if body.get("format") != "json":
+            text = f"Here is the action:\n{text}"
+        model = body.get("model") or self.server.model_name
+        eval_tokens = max(1, len(text) // 4)
+
+        ttft = total * self.server.ttft_fraction
+        uncached_chars = len(prompt) + len(body.get("system") or "")
+        if self.server.prefill_ms_per_kchar > 0:
+            # Emulate Ollama's prompt cache: only the part after the longest
+            # common prefix with the previous prompt is evaluated again.
+            uncached_chars = self.server.prompt_cache.evaluate(model, body)
+            decode = total * (1 - self.server.ttft_fraction)
+            ttft = uncached_chars / 1000.0 * self.server.prefill_ms_per_kchar / 1000.0
+            total = ttft + decode
+        prompt_tokens = max(1, uncached_chars // 4)
+        final = {
+            "model": model,
+            "created_at": _now_rfc3339(),
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int(total * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(ttft * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int((total - ttft) * 1e9),
+        }
+        return text, model, total, ttft, final
+
+    @staticmethod
+    def _paced_pieces(text, total, ttft):
+        """Yields the text in small pieces, sleeping to spread them over the generation time."""
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)] or [""]
+        per_piece = (total - ttft) / len(pieces)
+        time.sleep(ttft)
+        for piece in pieces:
+            yield piece
+            time.sleep(per_piece)
+
+
+class GeminiStubHandler(_StubHandler):
+    """Mimics Gemini's generateContent REST endpoint for structured extraction."""
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        match = GEMINI_PATH_RE.match(path)
+        if not match:
+            return self._send_json(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+        body = self._read_json()
+        if body is None:
+            return self._send_json(400, {"error": {"code": 400, "message": "invalid JSON", "status": "INVALID_ARGUMENT"}})
+
+        latency = self.server.latency
+        time.sleep(latency.sample())
+        if latency.should_fail():
+            return self._send_json(503, {"error": {"code": 503, "message": "stub: injected failure", "status": "UNAVAILABLE"}})
+
+        payload = fake_scan_payload(latency)
+        declarations = [
+            decl for tool in body.get("tools") or [] for decl in tool.get("functionDeclarations") or []
+        ]
+        if declarations:
+            part = {"functionCall": {"name": declarations[0].get("name", "ProductAction"), "args": payload}}
+        else:
+            part = {"text": json.dumps(payload)}
+
+        response = {
+            "candidates": [{"content": {"parts": [part], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": 300, "candidatesTokenCount": 40, "totalTokenCount": 340},
+            "modelVersion": match.group("model"),
+        }
+        if match.group("method") == "streamGenerateContent":
+            self._start_chunked("text/event-stream")
+            self._write_chunk(f"data: {json.dumps(response)}\r\n\r\n".encode("utf-8"))
+            return self._end_chunked()
+        return self._send_json(200, response)
+
+
+def make_server(handler_class, host: str, port: int, latency: LatencyModel, **attrs) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    server.latency = latency
+    server.prefill_ms_per_kchar = 0.0
+    server.prompt_cache = PromptCache()
+    num_parallel = attrs.pop("num_parallel", 0)
+    server.slots = threading.BoundedSemaphore(num_parallel) if num_parallel > 0 else contextlib.nullcontext()
+    for key, value in attrs.items():
+        setattr(server, key, value)
+    return server
+
+
+def start_in_thread(server: ThreadingHTTPServer) -> threading.Thread:
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
@@ -1,3 +1,374 @@
-from django.test import TestCase
+import gzip
+import io
+import zlib
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import orjson
+import zstandard
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import bulk_io
+
+from .models import InventoryRollupDelta, Product, Sku, StockMovement
+from .bulk_io import import_records, import_stream
+from .compression import ResponseCompressionMiddleware
+from .rollups import COUNTS, backfill, daily_rows, fold, snapshot
+from .stock import (
+    InsufficientStock, Movement, SkuChanged, VersionConflict, adjust_sku, apply_movements, receive_lot, update_sku,
+)
+from .views import ProposeActionAPIView
+from .warehouses import forget_warehouses
+
+
+class StockTestCase(TestCase):
+    def setUp(self):
+        # The warehouse cache outlives the test transaction.
+        forget_warehouses()
+        self.today = date.today()
+
+    def receive(self, name, quantity, days, price="40.00"):
+        lot, _ = receive_lot(name, price, self.today + timedelta(days=days), quantity)
+        return lot
+
+    def quantities(self, sku):
+        return list(Product.objects.filter(sku=sku).order_by("expiry_date").values_list("quantity", flat=True))
+
+    def ledger(self, sku):
+        return list(StockMovement.objects.filter(sku=sku).order_by("id").values_list("kind", "quantity"))
+
+
+class ApplyMovementsTests(StockTestCase):
+    def test_applies_deltas_and_records_them(self):
+        lot = self.receive("Amul Milk", 5, 10)
+        apply_movements([Movement(lot, -2, StockMovement.Kind.SALE)], source="test")
+
+        lot.refresh_from_db()
+        self.assertEqual((lot.quantity, lot.version), (3, 1))
+        self.assertEqual(Sku.objects.get(pk=lot.sku_id).total_quantity, 3)
+        self.assertEqual(self.ledger(lot.sku), [("RECEIPT", 5), ("SALE", -2)])
+
+    def test_insufficient_stock_applies_nothing(self):
+        milk, bread = self.receive("Amul Milk", 5, 10), self.receive("Bread", 2, 3)
+        with self.assertRaises(InsufficientStock):
+            apply_movements([Movement(milk, -1, StockMovement.Kind.SALE), Movement(bread, -3, StockMovement.Kind.SALE)])
+
+        self.assertEqual(Product.objects.get(pk=milk.pk).quantity, 5)
+        self.assertEqual(Product.objects.get(pk=bread.pk).quantity, 2)
+        self.assertEqual(StockMovement.objects.filter(kind=StockMovement.Kind.SALE).count(), 0)
+
+    def test_version_conflict_reports_current_version(self):
+        lot = self.receive("Amul Milk", 5, 10)
+        apply_movements([Movement(lot, 1, StockMovement.Kind.ADJUSTMENT, expected_version=0)])
+        with self.assertRaises(VersionConflict) as raised:
+            apply_movements([Movement(lot, 1, StockMovement.Kind.ADJUSTMENT, expected_version=0)])
+
+        self.assertEqual(raised.exception.current_version, 1)
+        self.assertEqual(Product.objects.get(pk=lot.pk).quantity, 6)
+
+
+class AdjustSkuTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        for quantity, days in ((4, 3), (5, 10), (6, 20)):
+            lot = self.receive("Curd", quantity, days)
+        self.sku = lot.sku
+
+    def test_withdrawal_takes_first_expiring_lots_and_removes_emptied_ones(self):
+        adjust_sku(self.sku, -6, StockMovement.Kind.SALE)
+
+        self.assertEqual(self.quantities(self.sku), [3, 6])
+        self.assertEqual(self.ledger(self.sku)[-2:], [("SALE", -4), ("SALE", -2)])
+        self.sku.refresh_from_db()
+        self.assertEqual((self.sku.total_quantity, self.sku.lot_count), (9, 2))
+
+    def test_addition_goes_to_latest_expiring_lot(self):
+        adjust_sku(self.sku, 2)
+
+        self.assertEqual(self.quantities(self.sku), [4, 5, 8])
+
+    def test_withdrawal_beyond_stock_changes_nothing(self):
+        with self.assertRaises(InsufficientStock):
+            adjust_sku(self.sku, -16, StockMovement.Kind.SALE)
+
+        self.assertEqual(self.quantities(self.sku), [4, 5, 6])
+
+
+class DeleteLotTests(StockTestCase):
+    def test_deleted_stock_is_written_off_under_the_deleting_source(self):
+        milk, bread = self.receive("Amul Milk", 5, 10), self.receive("Bread", 2, 3)
+        response = self.client.delete(f"/api/products/{milk.pk}/")
+        self.assertEqual(response.status_code, 204)
+        bread.delete()
+
+        write_offs = StockMovement.objects.filter(kind=StockMovement.Kind.WRITE_OFF).order_by("id")
+        self.assertEqual(list(write_offs.values_list("product_name", "quantity", "source")),
+                         [("Amul Milk", -5, "api"), ("Bread", -2, "delete")])
+
+
+class UpdateSkuQuantityTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sku = self.receive("Paneer", 5, 10, price="10.00").sku
+
+    def total(self):
+        return Sku.objects.get(pk=self.sku.pk).total_quantity
+
+    def test_quantity_sets_the_total(self):
+        update_sku(self.sku, {"quantity": 3})
+
+        self.assertEqual(self.total(), 3)
+        self.assertEqual(self.ledger(self.sku)[-1], ("ADJUSTMENT", -2))
+
+    def test_unedited_quantity_keeps_stock_received_since_the_proposal(self):
+        adjust_sku(self.sku, 10, StockMovement.Kind.RECEIPT)
+        update_sku(self.sku, {"price": Decimal("12.00"), "quantity": 5, "expected_total_quantity": 5})
+
+        self.assertEqual(self.total(), 15)
+        self.assertEqual(Sku.objects.get(pk=self.sku.pk).price, Decimal("12.00"))
+        self.assertNotIn("ADJUSTMENT", [kind for kind, _ in self.ledger(self.sku)])
+
+    def test_edited_quantity_against_a_stale_total_changes_nothing(self):
+        adjust_sku(self.sku, 10, StockMovement.Kind.RECEIPT)
+        with self.assertRaises(SkuChanged):
+            update_sku(self.sku, {"price": Decimal("12.00"), "quantity": 7, "expected_total_quantity": 5})
+
+        self.assertEqual(self.total(), 15)
+        self.assertEqual(Sku.objects.get(pk=self.sku.pk).price, Decimal("10.00"))
+
+    def test_edited_quantity_against_the_current_total_is_applied(self):
+        update_sku(self.sku, {"quantity": 7, "expected_total_quantity": 5})
+
+        self.assertEqual(self.total(), 7)
+        self.assertEqual(self.ledger(self.sku)[-1], ("ADJUSTMENT", 2))
+
+    def test_confirmed_proposal_after_a_receipt(self):
+        proposal = ProposeActionAPIView()._build_proposal(
+            {"action": "UPDATE", "product_id": self.sku.pk, "data": {"price": 12}}).data
+        self.client.post(f"/api/skus/{self.sku.pk}/adjust/", {"delta": 10, "kind": "RECEIPT"},
+                         content_type="application/json")
+
+        response = self.client.post("/api/execute-action/", proposal, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.total(), 15)
+
+        edited = {**proposal, "data": {**proposal["data"], "quantity": 7}}
+        response = self.client.post("/api/execute-action/", edited, content_type="application/json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.total(), 15)
+
+
+class RollupBackfillTests(StockTestCase):
+    """backfill() rebuilds from the ledger the same rows that the writers kept up to date day by day."""
+
+    def on_day(self, day):
+        # timezone.localdate(), the ledger's created_at and the rollup tracker all read timezone.now().
+        return mock.patch("django.utils.timezone.now",
+                          return_value=timezone.make_aware(datetime.combine(day, time(12))))
+
+    def row(self, day):
+        # The day's row with its pending deltas added, as the report reads it.
+        (row,) = daily_rows(day, day)
+        return {field: row[field] for field in COUNTS}
+
+    def test_backfill_matches_incremental_rows_and_snapshots(self):
+        first = self.today - timedelta(days=3)
+        days = [first + timedelta(days=n) for n in range(4)]
+        kept, snapshots = {}, {}
+        for n, day in enumerate(days):
+            with self.on_day(day):
+                if n == 0:
+                    milk = self.receive("Amul Milk", 80, -2)
+                    curd = self.receive("Curd", 10, 0, price="25.50")
+                    self.receive("Curd", 6, 9, price="25.50")
+                elif n == 1:
+                    # Milk expires today, so it counts as expired from tomorrow, and drops under
+                    # the low-stock threshold; curd's sale empties and removes its first lot.
+                    adjust_sku(milk.sku, -40, StockMovement.Kind.SALE)
+                    adjust_sku(curd.sku, -12, StockMovement.Kind.SALE)
+                elif n == 2:
+                    bread = self.receive("Bread", 3, 1, price="35.00")
+                    update_sku(curd.sku, {"quantity": 9})
+                else:
+                    adjust_sku(bread.sku, -3, StockMovement.Kind.WRITE_OFF)
+                    adjust_sku(milk.sku, 5, StockMovement.Kind.RECEIPT)
+                kept[day] = self.row(day)
+                snapshots[day] = {field: getattr(snapshot([day])[0], field) for field in COUNTS}
+
+        with self.on_day(days[-1]):
+            self.assertEqual(backfill(first), len(days))
+        for day in days:
+            rebuilt = self.row(day)
+            self.assertEqual(rebuilt, kept[day], day)
+            self.assertEqual(rebuilt, snapshots[day], day)
+
+    def test_writers_append_deltas_that_fold_adds_into_the_row(self):
+        self.receive("Amul Milk", 80, 10)
+        milk = self.receive("Amul Milk", 20, 12)
+        adjust_sku(milk.sku, -30, StockMovement.Kind.SALE)
+        kept = self.row(self.today)
+        pending = InventoryRollupDelta.objects.count()
+        self.assertGreater(pending, 0)
+
+        self.assertEqual(fold(), pending)
+        self.assertFalse(InventoryRollupDelta.objects.exists())
+        self.assertEqual(self.row(self.today), kept)
+        self.assertEqual((kept["total_units"], kept["received_units"], kept["sold_units"]), (70, 100, 30))
+
+
+class ImportTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lot = self.receive("Curd", 5, 10, price="25.00")
+        self.expiry = self.lot.expiry_date.isoformat()
+
+    def run_import(self, rows, mode="add"):
+        return import_records([(line, row, None) for line, row in enumerate(rows, start=2)], mode, source="test")
+
+    def test_add_receives_into_the_lot_and_set_counts_it(self):
+        self.run_import([{"product_name": "curd", "quantity": "3", "expiry_date": self.expiry}])
+        self.assertEqual(self.quantities(self.lot.sku), [8])
+
+        report = self.run_import([{"product_name": "Curd", "quantity": "2", "expiry_date": self.expiry}], mode="set")
+        self.assertEqual((report["imported"], report["updated_lots"], report["created_lots"]), (1, 1, 0))
+        self.assertEqual(self.quantities(self.lot.sku), [2])
+        self.assertEqual(self.ledger(self.lot.sku)[-2:], [("RECEIPT", 3), ("ADJUSTMENT", -6)])
+
+    def test_new_sku_without_a_price_is_rejected(self):
+        report = self.run_import([
+            {"product_name": "Paneer", "quantity": "4", "expiry_date": self.expiry},
+            {"product_name": "Curd", "quantity": "1", "expiry_date": self.expiry},
+        ])
+
+        self.assertEqual((report["imported"], report["failed"]), (1, 1))
+        self.assertEqual(report["errors"], [{"line": 2, "errors": {"price": "A price is required for a new product."}}])
+        self.assertFalse(Sku.objects.filter(name="Paneer").exists())
+        self.assertEqual(self.quantities(self.lot.sku), [6])
+
+    @override_settings(BULK_IO={"CHUNK_ROWS": 2})
+    def test_chunk_is_rolled_back_when_a_lot_changed_underneath(self):
+        existing_lots = bulk_io._existing_lots
+
+        def stale(keys):
+            # As if the lot had held more stock when it was read than when the UPDATE ran.
+            return {key: (pk, name, quantity + 10) for key, (pk, name, quantity) in existing_lots(keys).items()}
+
+        with mock.patch.object(bulk_io, "_existing_lots", side_effect=stale):
+            report = self.run_import([
+                {"product_name": "Paneer", "price": "10", "quantity": "4", "expiry_date": self.expiry},
+                {"product_name": "Curd", "quantity": "1", "expiry_date": self.expiry},
+                {"product_name": "Bread", "price": "35", "quantity": "2", "expiry_date": self.expiry},
+            ], mode="set")
+
+        self.assertEqual((report["imported"], report["failed"]), (1, 2))
+        self.assertEqual([error["line"] for error in report["errors"]], [2, 3])
+        self.assertTrue(report["errors"][0]["errors"]["row"].startswith("Not saved:"))
+        self.assertFalse(Sku.objects.filter(name="Paneer").exists())
+        self.assertEqual(self.quantities(self.lot.sku), [5])
+        self.assertTrue(Sku.objects.filter(name="Bread").exists())
+
+    def test_ndjson_rejects_non_scalar_and_boolean_values(self):
+        lines = [
+            {"product_name": ["Curd"], "quantity": 1, "expiry_date": self.expiry},
+            {"product_name": "Curd", "quantity": True, "expiry_date": self.expiry},
+            {"product_name": "Curd", "price": {"amount": 25}, "expiry_date": self.expiry},
+            {"product_name": "Curd", "quantity": 2, "expiry_date": self.expiry},
+        ]
+        stream = io.BytesIO(b"".join(orjson.dumps(line) + b"\n" for line in lines))
+        report = import_stream(stream, "ndjson")
+
+        self.assertEqual((report["imported"], report["failed"]), (1, 3))
+        self.assertEqual([sorted(error["errors"]) for error in report["errors"]],
+                         [["product_name"], ["quantity"], ["price"]])
+        self.assertEqual(self.quantities(self.lot.sku), [7])
+
+    def test_todays_rollup_matches_a_snapshot_after_an_import(self):
+        self.run_import([
+            {"product_name": "Curd", "quantity": "3", "expiry_date": self.expiry},
+            {"product_name": "Curd", "price": "27.50", "quantity": "6", "expiry_date": "2020-01-01"},
+            {"product_name": "Paneer", "price": "10", "quantity": "40", "expiry_date": self.expiry},
+        ])
+        self.run_import([{"product_name": "Paneer", "quantity": "0", "expiry_date": self.expiry}], mode="set")
+
+        (row,) = daily_rows(self.today, self.today)
+        expected = snapshot([self.today])[0]
+        self.assertEqual({field: row[field] for field in COUNTS},
+                         {field: getattr(expected, field) for field in COUNTS})
+        self.assertEqual((row["received_units"], row["adjusted_units"], row["expired_lots"]), (54, -40, 1))
+
+
+@override_settings(RESPONSE_COMPRESSION={"ENABLED": True, "ENCODINGS": ("zstd", "gzip"), "MIN_BYTES": 100})
+class ResponseCompressionTests(SimpleTestCase):
+    body = b'{"product_name": "Amul Milk", "quantity": 5}\n' * 20
+
+    def respond(self, response, accept_encoding):
+        request = RequestFactory().get("/api/products/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return ResponseCompressionMiddleware(lambda request: response)(request)
+
+    def encoding(self, accept_encoding, response=None):
+        response = self.respond(response or HttpResponse(self.body, content_type="application/json"), accept_encoding)
+        return response.get("Content-Encoding")
+
+    def test_negotiates_by_q_value_and_server_order(self):
+        self.assertEqual(self.encoding("gzip, deflate, br, zstd"), "zstd")
+        self.assertEqual(self.encoding("zstd;q=0.5, gzip"), "gzip")
+        self.assertEqual(self.encoding("*"), "zstd")
+        self.assertEqual(self.encoding("*;q=0.2, gzip;q=0.5"), "gzip")
+        self.assertIsNone(self.encoding("br, deflate"))
+        self.assertIsNone(self.encoding(""))
+
+    def test_q_zero_refuses_a_coding(self):
+        self.assertEqual(self.encoding("zstd;q=0, gzip"), "gzip")
+        self.assertEqual(self.encoding("*, zstd;q=0"), "gzip")
+        self.assertIsNone(self.encoding("*;q=0"))
+        self.assertIsNone(self.encoding("gzip;q=0, zstd;q=0.0"))
+
+    def test_compresses_the_body_and_marks_it(self):
+        response = self.respond(HttpResponse(self.body, content_type="application/json", headers={"ETag": '"v1"'}),
+                                "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual((response["Vary"], response["ETag"]), ("Accept-Encoding", 'W/"v1"'))
+
+    def test_bodies_under_min_bytes_are_sent_as_they_are(self):
+        response = self.respond(HttpResponse(self.body[:99], content_type="application/json"), "zstd")
+        self.assertEqual(response.content, self.body[:99])
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(self.encoding("zstd", HttpResponse(self.body[:100], content_type="application/json")), "zstd")
+
+    def test_skips_compressed_types_and_partial_content(self):
+        for response in (HttpResponse(self.body, content_type="application/zstd"),
+                         HttpResponse(self.body, content_type="image/png"),
+                         HttpResponse(self.body, content_type="application/json", status=206),
+                         HttpResponse(self.body, content_type="application/json", headers={"Content-Encoding": "br"})):
+            with self.subTest(response=response):
+                response = self.respond(response, "zstd, gzip")
+                self.assertEqual(response.content, self.body)
+                self.assertNotIn(response.get("Content-Encoding"), ("zstd", "gzip"))
+
+    def test_streams_are_flushed_after_every_chunk(self):
+        produced = []
+
+        def events():
+            for n in range(3):
+                produced.append(n)
+                yield f"data: event {n}\n\n".encode()
+
+        decompressors = {
+            "gzip": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+            "zstd": lambda: zstandard.ZstdDecompressor().decompressobj(),
+        }
+        for encoding, decompressor in decompressors.items():
+            with self.subTest(encoding=encoding):
+                produced.clear()
+                response = self.respond(StreamingHttpResponse(events(), content_type="text/event-stream"), encoding)
+                self.assertEqual(response["Content-Encoding"], encoding)
+                chunks, decoder = iter(response.streaming_content), decompressor()
+                # Each event decodes in full from its own chunk, before the next one is produced.
+                for n in range(3):
+                    self.assertEqual(decoder.decompress(next(chunks)), f"data: event {n}\n\n".encode())
+                    self.assertEqual(produced, list(range(n + 1)))
+                decoder.decompress(b"".join(chunks))
@@ -0,0 +1,148 @@
+# inventory_api/timing.py
+"""
+Per-request stage timing.
+
+StageTimingMiddleware attaches a RequestTimings object to the current request
+context; code wraps interesting stages in `with span("llm"):` to record their
+duration and the number of ORM queries they issued. The breakdown is returned
+in a `Server-Timing` header and requests slower than
+REQUEST_TIMING["SLOW_REQUEST_MS"] are written as one JSON line to the
+`inventory_api.slow_requests` logger.
+
+Outside a request (management commands, workers) span() is a no-op, so the
+cost is one context-variable lookup.
+"""
+import contextvars
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+slow_request_logger = logging.getLogger("inventory_api.slow_requests")
+
+_current_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Accumulates stage durations and ORM query counts for one request."""
+    __slots__ = ("started", "stages", "queries", "db_seconds")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}  # name -> [seconds, queries], in first-seen order
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def add(self, name: str, seconds: float, queries: int = 0) -> None:
+        stage = self.stages.get(name)
+        if stage is None:
+            self.stages[name] = [seconds, queries]
+        else:
+            stage[0] += seconds
+            stage[1] += queries
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing_header(self, total: float) -> str:
+        parts = [
+            f'{name};dur={seconds * 1000:.1f};desc="{queries} queries"'
+            for name, (seconds, queries) in self.stages.items()
+        ]
+        parts.append(f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"')
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            "queries": self.queries,
+            "db_ms": round(self.db_seconds * 1000, 1),
+            "stages": {
+                name: {"ms": round(seconds * 1000, 1), "queries": queries}
+                for name, (seconds, queries) in self.stages.items()
+            },
+        }
+
+
+def current_timings():
+    return _current_timings.get()
+
+
+@contextmanager
+def span(name: str):
+    """Time a block as stage `name` of the current request (no-op outside one)."""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    queries_before = timings.queries
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started, timings.queries - queries_before)
+
+
+class _QueryCounter:
+    """connection.execute_wrapper hook counting queries and DB time."""
+    __slots__ = ("timings",)
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.timings.queries += 1
+            self.timings.db_seconds += time.perf_counter() - started
+
+
+class StageTimingMiddleware:
+    """
+    Records per-stage timings for every request, returns them in a
+    Server-Timing header and logs slow requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = getattr(settings, "REQUEST_TIMING", {})
+        self.enabled = config.get("ENABLED", True)
+        self.slow_seconds = config.get("SLOW_REQUEST_MS", 2000) / 1000.0
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                counter = _QueryCounter(timings)
+                for alias in settings.DATABASES:
+                    stack.enter_context(connections[alias].execute_wrapper(counter))
+                response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+
+        total = timings.elapsed()
+        response["Server-Timing"] = timings.server_timing_header(total)
+        if total >= self.slow_seconds:
+            self._log_slow(request, response, total, timings)
+        return response
+
+    def _log_slow(self, request, response, total, timings):
+        entry = {
+            "ts": timezone.now().isoformat(),
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            **timings.as_dict(),
+        }
+        slow_request_logger.warning(json.dumps(entry))
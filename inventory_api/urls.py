@@ -4,11 +4,23 @@ from .views import *
 urlpatterns = [
     
     # URLs for manual CRUD operations
+    path('warehouses/', WarehouseListCreateAPIView.as_view(), name='warehouse-list-create'),
+    path('warehouses/<slug:code>/', WarehouseDetailAPIView.as_view(), name='warehouse-detail'),
     path('products/', ProductListCreateAPIView.as_view(), name='product-list-create'),
+    path('products/import/', ProductImportAPIView.as_view(), name='product-import'),
+    path('products/export/', ProductExportAPIView.as_view(), name='product-export'),
+    path('products/search/', ProductSearchAPIView.as_view(), name='product-search'),
     path('products/<int:pk>/', ProductDetailAPIView.as_view(), name='product-detail'),
+    path('products/<int:pk>/adjust/', AdjustProductQuantityAPIView.as_view(), name='product-adjust'),
+    path('skus/', SkuListAPIView.as_view(), name='sku-list'),
+    path('skus/<int:pk>/adjust/', AdjustSkuQuantityAPIView.as_view(), name='sku-adjust'),
+    path('movements/', StockMovementListAPIView.as_view(), name='stock-movement-list'),
+    path('forecast/', ForecastAPIView.as_view(), name='forecast'),
+    path('reports/inventory/', InventoryReportAPIView.as_view(), name='inventory-report'),
 
     # URLs for the LLM-driven actions
     path('query/', ProposeActionAPIView.as_view(), name='propose-action'),
+    path('jobs/<uuid:pk>/', LLMJobDetailAPIView.as_view(), name='llm-job-detail'),
     path('execute-action/', ExecuteActionAPIView.as_view(), name='execute-action'),
     path('product/receive/', ReceiveProductDataView.as_view(), name='receive_product_data'),
     path('product/check-scanned/', CheckScannedProductView.as_view(), name='check-scanned-product'),
@@ -1,36 +1,360 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.parsers import JSONParser
 from django.shortcuts import render
-from .models import Product
-from .serializers import ProductSerializer
-from .mcp import get_llm_reasoning
-import json
-from django.http import JsonResponse
+from .models import LLMJob, Product, Sku, StockMovement, Warehouse
+from .serializers import (
+    LLMJobSerializer,
+    ProductSerializer,
+    SkuSerializer,
+    SkuUpdateSerializer,
+    StockAdjustmentSerializer,
+    StockMovementSerializer,
+    WarehouseSerializer,
+    product_rows,
+)
+from .search import resolve_sku_name, search_skus
+from .similarity import find_duplicates
+from .forecasting import at_risk, to_records as forecast_records
+from .rollups import PERIODS, fold, open_day, report
+from .bulk_io import CONTENT_TYPES, MODES, READ_ERRORS, CSVRenderer, export_chunks, import_stream
+from .stock import (
+    InsufficientStock, Movement, SkuChanged, VersionConflict, adjust_sku, apply_movements, deleting, sku_inventory,
+    update_sku,
+)
+from .mcp import get_llm_reasoning, stream_llm_reasoning
+from .fastjson import ORJSONParser, dumps
+from .prompts import build_query_prompt
+from .metrics import SCANNED_QUEUE_DEPTH, SCANNED_QUEUE_WAIT_SECONDS, render_latest
+from .timing import span
+from .scheduler import INTERACTIVE, SchedulerBusy, get_scheduler
+from .resilience import CircuitOpen, DeadlineExceeded, current_deadline, deadline_at
+from .commands import parse_command
+from .jobs import PENDING, JobQueueFull, enqueue, watch
+from .warehouses import current_warehouse, current_warehouse_id, forget_warehouses, use_warehouse
+from .streaming import (
+    NDJSON_CONTENT_TYPE,
+    SSE_CONTENT_TYPE,
+    EventStreamRenderer,
+    IncrementalJSONParser,
+    NDJSONRenderer,
+    format_event,
+    requested_stream_mode,
+)
+import time
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
 from queue import Queue
+from threading import Lock
 from rest_framework.permissions import AllowAny
+from rest_framework.settings import api_settings
  
  
 
-scanned_product_queue = Queue()
+# One review queue per warehouse (by id), so each site's dashboard only sees its own scans.
+# Items are (enqueued_at, product_data) tuples so the queue wait can be measured.
+scanned_product_queues = {}
+_scanned_queues_lock = Lock()
+
+# Minimum seconds between "progress" events on streamed proposals.
+STREAM_PROGRESS_INTERVAL = 0.25
+# Seconds between repeated status events while a followed async job waits.
+JOB_STREAM_KEEPALIVE = 15
 
 def index(request):
     return render(request, 'index.html')
 
+def metrics_view(request):
+    """Prometheus scrape endpoint."""
+    body, content_type = render_latest()
+    return HttpResponse(body, content_type=content_type)
+
+def scanned_product_queue(warehouse_id):
+    """The scan review queue of a warehouse, created on first use."""
+    queue = scanned_product_queues.get(warehouse_id)
+    if queue is None:
+        with _scanned_queues_lock:
+            queue = scanned_product_queues.setdefault(warehouse_id, Queue())
+    return queue
+
+class WarehouseListCreateAPIView(generics.ListCreateAPIView):
+    """The sites; send a code as X-Warehouse (or ?warehouse=) to work on one."""
+    queryset = Warehouse.objects.all()
+    serializer_class = WarehouseSerializer
+
+class WarehouseDetailAPIView(generics.RetrieveUpdateAPIView):
+    queryset = Warehouse.objects.all()
+    serializer_class = WarehouseSerializer
+    lookup_field = 'code'
+
+    def perform_update(self, serializer):
+        serializer.save()
+        forget_warehouses()
+
 class ProductListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Product.objects.all()
+    """The current warehouse's lots; new ones are received into it."""
     serializer_class = ProductSerializer
 
+    def get_queryset(self):
+        return Product.objects.filter(warehouse_id=current_warehouse_id())
+
+    def list(self, request, *args, **kwargs):
+        # Read-only, so skip ProductSerializer's per-row work; product_rows() gives the same output.
+        return Response(product_rows(self.filter_queryset(self.get_queryset())))
+
 class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    def get_queryset(self):
+        return Product.objects.filter(warehouse_id=current_warehouse_id())
+
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except (VersionConflict, InsufficientStock) as e:
+            return _stock_conflict(e)
+
+    def perform_destroy(self, instance):
+        with deleting("api"):
+            instance.delete()
+
+class SkuListAPIView(generics.ListAPIView):
+    serializer_class = SkuSerializer
+
+    def get_queryset(self):
+        return Sku.objects.filter(warehouse_id=current_warehouse_id(), lot_count__gt=0)
+
+class ProductSearchAPIView(APIView):
+    """
+    Ranked name search over SKUs that tolerates partial and misspelled names:
+    ?q=<text>&page=1&page_size=20. Each result is a SKU with a `score` in
+    [0, 1].
+    """
+    max_page_size = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), self.max_page_size)
+        except ValueError:
+            return Response({"error": "page and page_size must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        with span("search"):
+            count, matches = search_skus(query, limit=page_size, offset=(page - 1) * page_size)
+        results = [{**SkuSerializer(sku).data, "score": score} for sku, score in matches]
+        return Response({"query": query, "count": count, "page": page, "page_size": page_size, "results": results})
+
+def _stock_conflict(error):
+    body = {"error": str(error)}
+    if isinstance(error, VersionConflict):
+        body["version"] = error.current_version
+    return Response(body, status=status.HTTP_409_CONFLICT)
+
+class AdjustProductQuantityAPIView(APIView):
+    """
+    Changes one lot's quantity by `delta` with an atomic, conditional UPDATE
+    and records the movement. Pass `expected_version` to apply it only if the
+    lot has not changed since it was read.
+    """
+    parser_classes = [ORJSONParser]
+
+    def post(self, request, pk, *args, **kwargs):
+        serializer = StockAdjustmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        adjustment = serializer.validated_data
+        try:
+            lot = Product.objects.only('id', 'sku_id', 'product_name').get(pk=pk, warehouse_id=current_warehouse_id())
+            apply_movements(
+                [Movement(lot, adjustment['delta'], adjustment['kind'], adjustment.get('expected_version'))],
+                source="api", note=adjustment['note'],
+            )
+        except Product.DoesNotExist:
+            return Response({"error": f"Product with ID {pk} not found."}, status=status.HTTP_404_NOT_FOUND)
+        except (VersionConflict, InsufficientStock) as e:
+            return _stock_conflict(e)
+        return Response(ProductSerializer(Product.objects.get(pk=pk)).data, status=status.HTTP_200_OK)
+
+class AdjustSkuQuantityAPIView(APIView):
+    """
+    Changes a SKU's total quantity by `delta`: withdrawals (sales, write-offs)
+    come out of the first-expiring lots, additions go to the latest one.
+    """
+    parser_classes = [ORJSONParser]
+
+    def post(self, request, pk, *args, **kwargs):
+        serializer = StockAdjustmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        adjustment = serializer.validated_data
+        try:
+            sku = Sku.objects.get(pk=pk, warehouse_id=current_warehouse_id())
+            adjust_sku(sku, adjustment['delta'], adjustment['kind'], source="api", note=adjustment['note'])
+        except Sku.DoesNotExist:
+            return Response({"error": f"SKU with ID {pk} not found."}, status=status.HTTP_404_NOT_FOUND)
+        except InsufficientStock as e:
+            return _stock_conflict(e)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        sku.refresh_from_db()
+        return Response(SkuSerializer(sku).data, status=status.HTTP_200_OK)
+
+class StockMovementListAPIView(generics.ListAPIView):
+    """
+    The current warehouse's stock ledger (movements of its SKUs), newest
+    first; filter with ?sku=, ?lot=, ?kind= and ?since= (ISO date).
+    """
+    serializer_class = StockMovementSerializer
+    max_results = 1000
+
+    def get_queryset(self):
+        movements = StockMovement.objects.filter(
+            sku_id__in=Sku.objects.filter(warehouse_id=current_warehouse_id()).values('id'))
+        params = self.request.query_params
+        for param in ('sku', 'lot', 'kind'):
+            if params.get(param):
+                movements = movements.filter(**{param: params[param]})
+        if params.get('since'):
+            movements = movements.filter(created_at__date__gte=params['since'])
+        return movements[:self.max_results]
+
+class ForecastAPIView(APIView):
+    """
+    The current warehouse's SKUs at risk of waste or stock-out, highest
+    expected loss first (see forecasting.py):
+    ?horizon=<days>&window=<days>&model=ewma|mean&limit=50&min_loss=0.
+    """
+    max_limit = 1000
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            horizon = int(params['horizon']) if params.get('horizon') else None
+            window = int(params['window']) if params.get('window') else None
+            limit = min(max(int(params.get('limit', 50)), 1), self.max_limit)
+            min_loss = float(params.get('min_loss', 0))
+        except ValueError:
+            return Response({"error": "horizon, window, limit and min_loss must be numbers."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if (horizon is not None and horizon < 1) or (window is not None and window < 1):
+            return Response({"error": "horizon and window must be at least 1 day."}, status=status.HTTP_400_BAD_REQUEST)
+
+        today = date.today()
+        try:
+            with span("forecast"):
+                risky = at_risk(today, horizon, window, params.get('model') or None, min_loss,
+                                warehouse=current_warehouse())
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "as_of": today.isoformat(),
+            "horizon_days": horizon or settings.FORECAST["HORIZON_DAYS"],
+            "count": len(risky),
+            "results": forecast_records(risky.head(limit)),
+        })
+
+class InventoryReportAPIView(APIView):
+    """
+    Company-wide inventory levels and flows from the daily rollups (see
+    rollups.py), per day, week or month:
+    ?period=day|week|month&since=<date>&until=<date>, the last 30 days by
+    default. Reads one row per day, never the lot table.
+    """
+    default_days = 30
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        today = date.today()
+        try:
+            until = date.fromisoformat(params['until']) if params.get('until') else today
+            since = date.fromisoformat(params['since']) if params.get('since') else until - timedelta(days=self.default_days - 1)
+        except ValueError:
+            return Response({"error": "since and until must be dates (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+        period = params.get('period', 'day')
+        if period not in PERIODS:
+            return Response({"error": f"period must be one of {', '.join(PERIODS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        with span("report"):
+            # The first read of a day opens its row, so the series runs up to today, and
+            # each read folds in the writers' pending deltas.
+            open_day()
+            fold()
+            results = report(since, until, period)
+        return Response({
+            "period": period,
+            "since": since.isoformat(),
+            "until": until.isoformat(),
+            "results": results,
+        })
+
+class ProductImportAPIView(APIView):
+    """
+    Bulk import of stock lots into the current warehouse (see bulk_io.py).
+    The body is a CSV file or NDJSON (Content-Type text/csv or
+    application/x-ndjson), optionally compressed (Content-Encoding: zstd or
+    gzip), read as a stream and saved in chunks. ?mode=add books the rows as
+    received stock (the default); ?mode=set makes them the lots' counted
+    quantities. Returns a summary with the invalid rows by line number.
+    """
+    formats = {"text/csv": "csv", NDJSON_CONTENT_TYPE: "ndjson", "application/jsonl": "ndjson"}
+
+    def post(self, request, *args, **kwargs):
+        file_format = self.formats.get(request.content_type.split(';')[0].strip().lower())
+        if file_format is None:
+            return Response({"error": "Send text/csv or application/x-ndjson."},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        mode = request.query_params.get('mode', 'add')
+        if mode not in MODES:
+            return Response({"error": f"mode must be one of {', '.join(MODES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        compression = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower() or None
+        if compression == 'identity':
+            compression = None
+
+        # request.stream, not request.data: the body is never held in memory whole.
+        try:
+            with span("import"):
+                summary = import_stream(request.stream, file_format, mode, compression, source="import",
+                                        warehouse=current_warehouse())
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except READ_ERRORS as e:
+            # Corrupt compressed data; chunks before it are already saved.
+            return Response({"error": f"Could not read the file: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary)
+
+class ProductExportAPIView(APIView):
+    """
+    Streams the current warehouse's stock lots as CSV or NDJSON (see
+    bulk_io.py), chosen with the Accept header or ?format=csv|ndjson;
+    ?compress=zstd sends a .zst file. Memory stays flat however many lots
+    there are.
+    """
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.accepted_renderer.format
+        compression = request.query_params.get('compress') or None
+        if compression not in (None, 'zstd'):
+            return Response({"error": "compress must be zstd."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The queryset is bound to the warehouse now; the chunks are encoded after the view returns.
+        lots = Product.objects.filter(warehouse_id=current_warehouse_id())
+        response = StreamingHttpResponse(export_chunks(file_format, compression, lots),
+                                         content_type="application/zstd" if compression else CONTENT_TYPES[file_format])
+        suffix = ".zst" if compression else ""
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}{suffix}"'
+        return response
+
 class ProposeActionAPIView(APIView):
-    parser_classes = [JSONParser]
+    parser_classes = [ORJSONParser]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer, EventStreamRenderer]
 
 
     def _normalize_llm_response(self, llm_response):
@@ -129,243 +453,313 @@ class ProposeActionAPIView(APIView):
         if not user_query:
             return Response({"error": "Query not provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        products = Product.objects.all()
-        inventory_data = list(products.values('id', 'product_name', 'price', 'quantity', 'expiry_date'))
-        for item in inventory_data:
-            item['expiry_date'] = item['expiry_date'].isoformat()
-            item['price'] = float(item['price'])
-        inventory_json = json.dumps(inventory_data, indent=2)
-        
-        today = date.today()
-        today_date_str = today.isoformat()
-        
-        one_week_from_today = (today + timedelta(days=7)).isoformat()
-        inventory_json = json.dumps(inventory_data, separators=(',', ':'))
-        
-        # --- START PROMPT MODIFICATION ---
-        prompt = f"""
-            You are a highly-strict inventory management bot. Your ONLY task is to convert a user's request into a single, clean JSON object.
-
-            The current date is {today_date_str}.
-            
-            The current inventory data is: {inventory_json}
-
-            ---
-            CRITICAL RULES:
-            1.  You MUST respond with a single, valid JSON object.
-            2.  NEVER output any text, explanation, or conversational filler before or after the JSON.
-            3.  NEVER include comments (like `//`) or any code (like `new Date()`) inside the JSON.
-            4.  NEVER invent, assume, or hallucinate information that is not in the user's request.
-            5.  If information required for an `ADD` or `UPDATE` action is missing (e.g., quantity, price), you MUST use the `QUERY_RESPONSE` action to ask a clarifying question.
-            
-       
-            6.  DATE CALCULATION: If a relative date is given (e.g., "in 3 days", "in 2 weeks", "in 3 months"), YOU MUST convert it to a total number of days. Use **1 week = 7 days** and **1 month = 30 days**. Output this in a `relative_expiry` object using the "days" key.
-          
-            
-            7.  ABSOLUTE DATES: If a specific date is given (e.g., "Oct 5, 2025"), use the `expiry_date` field.
-            8.  NEVER use `expiry_date` and `relative_expiry` in the same response.
-            
-            ---
-            RESPONSE FORMATS (Use ONLY one of these five):  
-
-            1. For answering a question OR asking for clarification:
-            {{"action": "QUERY_RESPONSE",
-              "answer": "Your natural language answer or clarifying question."
-            }}
-
-            2. For creating a new product:
-            (Use "expiry_date" for specific dates, or "relative_expiry" for relative dates. NEVER use both.)
-            {{"action": "ADD",
-              "item_name": "Product Name",
-              "quantity": 1,
-              "price": 0.00,
-              "expiry_date": "YYYY-MM-DD"
-            }}
-            
-            3. For updating an existing product (Refer to inventory data for product_id):
-            {{"action": "UPDATE",
-              "product_id": 123,
-              "data": {{
-                "field_to_update": "new_value"
-              }}
-            }}
-
-            4. For deleting an existing product (Refer to inventory data for product_id):
-            {{"action": "DELETE",
-              "product_id": 123
-            }}
-            
-            5. For deleting ALL expired products at once:
-            {{"action": "BULK_DELETE_EXPIRED"}}
-
-            ---
-            EXAMPLES (Based on your training data):
-
-            User Query: "Add a new product: 50 units of Atta Bread at ₹360 each, expiring Oct 5, 2025."
-            Your JSON Response:
-            {{"action": "ADD",
-              "item_name": "Atta Bread",
-              "quantity": 50,
-              "price": 360,
-              "expiry_date": "2025-10-05"
-            }}
-            
-         
-            User Query: "add 5 loaves of sourdough bread at 8.99 each, expiring in 2 weeks"
-            Your JSON Response:
-            {{"action": "ADD",
-              "item_name": "sourdough bread",
-              "quantity": 5,
-              "price": 8.99,
-              "relative_expiry": {{"days": 14}}
-            }}
-         
-
-            User Query: "add 10 units of bubbly chocolate 50rs expiring in 3 months"
-            Your JSON Response:
-            {{"action": "ADD",
-              "item_name": "bubbly chocolate",
-              "quantity": 10,
-              "price": 50,
-              "relative_expiry": {{"days": 90}}
-            }}
-
-            User Query: "add brown bread price is 30rs, expiry is in 3 days"
-            Your JSON Response:
-            {{"action": "QUERY_RESPONSE",
-              "answer": "I can add 'brown bread' (at 30rs, expiring in 3 days), but what is the quantity?"
-            }}
-
-            User Query: "Change the price of the Desi Eggs to ₹420"
-            Your JSON Response:
-            {{"action": "UPDATE",
-              "product_id": 5,
-              "data": {{
-                "price": 420
-              }}
-            }}
-
-            User Query: "Please remove the sourdough bread from the system."
-            Your JSON Response:
-            {{"action": "DELETE",
-              "product_id": 3
-            }}
-
-            User Query: "Delete all expired items."
-            Your JSON Response:
-            {{"action": "BULK_DELETE_EXPIRED"}}
-            
-            User Query: "How many Kashmiri Apples are left in the inventory?"
-            Your JSON Response:
-            {{"action": "QUERY_RESPONSE",
-              "answer": "There are 140 units of Kashmiri Apples left in the inventory."
-            }}
-            
-            User Query: "Add new Lemon Dishwash Liquid, costs ₹320."
-            Your JSON Response:
-            {{"action": "QUERY_RESPONSE",
-              "answer": "I can add that product, but what is the quantity?"
-            }}
-            ---
-           _
-            Now, process the following user request. Follow the rules and output formats precisely.
-
-            The user's query is: "{user_query}"
-            """
-        # --- END PROMPT MODIFICATION ---
-
-        llm_response = get_llm_reasoning(prompt)
-        llm_response = self._normalize_llm_response(llm_response) # <-- Your existing line
-
+        warehouse = current_warehouse()
+        if request.query_params.get('async', '').lower() in ('1', 'true'):
+            # A run_llm_workers process builds the prompt and calls the model;
+            # the client follows /api/jobs/<id>/.
+            try:
+                job = enqueue(user_query, warehouse)
+            except JobQueueFull as e:
+                return self._busy_response(e.retry_after, str(e))
+            # Under the prefix the client used (/api/ or /api/v1/).
+            url = request.path.rsplit('query/', 1)[0] + f'jobs/{job.pk}/'
+            response = Response({**LLMJobSerializer(job).data, "url": url}, status=status.HTTP_202_ACCEPTED)
+            response['Location'] = url
+            return response
+
+        stream_mode = requested_stream_mode(request)
+        if stream_mode:
+            system_prompt, prompt, inventory_data = self._prompt(user_query, warehouse)
+            # Reject up front while a plain 429 is still possible.
+            try:
+                get_scheduler().check_admission(INTERACTIVE)
+            except SchedulerBusy as e:
+                return self._busy_response(e.retry_after, str(e))
+            response = StreamingHttpResponse(
+                self._stream_proposal(system_prompt, prompt, user_query, inventory_data,
+                                      current_deadline(), warehouse, sse=stream_mode == "sse"),
+                content_type=SSE_CONTENT_TYPE if stream_mode == "sse" else NDJSON_CONTENT_TYPE,
+            )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        return self.propose(user_query, warehouse)
+
+    def _prompt(self, user_query, warehouse, today=None):
+        """
+        Returns (system_prompt, prompt, inventory_data) for a query against
+        `warehouse`.
+        """
+        with span("inventory"):
+            # One row per SKU (total quantity, earliest expiry) of this warehouse only, not
+            # per stock lot: the prompt grows with one site's catalogue, not the company's.
+            inventory_data = sku_inventory(warehouse)
+
+            today = today or date.today()
+            inventory_json = dumps(inventory_data).decode()
+
+        with span("prompt"):
+            # Stable rules/examples go in the system prefix; only the date,
+            # inventory and query change between requests.
+            system_prompt, prompt = build_query_prompt(inventory_json, user_query, today)
+        return system_prompt, prompt, inventory_data
+
+    def propose(self, user_query, warehouse, today=None):
+        """
+        The proposal for `user_query` as a Response, after waiting for the
+        model. Also run by the job workers (jobs.py) for ?async=1 queries and
+        by evaluate_model, which pins the prompt's date with `today`.
+        """
+        system_prompt, prompt, inventory_data = self._prompt(user_query, warehouse, today)
+        try:
+            with span("llm"):
+                llm_response = get_llm_reasoning(prompt, caller="query", system=system_prompt)
+        except SchedulerBusy as e:
+            return self._busy_response(e.retry_after, str(e))
+        except CircuitOpen as e:
+            return self._degraded_proposal(user_query, inventory_data, str(e), e.retry_after,
+                                           status.HTTP_503_SERVICE_UNAVAILABLE)
+        except DeadlineExceeded as e:
+            return self._degraded_proposal(user_query, inventory_data, str(e), 1, status.HTTP_504_GATEWAY_TIMEOUT)
+        with span("normalize"):
+            llm_response = self._normalize_llm_response(llm_response) # <-- Your existing line
+
+        return self._build_proposal(llm_response)
+
+    def _stream_proposal(self, system_prompt, prompt, user_query, inventory_data, deadline, warehouse, sse=False):
+        """
+        Yields events while the model generates: "started", periodic
+        "progress", "action" as soon as the action type is known, and finally
+        "proposal" with the same body and status the non-streaming call returns.
+        The generator runs after the view returns, so the request deadline and
+        warehouse are passed in explicitly.
+        """
+        with deadline_at(deadline), use_warehouse(warehouse):
+            yield from self._stream_events(system_prompt, prompt, user_query, inventory_data, sse)
+
+    def _stream_events(self, system_prompt, prompt, user_query, inventory_data, sse):
+        parser = IncrementalJSONParser()
+        yield format_event("started", {}, sse)
+
+        llm_response = None
+        generated = 0
+        action_sent = False
+        last_progress = time.monotonic()
+        for event in stream_llm_reasoning(prompt, caller="query", system=system_prompt):
+            if event["type"] == "done":
+                llm_response = event["result"]
+                break
+            generated += len(event["text"])
+            parser.feed(event["text"])
+            if parser.action and not action_sent:
+                action_sent = True
+                action = parser.action.upper()
+                yield format_event("action", {"action": "CREATE" if action in ("ADD", "CREATE") else action}, sse)
+            now = time.monotonic()
+            if now - last_progress >= STREAM_PROGRESS_INTERVAL:
+                last_progress = now
+                yield format_event("progress", {"chars": generated}, sse)
+
+        if llm_response and llm_response.get("status") in (503, 504):
+            # Circuit open or deadline spent: same fallback as the non-streaming path.
+            response = self._degraded_proposal(user_query, inventory_data, llm_response["error"],
+                                               llm_response["retry_after"], llm_response["status"])
+        else:
+            response = self._build_proposal(self._normalize_llm_response(llm_response))
+        yield format_event("proposal", {"status": response.status_code, "proposal": response.data}, sse)
+
+    def _busy_response(self, retry_after, message, status_code=status.HTTP_429_TOO_MANY_REQUESTS):
+        response = Response({"error": message, "retry_after": retry_after}, status=status_code)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+    def _degraded_proposal(self, user_query, inventory_data, message, retry_after, status_code):
+        """
+        Used while the model is unavailable: simple commands are handled by the
+        deterministic parser, anything else fails fast with Retry-After.
+        """
+        config = getattr(settings, "LLM_RESILIENCE", {})
+        parsed = parse_command(user_query, inventory_data) if config.get("DEGRADE_TO_PARSER", True) else None
+        if parsed is None:
+            return self._busy_response(
+                retry_after,
+                f"{message} Only simple commands (add, sold, change price/quantity, delete, delete expired) "
+                "work until it recovers.",
+                status_code,
+            )
+        response = self._build_proposal(self._normalize_llm_response(parsed))
+        if isinstance(response.data, dict) and response.status_code < 400:
+            response.data["degraded"] = True
+        return response
+
+    def _build_proposal(self, llm_response):
+        """Turns a normalized model answer into the proposal the dashboard confirms."""
+        if llm_response and "retry_after" in llm_response:
+            return self._busy_response(llm_response["retry_after"], llm_response.get("error"),
+                                       llm_response.get("status", status.HTTP_429_TOO_MANY_REQUESTS))
         if not llm_response or "error" in llm_response:
             return Response(llm_response, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        try:
-            action = llm_response.get('action')
+        with span("lookup"):
+            try:
+                action = llm_response.get('action')
 
-            if not action:
-                return Response({"error": "Model did not propose a valid action."}, status=status.HTTP_400_BAD_REQUEST)
+                if not action:
+                    return Response({"error": "Model did not propose a valid action."}, status=status.HTTP_400_BAD_REQUEST)
 
-            if action == "CREATE":
-                product_data = llm_response.get('data', {})
+                if action == "CREATE":
+                    product_data = llm_response.get('data', {})
                 
-                # --- START NEW FIX 2 ---
-                name = product_data.get('product_name')
-                price = product_data.get('price')
-                quantity = product_data.get('quantity')
-                expiry = product_data.get('expiry_date') # This will be the CALCULATED date
-
-                missing = []
-                if not name: missing.append("product name")
-                if not price: missing.append("price")
-                if not quantity or quantity == 0: missing.append("quantity")
-                if not expiry: missing.append("expiry date") 
-
-                if missing:
-                    got_parts = []
-                    if name: got_parts.append(f"'{name}'")
-                    if price: got_parts.append(f"at ₹{price}")
-                    if quantity: got_parts.append(f"({quantity} units)")
-
-                    got_str = " ".join(got_parts) if got_parts else "the product"
-                    missing_str = " and ".join(missing)
+                    # --- START NEW FIX 2 ---
+                    name = product_data.get('product_name')
+                    price = product_data.get('price')
+                    quantity = product_data.get('quantity')
+                    expiry = product_data.get('expiry_date') # This will be the CALCULATED date
+
+                    missing = []
+                    if not name: missing.append("product name")
+                    if not price: missing.append("price")
+                    if not quantity or quantity == 0: missing.append("quantity")
+                    if not expiry: missing.append("expiry date") 
+
+                    if missing:
+                        got_parts = []
+                        if name: got_parts.append(f"'{name}'")
+                        if price: got_parts.append(f"at ₹{price}")
+                        if quantity: got_parts.append(f"({quantity} units)")
+
+                        got_str = " ".join(got_parts) if got_parts else "the product"
+                        missing_str = " and ".join(missing)
                     
-                    answer = f"I can add {got_str}, but I'm missing the {missing_str}. Could you please provide it?"
+                        answer = f"I can add {got_str}, but I'm missing the {missing_str}. Could you please provide it?"
                     
-                    if missing == ['expiry date']:
-                          answer = f"I can add {got_str}, but I need the exact expiry date. Please provide it in YYYY-MM-DD format."
+                        if missing == ['expiry date']:
+                              answer = f"I can add {got_str}, but I need the exact expiry date. Please provide it in YYYY-MM-DD format."
                     
-                    final_response = {
-                        "action": "QUERY_RESPONSE",
-                        "answer": answer
-                    }
-                    return Response(final_response, status=status.HTTP_200_OK)
-                # --- END NEW FIX 2 ---
-
-                llm_response['description'] = f"Create new product '{name}' (Quantity: {quantity}) with price ₹{price} and expiry date {expiry}."
+                        final_response = {
+                            "action": "QUERY_RESPONSE",
+                            "answer": answer
+                        }
+                        return Response(final_response, status=status.HTTP_200_OK)
+                    # --- END NEW FIX 2 ---
+
+                    llm_response['description'] = f"Create new product '{name}' (Quantity: {quantity}) with price ₹{price} and expiry date {expiry}."
             
-            elif action == "BULK_DELETE_EXPIRED":
-                expired_products = Product.objects.filter(expiry_date__lt=date.today())
-                product_count = expired_products.count()
+                elif action == "BULK_DELETE_EXPIRED":
+                    expired_products = Product.objects.filter(warehouse_id=current_warehouse_id(),
+                                                              expiry_date__lt=date.today())
+                    product_count = expired_products.count()
                 
-                if product_count == 0:
-                    llm_response = {
-                        "action": "QUERY_RESPONSE",
-                        "answer": "There are no expired products to delete."
-                    }
-                else:
-                    product_ids_to_delete = list(expired_products.values_list('id', flat=True))
-                    product_names = ", ".join([f"'{p.product_name}'" for p in expired_products])
-                    llm_response['description'] = f"Are you sure you want to permanently delete {product_count} expired product(s): {product_names}?"
-                    llm_response['data'] = {'ids_to_delete': product_ids_to_delete}
-
-            elif action in ["UPDATE", "DELETE"]:
-                product_id = llm_response.get('product_id')
-                if isinstance(product_id, list):
-                    if not product_id:
-                        return Response({"error": "Model identified multiple products but the list was empty."}, status=status.HTTP_400_BAD_REQUEST)
-                    product_id = product_id[0]
-                    llm_response['product_id'] = product_id
-
-                if product_id:
-                    product = Product.objects.get(id=product_id)
-                    llm_response['product_name'] = product.product_name
-                    if action == "DELETE":
-                        llm_response['description'] = f"Delete the product '{product.product_name}' (All {product.quantity} of them)."
-                    elif action == "UPDATE":
-                        update_data = llm_response.get('data', {})
-                        changes = ", ".join([f"set {field} to '{value}'" for field, value in update_data.items()])
-                        llm_response['description'] = f"Update the product '{product.product_name}': {changes}."
-        except Product.DoesNotExist:
-            return Response({"error": f"LLM suggested an action on a non-existent product ID: {product_id}"}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({"error": f"Error processing LLM response: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                    if product_count == 0:
+                        llm_response = {
+                            "action": "QUERY_RESPONSE",
+                            "answer": "There are no expired products to delete."
+                        }
+                    else:
+                        product_ids_to_delete = list(expired_products.values_list('id', flat=True))
+                        product_names = ", ".join([f"'{p.product_name}'" for p in expired_products])
+                        llm_response['description'] = f"Are you sure you want to permanently delete {product_count} expired product(s): {product_names}?"
+                        llm_response['data'] = {'ids_to_delete': product_ids_to_delete}
+
+                elif action in ["UPDATE", "DELETE"]:
+                    product_id = llm_response.get('product_id')
+                    if isinstance(product_id, list):
+                        if not product_id:
+                            return Response({"error": "Model identified multiple products but the list was empty."}, status=status.HTTP_400_BAD_REQUEST)
+                        product_id = product_id[0]
+                        llm_response['product_id'] = product_id
+
+                    if isinstance(product_id, str) and not product_id.strip().isdigit():
+                        llm_response.setdefault('product_name', product_id)
+                        product_id = None
+                    skus = Sku.objects.filter(warehouse_id=current_warehouse_id())
+                    if not product_id or not skus.filter(id=product_id).exists():
+                        # The model named the product instead of giving a (valid) id.
+                        name = llm_response.get('product_name') or llm_response.get('item_name') or llm_response.get('name')
+                        match = resolve_sku_name(name) if isinstance(name, str) else None
+                        if match is not None:
+                            product_id = llm_response['product_id'] = match.id
+
+                    if product_id:
+                        # The prompt lists SKUs, so the model's product_id is a SKU id.
+                        sku = skus.get(id=product_id)
+                        llm_response['sku_id'] = llm_response.pop('product_id')
+                        llm_response['product_name'] = sku.name
+                        if action == "DELETE":
+                            lots = f" in {sku.lot_count} lots" if sku.lot_count > 1 else ""
+                            llm_response['description'] = f"Delete the product '{sku.name}' (All {sku.total_quantity} of them{lots})."
+                        elif action == "UPDATE":
+                            update_data = llm_response.get('data', {})
+                            changes = ", ".join([
+                                f"change quantity by {value:+}" if field == 'quantity_delta' and isinstance(value, int)
+                                else f"set {field} to '{value}'"
+                                for field, value in update_data.items()
+                            ])
+                            llm_response['description'] = f"Update the product '{sku.name}': {changes}."
+                            # The dashboard's confirmation form posts every field back, so fill in
+                            # the current values of the ones the model did not change, and send
+                            # the stock values too: update_sku only applies a quantity or expiry
+                            # date that differs from them, and only while the SKU still has them.
+                            current = {'product_name': sku.name, 'price': str(sku.price)}
+                            expected = {}
+                            if 'quantity_delta' not in update_data:
+                                current['quantity'] = expected['expected_total_quantity'] = sku.total_quantity
+                            if sku.lot_count == 1:
+                                current['expiry_date'] = expected['expected_expiry_date'] = sku.earliest_expiry.isoformat()
+                            llm_response['data'] = {**current, **update_data, **expected}
+            except (Product.DoesNotExist, Sku.DoesNotExist):
+                return Response({"error": f"LLM suggested an action on a non-existent product ID: {product_id}"}, status=status.HTTP_404_NOT_FOUND)
+            except Exception as e:
+                return Response({"error": f"Error processing LLM response: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response(llm_response, status=status.HTTP_200_OK)
     
+class LLMJobDetailAPIView(APIView):
+    """
+    An /api/query/?async=1 job of the current warehouse. GET returns its
+    state, with the proposal once it has finished (poll while "status" is
+    QUEUED or RUNNING, no faster than Retry-After). With ?stream=sse or
+    ndjson (or the matching Accept) the response stays open instead and
+    sends "queued", "started" and finally "proposal", the same last event
+    a streamed /api/query/ sends.
+    """
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer, EventStreamRenderer]
+
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(LLMJob, pk=pk, warehouse_id=current_warehouse_id())
+        stream_mode = requested_stream_mode(request)
+        if stream_mode:
+            response = StreamingHttpResponse(self._follow(job, sse=stream_mode == "sse"),
+                                             content_type=SSE_CONTENT_TYPE if stream_mode == "sse"
+                                             else NDJSON_CONTENT_TYPE)
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        response = Response(LLMJobSerializer(job).data)
+        if job.status in PENDING:
+            response['Retry-After'] = '1'
+        return response
+
+    def _follow(self, job, sse):
+        """
+        Yields an event whenever the job's status changes, until it has
+        finished or the stream times out.
+        """
+        for job in watch(job, keepalive=JOB_STREAM_KEEPALIVE):
+            if job.status not in PENDING:
+                yield format_event("proposal", {"status": job.result_status, "proposal": job.result}, sse)
+                return
+            # Repeated now and then, so proxies do not close an idle stream.
+            event = "queued" if job.status == LLMJob.Status.QUEUED else "started"
+            yield format_event(event, {"id": str(job.pk)}, sse)
+        yield format_event("timeout", {"id": str(job.pk), "status": job.status}, sse)
+
+
 class ExecuteActionAPIView(APIView):
     # No changes needed in this class
-    parser_classes = [JSONParser]
+    parser_classes = [ORJSONParser]
     def post(self, request, *args, **kwargs):
         confirmed_action = request.data
         action = confirmed_action.get('action')
@@ -373,9 +767,11 @@ class ExecuteActionAPIView(APIView):
         data = confirmed_action.get('data', {})
         if not action:
             return Response({"error": "Invalid action object: 'action' is missing."}, status=status.HTTP_400_BAD_REQUEST)
+        if confirmed_action.get('sku_id') is not None and action in ("UPDATE", "DELETE"):
+            return self._execute_on_sku(action, confirmed_action['sku_id'], data)
         try:
             if action == "CREATE":
-                serializer = ProductSerializer(data=data)
+                serializer = ProductSerializer(data=data, context={'source': 'query'})
                 if serializer.is_valid():
                     product_name = serializer.validated_data.get('product_name')
                     serializer.save()
@@ -387,25 +783,31 @@ class ExecuteActionAPIView(APIView):
                 if not ids_to_delete:
                     return Response({"error": "No expired product IDs were provided for deletion."}, status=status.HTTP_400_BAD_REQUEST)
                 
-                deleted_count, _ = Product.objects.filter(id__in=ids_to_delete).delete()
+                with deleting("query"):
+                    deleted_count, _ = Product.objects.filter(warehouse_id=current_warehouse_id(),
+                                                              id__in=ids_to_delete).delete()
                 
                 return Response({"message": f"{deleted_count} expired product(s) deleted successfully."}, status=status.HTTP_200_OK)
             
             if product_id is None:
                 return Response({"error": "Invalid action object: 'product_id' is missing for UPDATE/DELETE."}, status=status.HTTP_400_BAD_REQUEST)
             
-            product_to_modify = Product.objects.get(id=product_id)
+            product_to_modify = Product.objects.get(id=product_id, warehouse_id=current_warehouse_id())
             
             if action == "UPDATE":
-                serializer = ProductSerializer(product_to_modify, data=data, partial=True)
+                serializer = ProductSerializer(product_to_modify, data=data, partial=True, context={'source': 'query'})
                 if serializer.is_valid():
-                    serializer.save()
+                    try:
+                        serializer.save()
+                    except (VersionConflict, InsufficientStock) as e:
+                        return _stock_conflict(e)
                     return Response({"message": f"Product '{product_to_modify.product_name}' updated successfully."}, status=status.HTTP_200_OK)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
             elif action == "DELETE":
                 product_name = product_to_modify.product_name
-                product_to_modify.delete()
+                with deleting("query"):
+                    product_to_modify.delete()
                 return Response({"message": f"Product '{product_name}' deleted successfully."}, status=status.HTTP_200_OK)
             
             else:
@@ -414,24 +816,60 @@ class ExecuteActionAPIView(APIView):
         except Product.DoesNotExist:
             return Response({"error": f"Product with ID {product_id} not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            return Response({"error": f"An error occurred: {str(e)}"}, status=fs.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _execute_on_sku(self, action, sku_id, data):
+        """
+        UPDATE/DELETE proposals from /api/query/ name a SKU and apply to all
+        of its lots.
+        """
+        try:
+            sku = Sku.objects.get(id=sku_id, warehouse_id=current_warehouse_id())
+        except Sku.DoesNotExist:
+            return Response({"error": f"Product with ID {sku_id} not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if action == "DELETE":
+            name = sku.name
+            with deleting("query"):
+                sku.delete()
+            return Response({"message": f"Product '{name}' deleted successfully."}, status=status.HTTP_200_OK)
+
+        # The confirmation form sends every field; blank ones were not edited.
+        serializer = SkuUpdateSerializer(data={k: v for k, v in data.items() if v not in ("", None)})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            update_sku(sku, serializer.validated_data, source="query")
+        except SkuChanged as e:
+            return _stock_conflict(e)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": f"Product '{sku.name}' updated successfully."}, status=status.HTTP_200_OK)
 
 # ... (ReceiveProductDataView and CheckScannedProductView remain unchanged) ...
 
 class ReceiveProductDataView(APIView):
     """
-    Receives product data (from the Telegram bot) and adds it to a
-    queue for human-in-the-loop (HITL) review.
+    Receives product data (from the Telegram bot) and adds it to the
+    warehouse's queue for human-in-the-loop (HITL) review.
     """
     permission_classes = [AllowAny]
-    parser_classes = [JSONParser]
+    parser_classes = [ORJSONParser]
 
     def post(self, request, *args, **kwargs):
         data = request.data
         
         if data.get('action') == 'CREATE' and isinstance(data.get('data'), dict):
             product_data = data['data']
-            scanned_product_queue.put(product_data)
+            warehouse = current_warehouse()
+            if settings.SCAN_DEDUP["ENABLED"] and product_data.get('product_name'):
+                # Look for the item in this site's catalogue now, so the reviewer is offered
+                # an UPDATE of the existing SKU instead of a near-duplicate product.
+                with span("dedup"):
+                    product_data['matches'] = find_duplicates([str(product_data['product_name'])],
+                                                              warehouse_id=warehouse.pk)[0]
+            scanned_product_queue(warehouse.pk).put((time.monotonic(), product_data))
+            SCANNED_QUEUE_DEPTH.labels(warehouse=warehouse.code).inc()
             return Response(
                 {"message": "Product data received and queued for review."}, 
                 status=status.HTTP_202_ACCEPTED
@@ -443,17 +881,50 @@ class ReceiveProductDataView(APIView):
         )
 
 
+def _suggest_update_of_match(create_proposal, match):
+    """
+    Turns a scanned product's CREATE proposal into an UPDATE that receives
+    the scanned quantity into the matching SKU, when the match is close
+    enough. The CREATE is kept under "create_instead" for the reviewer.
+    """
+    if match["score"] < settings.SCAN_DEDUP["SUGGEST_UPDATE_SCORE"]:
+        return None
+    sku = Sku.objects.filter(pk=match["sku_id"], warehouse_id=current_warehouse_id()).first()
+    if sku is None:
+        return None
+    product_data = create_proposal["data"]
+    quantity = product_data.get('quantity', 1)
+    data = {"product_name": sku.name, "price": str(sku.price), "quantity_delta": quantity}
+    if product_data.get('expiry_date'):
+        data["expiry_date"] = product_data['expiry_date']
+    return {
+        "action": "UPDATE",
+        "sku_id": sku.pk,
+        "data": data,
+        "matches": create_proposal["matches"],
+        "create_instead": {"action": "CREATE", "data": product_data},
+        "description": (
+            f"Scanned '{product_data.get('product_name')}' looks like existing '{sku.name}' "
+            f"({round(match['score'] * 100)}% match). Add {quantity} to it?"
+        ),
+    }
+
+
 class CheckScannedProductView(APIView):
     """
     Allows the frontend dashboard to poll for the next item
-    in the scanned product queue.
+    in the warehouse's scanned product queue.
     """
     def get(self, request, *args, **kwargs):
-        if scanned_product_queue.empty():
+        warehouse = current_warehouse()
+        queue = scanned_product_queue(warehouse.pk)
+        if queue.empty():
             return Response(status=status.HTTP_204_NO_CONTENT)
         
         try:
-            product_data = scanned_product_queue.get()
+            enqueued_at, product_data = queue.get()
+            SCANNED_QUEUE_DEPTH.labels(warehouse=warehouse.code).dec()
+            SCANNED_QUEUE_WAIT_SECONDS.labels(warehouse=warehouse.code).observe(time.monotonic() - enqueued_at)
             
             name = product_data.get('product_name', 'N/A')
             price = product_data.get('price', 'N/A')
@@ -464,12 +935,16 @@ class CheckScannedProductView(APIView):
 
             product_data['quantity'] = quantity
             product_data['price'] = product_data.get('price') or 0.00
+            matches = product_data.pop('matches', [])
             
             proposal = {
                 "action": "CREATE",
                 "data": product_data,
                 "description": description
             }
+            if matches:
+                proposal["matches"] = matches
+                proposal = _suggest_update_of_match(proposal, matches[0]) or proposal
             
             return Response(proposal, status=status.HTTP_200_OK)
             
@@ -0,0 +1,131 @@
+# inventory_api/warehouses.py
+"""
+The warehouse (site) a request works on.
+
+Every SKU and stock lot belongs to one warehouse. WarehouseMiddleware reads
+the X-Warehouse header, or ?warehouse=<code>, and makes that warehouse
+current for the request. Product and SKU lists, search, the query prompt's
+inventory, the scan queue and the forecast then only read that site's rows,
+through the (warehouse, ...) composite indexes. Their cost follows one
+site's inventory, not the company's. Requests that name no warehouse get
+the default one (WAREHOUSES["DEFAULT"]), so single-site setups and existing
+clients work unchanged. An unknown code is answered with 404 before any
+view runs.
+
+Outside a request (management commands, workers) the default warehouse is
+current; `with use_warehouse(warehouse):` switches to another one. New SKUs
+and lots are filed under the current warehouse unless given one.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import JsonResponse
+
+HEADER = "X-Warehouse"
+QUERY_PARAM = "warehouse"
+
+_current_warehouse = contextvars.ContextVar("warehouse", default=None)
+# code -> Warehouse, per process. Warehouses are few and rarely change.
+_by_code = {}
+_by_code_lock = threading.Lock()
+
+
+def _config():
+    config = dict(getattr(settings, "WAREHOUSES", {}))
+    config.setdefault("DEFAULT", "main")
+    config.setdefault("DEFAULT_NAME", "Main warehouse")
+    return config
+
+
+def get_warehouse(code):
+    """The warehouse with this code; raises Warehouse.DoesNotExist."""
+    from .models import Warehouse
+
+    warehouse = _by_code.get(code)
+    if warehouse is None:
+        warehouse = Warehouse.objects.get(code=code)
+        with _by_code_lock:
+            _by_code[code] = warehouse
+    return warehouse
+
+
+def default_warehouse():
+    """The default warehouse, created on first use."""
+    from .models import Warehouse
+
+    config = _config()
+    warehouse = _by_code.get(config["DEFAULT"])
+    if warehouse is None:
+        warehouse, _ = Warehouse.objects.get_or_create(code=config["DEFAULT"],
+                                                       defaults={"name": config["DEFAULT_NAME"]})
+        with _by_code_lock:
+            _by_code[warehouse.code] = warehouse
+    return warehouse
+
+
+def warehouse_option(code, create=False):
+    """
+    The warehouse a management command's --warehouse names (the default one
+    for None). Unknown codes raise CommandError, or with `create` make a
+    warehouse of that code.
+    """
+    from django.core.management.base import CommandError
+
+    from .models import Warehouse
+
+    if not code:
+        return default_warehouse()
+    if create:
+        warehouse, _ = Warehouse.objects.get_or_create(code=code, defaults={"name": code})
+        return warehouse
+    try:
+        return get_warehouse(code)
+    except Warehouse.DoesNotExist:
+        raise CommandError(f"Unknown warehouse '{code}'.")
+
+
+def forget_warehouses():
+    """Drops the cached warehouses (after they are renamed or deleted)."""
+    with _by_code_lock:
+        _by_code.clear()
+
+
+def current_warehouse():
+    return _current_warehouse.get() or default_warehouse()
+
+
+def current_warehouse_id():
+    """The current warehouse's id; the default for Sku.warehouse and Product.warehouse."""
+    return current_warehouse().pk
+
+
+@contextmanager
+def use_warehouse(warehouse):
+    """Makes `warehouse` current for the block (in this thread or task only)."""
+    token = _current_warehouse.set(warehouse)
+    try:
+        yield warehouse
+    finally:
+        _current_warehouse.reset(token)
+
+
+class WarehouseMiddleware:
+    """Makes the warehouse named by the request current while it is handled."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .models import Warehouse
+
+        code = (request.headers.get(HEADER) or request.GET.get(QUERY_PARAM) or "").strip()
+        if not code:
+            return self.get_response(request)
+        try:
+            warehouse = get_warehouse(code)
+        except Warehouse.DoesNotExist:
+            return JsonResponse({"error": f"Unknown warehouse '{code}'."}, status=404)
+        with use_warehouse(warehouse):
+            return self.get_response(request)
@@ -9,10 +9,15 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import json
 import os
+import tempfile
 from pathlib import Path
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
+from .database import database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
  
 
@@ -41,6 +46,209 @@ GMAIL_CONFIG = {
     "CHECK_INTERVAL": int(os.getenv("ALERT_CHECK_INTERVAL", "600")),
 }
 
+# Local LLM (Ollama) used by the query view and reason_inventory.
+# Point OLLAMA_URL at `manage.py run_llm_stubs` to load-test without a GPU.
+OLLAMA_CONFIG = {
+    "URL": os.getenv("OLLAMA_URL", "http://localhost:11434"),
+    "MODEL": os.getenv("OLLAMA_MODEL", "phi3-finetuned-inventoryV2"),
+    "TIMEOUT": float(os.getenv("OLLAMA_TIMEOUT", "180")),
+    # How long Ollama keeps the model (and its prompt cache) loaded after a call.
+    "KEEP_ALIVE": os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    # "system": send the stable rules/examples as Ollama's `system` field.
+    # "prefix": prepend them to the prompt instead (if the Modelfile's SYSTEM must be kept).
+    "PROMPT_PREFIX_MODE": os.getenv("OLLAMA_PROMPT_PREFIX_MODE", "system"),
+}
+
+# Model servers shared by mcp.py. Either a JSON list in LLM_BACKENDS, e.g.
+#   [{"KIND": "ollama", "URL": "http://gpu1:11434"},
+#    {"KIND": "openai", "URL": "http://gpu2:1234", "MODEL": "phi3"}]
+# ("openai" covers LM Studio and other /v1/chat/completions servers), or a
+# comma-separated list of Ollama URLs in OLLAMA_URLS. Defaults to OLLAMA_URL.
+# Unset keys fall back to OLLAMA_CONFIG.
+if os.getenv("LLM_BACKENDS"):
+    LLM_BACKENDS = json.loads(os.getenv("LLM_BACKENDS"))
+else:
+    LLM_BACKENDS = [
+        {"KIND": "ollama", "URL": url.strip()}
+        for url in os.getenv("OLLAMA_URLS", OLLAMA_CONFIG["URL"]).split(",")
+        if url.strip()
+    ]
+
+LLM_POOL = {
+    # Consecutive failed calls before a backend is taken out of rotation.
+    "MAX_FAILURES": int(os.getenv("LLM_POOL_MAX_FAILURES", "3")),
+    # How long an ejected backend stays out unless a health check passes first.
+    "EJECT_SECONDS": float(os.getenv("LLM_POOL_EJECT_SECONDS", "30")),
+    # Seconds between active health checks (0 disables them).
+    "HEALTH_CHECK_INTERVAL": float(os.getenv("LLM_POOL_HEALTH_CHECK_INTERVAL", "10")),
+    "HEALTH_CHECK_TIMEOUT": float(os.getenv("LLM_POOL_HEALTH_CHECK_TIMEOUT", "2")),
+}
+
+# Admission control for model calls (inventory_api/scheduler.py), per worker
+# process. Calls beyond MAX_CONCURRENCY queue by priority: callers listed in
+# INTERACTIVE_CALLERS go before batch jobs such as reason_inventory. A full
+# queue or a wait past the timeout answers 429 with Retry-After.
+LLM_SCHEDULER = {
+    "MAX_CONCURRENCY": int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    "INTERACTIVE_CALLERS": ("query",),
+    "MAX_QUEUE": int(os.getenv("LLM_MAX_QUEUE", "16")),
+    "QUEUE_TIMEOUT": float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+    "MAX_BATCH_QUEUE": int(os.getenv("LLM_MAX_BATCH_QUEUE", "64")),
+    "BATCH_QUEUE_TIMEOUT": float(os.getenv("LLM_BATCH_QUEUE_TIMEOUT", "600")),
+}
+
+# Deadlines and the circuit breaker for the model (inventory_api/resilience.py).
+# A client can send its remaining budget as X-Request-Timeout-Ms; otherwise
+# DEFAULT_DEADLINE applies. The breaker opens after FAILURE_THRESHOLD
+# consecutive failed or slow calls; while open, /api/query/ answers simple
+# commands with a deterministic parser (DEGRADE_TO_PARSER) or fails fast.
+LLM_RESILIENCE = {
+    "DEFAULT_DEADLINE": float(os.getenv("LLM_DEFAULT_DEADLINE", OLLAMA_CONFIG["TIMEOUT"])),
+    "MAX_DEADLINE": float(os.getenv("LLM_MAX_DEADLINE", OLLAMA_CONFIG["TIMEOUT"])),
+    "FAILURE_THRESHOLD": int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    "SLOW_CALL_SECONDS": float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "60")),
+    "OPEN_SECONDS": float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30")),
+    "HALF_OPEN_PROBES": int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1")),
+    "DEGRADE_TO_PARSER": os.getenv("LLM_DEGRADE_TO_PARSER", "True") == "True",
+}
+
+# Async proposals (/api/query/?async=1, inventory_api/jobs.py), answered by
+# `manage.py run_llm_workers` processes that share the LLMJob table.
+LLM_JOBS = {
+    # Jobs each worker process runs at once (one thread each).
+    "WORKERS": int(os.getenv("LLM_JOB_WORKERS", "4")),
+    # How often an idle worker looks for new jobs, in seconds.
+    "POLL_INTERVAL": float(os.getenv("LLM_JOB_POLL_INTERVAL", "0.5")),
+    # Time budget of one attempt; a worker that holds a job longer is presumed dead.
+    "TIMEOUT": float(os.getenv("LLM_JOB_TIMEOUT", OLLAMA_CONFIG["TIMEOUT"])),
+    "MAX_ATTEMPTS": int(os.getenv("LLM_JOB_MAX_ATTEMPTS", "3")),
+    # Queued jobs beyond this answer 429.
+    "MAX_QUEUED": int(os.getenv("LLM_JOB_MAX_QUEUED", "1000")),
+    # Longest a ?stream= follower of /api/jobs/<id>/ stays connected.
+    "STREAM_SECONDS": float(os.getenv("LLM_JOB_STREAM_SECONDS", "300")),
+    # Finished jobs are deleted after this many hours.
+    "RETENTION_HOURS": float(os.getenv("LLM_JOB_RETENTION_HOURS", "24")),
+}
+
+# Coalesce identical LLM calls that are in flight at the same time (see
+# inventory_api/coalesce.py). DIR holds the lock/result files shared by
+# worker processes; it must be on a local filesystem all workers can reach.
+LLM_COALESCE = {
+    "ENABLED": os.getenv("LLM_COALESCE_ENABLED", "True") == "True",
+    "DIR": os.getenv("LLM_COALESCE_DIR", os.path.join(tempfile.gettempdir(), "warevision_llm_coalesce")),
+    # Longest a worker waits for another worker's identical call.
+    "WAIT_TIMEOUT": OLLAMA_CONFIG["TIMEOUT"],
+}
+
+# Record or replay model calls (inventory_api/cassettes.py): MODE "record"
+# writes every call to PATH, "replay" answers from it without a model server.
+# `manage.py evaluate_model --cassette` sets its own; leave "off" in production.
+LLM_CASSETTE = {
+    "MODE": os.getenv("LLM_CASSETTE_MODE", "off"),
+    "PATH": os.getenv("LLM_CASSETTE_PATH", ""),
+}
+
+# Near-duplicate detection for scanned products (inventory_api/similarity.py).
+SCAN_DEDUP = {
+    "ENABLED": os.getenv("SCAN_DEDUP_ENABLED", "True") == "True",
+    "TOP_K": int(os.getenv("SCAN_DEDUP_TOP_K", "3")),
+    "MIN_SCORE": float(os.getenv("SCAN_DEDUP_MIN_SCORE", "0.5")),
+    # A scan matching an existing SKU at least this closely is proposed as an UPDATE of it.
+    "SUGGEST_UPDATE_SCORE": float(os.getenv("SCAN_DEDUP_SUGGEST_UPDATE_SCORE", "0.8")),
+    "REBUILD_SECONDS": int(os.getenv("SCAN_DEDUP_REBUILD_SECONDS", "600")),
+}
+
+# Waste and stock-out forecasts (inventory_api/forecasting.py, /api/forecast/).
+FORECAST = {
+    # "ewma" weights recent consumption more (half-life below); "mean" weights every day alike.
+    "MODEL": os.getenv("FORECAST_MODEL", "ewma"),
+    "WINDOW_DAYS": int(os.getenv("FORECAST_WINDOW_DAYS", "28")),
+    "HALF_LIFE_DAYS": float(os.getenv("FORECAST_HALF_LIFE_DAYS", "7")),
+    "HORIZON_DAYS": int(os.getenv("FORECAST_HORIZON_DAYS", "30")),
+}
+
+# Daily inventory rollups (inventory_api/rollups.py, /api/reports/inventory/).
+ROLLUPS = {
+    # SKUs with fewer units count as low on stock (sendInventoryAlerts' default threshold).
+    "LOW_STOCK_QUANTITY": int(os.getenv("ALERT_MIN_QUANTITY", "50")),
+}
+
+# Bulk CSV/NDJSON import and export (inventory_api/bulk_io.py).
+BULK_IO = {
+    # Rows validated and saved per transaction (and encoded per export chunk); bounds memory.
+    "CHUNK_ROWS": int(os.getenv("BULK_IO_CHUNK_ROWS", "2000")),
+    # Invalid rows listed in an import's report; the rest are only counted.
+    "MAX_REPORTED_ERRORS": int(os.getenv("BULK_IO_MAX_REPORTED_ERRORS", "1000")),
+    "ZSTD_LEVEL": int(os.getenv("BULK_IO_ZSTD_LEVEL", "3")),
+}
+
+# Sites (inventory_api/warehouses.py). Requests pick one with the X-Warehouse header or ?warehouse=<code>.
+WAREHOUSES = {
+    # Warehouse used when a request or command names none; created on first use.
+    "DEFAULT": os.getenv("DEFAULT_WAREHOUSE", "main"),
+    "DEFAULT_NAME": os.getenv("DEFAULT_WAREHOUSE_NAME", "Main warehouse"),
+    # sendInventoryAlerts builds and sends this many sites' reports at once.
+    "ALERT_WORKERS": int(os.getenv("WAREHOUSE_ALERT_WORKERS", "4")),
+}
+
+# Expiry markdowns (inventory_api/markdown.py, `manage.py reason_inventory`).
+MARKDOWN = {
+    # "days:percent" pairs: lots expiring within `days` days get `percent` off.
+    "TIERS": tuple(
+        tuple(int(part) for part in tier.split(":"))
+        for tier in os.getenv("MARKDOWN_TIERS", "1:50,3:30,7:15").split(",")
+    ),
+    # Lots holding more units than this get the next deeper tier.
+    "DEEP_STOCK_QUANTITY": int(os.getenv("MARKDOWN_DEEP_STOCK_QUANTITY", "50")),
+}
+
+# Compression of API and dashboard responses (inventory_api/compression.py):
+# the first of ENCODINGS the client accepts, for bodies of MIN_BYTES or more
+# and for every streamed response.
+RESPONSE_COMPRESSION = {
+    "ENABLED": os.getenv("RESPONSE_COMPRESSION_ENABLED", "True") == "True",
+    "ENCODINGS": [e.strip() for e in os.getenv("RESPONSE_COMPRESSION_ENCODINGS", "zstd,gzip").split(",") if e.strip()],
+    "MIN_BYTES": int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024")),
+    "ZSTD_LEVEL": int(os.getenv("RESPONSE_ZSTD_LEVEL", "3")),
+    "GZIP_LEVEL": int(os.getenv("RESPONSE_GZIP_LEVEL", "6")),
+}
+
+# Per-request stage timings (Server-Timing header) and the slow-request log.
+REQUEST_TIMING = {
+    "ENABLED": os.getenv("REQUEST_TIMING_ENABLED", "True") == "True",
+    "SLOW_REQUEST_MS": float(os.getenv("SLOW_REQUEST_MS", "2000")),
+}
+SLOW_REQUEST_LOG = os.getenv("SLOW_REQUEST_LOG", str(BASE_DIR / "logs" / "slow_requests.log"))
+os.makedirs(os.path.dirname(SLOW_REQUEST_LOG), exist_ok=True)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json_line": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "slow_requests": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": SLOW_REQUEST_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "formatter": "json_line",
+            "delay": True,
+        },
+    },
+    "loggers": {
+        "inventory_api.slow_requests": {
+            "handlers": ["slow_requests"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+    },
+}
+
+# /metrics: for multi-process deployments export PROMETHEUS_MULTIPROC_DIR (a shared,
+# empty directory) before starting the workers and the cron job.
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -72,6 +280,10 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'inventory_api.timing.StageTimingMiddleware',
+    'inventory_api.resilience.DeadlineMiddleware',
+    # Before anything that reads or writes the body; after timing, so Server-Timing covers it.
+    'inventory_api.compression.ResponseCompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -80,6 +292,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'inventory_api.warehouses.WarehouseMiddleware',
 ]
 
 ROOT_URLCONF = 'ventura_project.urls'
@@ -102,14 +315,27 @@ TEMPLATES = [
 WSGI_APPLICATION = 'ventura_project.wsgi.application'
 
 
+# API JSON goes through orjson (inventory_api/fastjson.py); the browsable API stays.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'inventory_api.fastjson.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'inventory_api.fastjson.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Storage profile from DB_PROFILE (sqlite, sqlite-basic or postgres); see
+# ventura_project/database.py for the pragmas, pooling and related env vars.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_settings(BASE_DIR),
 }
 
 
@@ -153,4 +379,6 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+# Cross-origin clients pick a site with X-Warehouse (inventory_api/warehouses.py).
+CORS_ALLOW_HEADERS = (*default_headers, "x-warehouse")
\ No newline at end of file
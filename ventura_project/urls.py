@@ -6,5 +6,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('inventory_api.urls')), 
     path('', index, name='index'),
+    path('metrics', metrics_view, name='metrics'),
     path('api/v1/', include('inventory_api.urls')),
 ]
\ No newline at end of file